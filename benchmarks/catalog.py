@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# coding=utf-8
+"""Measures the latency of "dafter search", "list" and "info" on a large
+catalog of synthetic dataset configs.
+
+Usage:
+    python benchmarks/catalog.py [--configs 10000] [--runs 10] [--json]
+
+The configs are generated in a temporary folder, given to dafter with the
+DAFTER_CONFIGS_FOLDER environment variable, and HOME points to another
+temporary folder so that the catalog index is built from scratch. The first
+"list" builds the index, its time is reported apart from the medians of the
+commands run on the built index.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+
+from startup import time_command
+
+
+DEFAULT_COMMANDS = ["list", "search dataset-42", "search --tags image text",
+                    "search digits --fuzzy", "info dataset-42"]
+TAGS = ["image", "text", "audio", "video", "tabular", "nlp", "vision",
+        "deep-learning", "twitter", "sentiment", "medical", "finance", "geo",
+        "time-series", "graph", "speech"]
+WORDS = ["digits", "handwritten", "images", "reviews", "tweets", "crimes",
+         "prices", "sensors", "genomes", "recordings", "articles", "movies",
+         "traffic", "weather", "faces", "objects", "sentences", "stocks"]
+
+
+def write_configs(folder, n, seed=0):
+    """Writes `n` synthetic configs in `folder`"""
+    rng = random.Random(seed)
+    for i in range(n):
+        name = "dataset-{}".format(i)
+        config = {
+            "name": name,
+            "urls": [{"url": "https://example.com/{}/part-{}.csv".format(
+                name, j), "bytes": rng.randint(1, 10 ** 9)}
+                for j in range(rng.randint(1, 5))],
+            "type": "csv",
+            "tags": rng.sample(TAGS, rng.randint(1, 4)),
+            "description": " ".join(rng.choice(WORDS)
+                                    for _ in range(rng.randint(5, 40))),
+            "source": "https://example.com/{}".format(name),
+        }
+        with open(os.path.join(folder, "{}.json".format(name)), "w") as f:
+            json.dump(config, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("commands", nargs="*", default=DEFAULT_COMMANDS)
+    parser.add_argument("--configs", type=int, default=10000,
+                        help="number of synthetic configs")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", action="store_true",
+                        help="prints machine-readable results")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="dafter-benchmark-")
+    configs_folder = os.path.join(folder, "configs")
+    home = os.path.join(folder, "home")
+    os.makedirs(configs_folder)
+    os.makedirs(home)
+    write_configs(configs_folder, args.configs)
+
+    env = dict(os.environ, HOME=home, DAFTER_CONFIGS_FOLDER=configs_folder)
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+        "settings": {"configs": args.configs, "runs": args.runs},
+        "commands": {},
+    }
+    try:
+        build = time_command("list", 1, env)
+        results["build"] = None if build is None else build[0]
+        for command in args.commands:
+            times = time_command(command, args.runs, env)
+            # None for the commands that failed
+            results["commands"][command] = None if times is None else \
+                statistics.median(times)
+    finally:
+        shutil.rmtree(folder)
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        timings = [("(index build)", results["build"])] + \
+            list(results["commands"].items())
+        for command, median in timings:
+            if median is None:
+                print("{:<28} {:>9}  FAILED".format(command, "-"))
+            else:
+                print("{:<28} {:>8.3f}s".format(command, median))
+
+    if results["build"] is None or \
+            any(m is None for m in results["commands"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
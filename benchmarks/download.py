@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# coding=utf-8
+"""Measures the throughput of the downloads against a local fixture server.
+
+Usage:
+    python benchmarks/download.py [--size 256M] [--files 4] [--latency 0.02]
+        [--bandwidth 100M] [--no-ranges] [--runs 3] [--json]
+
+The files are served by benchmarks/fixture_server.py, in another process so
+that the CPU time measured is the one of the client. Each scenario downloads
+the files into a new folder with `Dataset.download`; the median of the runs is
+reported, with the CPU seconds spent per GB downloaded. The "resume" scenario
+downloads a file of which 90% is already on the disk, and reports the time
+spent in addition to the transfer of the remaining 10%.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+from dafter.fetcher.dataset import Dataset
+from dafter.fetcher.utils import parse_size
+from fixture_server import get_content
+
+
+FIXTURE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "fixture_server.py")
+GB = 1024 ** 3
+
+# name: (number of files, download arguments)
+SCENARIOS = {
+    "sequential": (None, {"jobs": 1}),
+    "jobs": (None, {"jobs": 4}),
+    "segments": (1, {"segments": 4}),
+    "readinto": (None, {"jobs": 4, "use_readinto": True}),
+    "resume": (1, {}),
+}
+
+
+def start_server(latency, bandwidth, ranges):
+    """Starts the fixture server in another process.
+
+    Returns:
+        (process, url) (tuple): The process of the server, and its url.
+    """
+    command = [sys.executable, FIXTURE_SERVER, "--latency", str(latency)]
+    if bandwidth:
+        command += ["--bandwidth", str(bandwidth)]
+    if not ranges:
+        command.append("--no-ranges")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    url = process.stdout.readline().decode().strip()
+    return process, url
+
+
+def run_scenario(name, url, size, files, runs, folder):
+    """Downloads the files of a scenario `runs` times.
+
+    Returns:
+        result (dict): The median "seconds", "bytes", "mb_per_s" and
+            "cpu_s_per_gb" of the runs.
+    """
+    n_files, kwargs = SCENARIOS[name]
+    n_files = n_files or files
+    urls = [{"url": "{}/{}-{}.bin?size={}".format(url, name, i, size),
+             "bytes": size} for i in range(n_files)]
+
+    times, cpus = [], []
+    downloaded = size * n_files
+    for run in range(runs):
+        save_path = os.path.join(folder, "{}-{}".format(name, run))
+        dataset = Dataset(name, urls, save_path)
+        if name == "resume":
+            # 90% of the file downloaded by an interrupted run
+            prefix = int(size * 0.9)
+            with open(os.path.join(dataset.save_folder,
+                                   "resume-0.bin.incomplete"), "wb") as f:
+                f.write(get_content("resume-0.bin", 0, prefix))
+            downloaded = size - prefix
+
+        start, cpu_start = time.perf_counter(), time.process_time()
+        dataset.download(**kwargs)
+        times.append(time.perf_counter() - start)
+        cpus.append(time.process_time() - cpu_start)
+        shutil.rmtree(save_path)
+
+    seconds = statistics.median(times)
+    return {
+        "seconds": seconds,
+        "bytes": downloaded,
+        "mb_per_s": downloaded / seconds / 1024 ** 2,
+        "cpu_s_per_gb": statistics.median(cpus) / (downloaded / GB),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS),
+                        help="among {}".format(", ".join(SCENARIOS)))
+    parser.add_argument("--size", type=parse_size, default="64M",
+                        help="bytes of each file")
+    parser.add_argument("--files", type=int, default=4,
+                        help="number of files of the scenarios on several "
+                        "files")
+    parser.add_argument("--latency", type=float, default=0.,
+                        help="seconds waited by the server before each answer")
+    parser.add_argument("--bandwidth", type=parse_size, default=None,
+                        help="bytes per second per connection (eg. 100M)")
+    parser.add_argument("--no-ranges", action="store_true",
+                        help="the server ignores the Range headers")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", action="store_true",
+                        help="prints machine-readable results")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error("Unknown scenario {}".format(name))
+
+    process, url = start_server(args.latency, args.bandwidth,
+                                not args.no_ranges)
+    folder = tempfile.mkdtemp(prefix="dafter-benchmark-")
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+        "settings": {"size": args.size, "files": args.files,
+                     "latency": args.latency, "bandwidth": args.bandwidth,
+                     "ranges": not args.no_ranges, "runs": args.runs},
+        "scenarios": {},
+    }
+    try:
+        for name in args.scenarios:
+            results["scenarios"][name] = run_scenario(
+                name, url, args.size, args.files, args.runs, folder)
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(folder)
+
+    if "resume" in results["scenarios"] and "sequential" in results["scenarios"]:
+        # The time of the resume that is not spent transferring the bytes
+        resume = results["scenarios"]["resume"]
+        throughput = results["scenarios"]["sequential"]["mb_per_s"] * 1024 ** 2
+        resume["overhead_s"] = resume["seconds"] - resume["bytes"] / throughput
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for name, result in results["scenarios"].items():
+            print("{:<12} {:>8.1f} MB/s {:>8.2f} CPU s/GB {:>8.3f}s".format(
+                name, result["mb_per_s"], result["cpu_s_per_gb"],
+                result["seconds"]))
+        if "overhead_s" in results["scenarios"].get("resume", {}):
+            print("resume overhead {:.3f}s".format(
+                results["scenarios"]["resume"]["overhead_s"]))
+
+
+if __name__ == "__main__":
+    main()
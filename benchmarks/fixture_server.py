@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# coding=utf-8
+"""Serves synthetic files over HTTP, for the benchmarks of the downloads.
+
+Usage:
+    python benchmarks/fixture_server.py [--port 0] [--latency 0.05]
+        [--bandwidth 50M] [--no-ranges]
+
+"GET /<name>?size=<bytes>" answers a file of `size` bytes, generated on the
+fly: nothing is read from the disk, so the server measures the client and not
+itself. The content only depends on the name, so that a file resumed or
+downloaded by ranges can be checked. The url of the server is printed on the
+first line of the standard output.
+"""
+
+import re
+import time
+import zlib
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dafter.fetcher.utils import parse_size
+
+
+BLOCK_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Every file is this random block repeated, rotated by an offset depending on
+# its name. Doubled so that any slice of a block is a slice of _BLOCK.
+_BLOCK = random.Random(0).getrandbits(8 * BLOCK_SIZE).to_bytes(
+    BLOCK_SIZE, "little") * 2
+
+
+def get_offset(name):
+    return zlib.crc32(name.encode()) % BLOCK_SIZE
+
+
+def get_content(name, start, end):
+    """Returns the bytes from `start` to `end` (excluded) of the file `name`"""
+    parts = []
+    position = start
+    offset = get_offset(name)
+    while position < end:
+        i = (position + offset) % BLOCK_SIZE
+        n = min(end - position, BLOCK_SIZE)
+        parts.append(_BLOCK[i:i + n])
+        position += n
+    return b"".join(parts)
+
+
+class SyntheticRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.serve(body=True)
+
+    def do_HEAD(self):
+        self.serve(body=False)
+
+    def serve(self, body):
+        url = urlparse(self.path)
+        name = url.path.strip("/")
+        try:
+            size = int(parse_qs(url.query)["size"][0])
+        except (KeyError, ValueError):
+            self.send_error(400, "The url must be /<name>?size=<bytes>")
+            return
+
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match and self.server.ranges:
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), size - 1)
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(size))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range",
+                             "bytes {}-{}/{}".format(start, end, size))
+        else:
+            self.send_response(200)
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", '"{}-{}"'.format(get_offset(name), size))
+        self.end_headers()
+
+        if body:
+            self.send_content(name, start, end + 1)
+
+    def send_content(self, name, start, end):
+        """Sends the bytes no faster than the bandwidth of the server"""
+        bandwidth = self.server.bandwidth
+        began = time.perf_counter()
+        sent = 0
+        try:
+            for position in range(start, end, CHUNK_SIZE):
+                self.wfile.write(get_content(
+                    name, position, min(position + CHUNK_SIZE, end)))
+                sent += min(CHUNK_SIZE, end - position)
+                if bandwidth:
+                    delay = sent / bandwidth - (time.perf_counter() - began)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (ConnectionError, OSError):
+            self.close_connection = True
+
+
+class SyntheticServer(ThreadingHTTPServer):
+    """A HTTP server of synthetic files, see the module docstring"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0., bandwidth=None, ranges=True):
+        """
+        Args:
+            address (tuple): The (host, port) the server listens to.
+            latency (float, optional): The seconds waited before each answer.
+            bandwidth (int, optional): The bytes per second sent on each
+                connection, unlimited if None.
+            ranges (bool, optional): Honours the Range headers.
+        """
+        super().__init__(address, SyntheticRequestHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.ranges = ranges
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def url(self, name, size):
+        return "http://127.0.0.1:{}/{}?size={}".format(
+            self.server_port, name, size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.,
+                        help="seconds waited before each answer")
+    parser.add_argument("--bandwidth", type=parse_size, default=None,
+                        help="bytes per second per connection (eg. 50M)")
+    parser.add_argument("--no-ranges", action="store_true",
+                        help="ignore the Range headers")
+    args = parser.parse_args()
+
+    server = SyntheticServer(("127.0.0.1", args.port), args.latency,
+                             args.bandwidth, not args.no_ranges)
+    print("http://127.0.0.1:{}".format(server.server_port), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# coding=utf-8
+"""Measures the wall time of the dafter commands that never touch the network.
+
+Usage:
+    python benchmarks/startup.py [--runs 20] [--target 0.15] [command ..]
+
+Each command is run `runs` times in a new interpreter. The script exits with
+status 1 if the median time of a command is above `target` seconds, so that it
+can guard the shell-completion hooks calling "dafter list".
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+
+DEFAULT_COMMANDS = ["version", "list", "search mnist", "info mnist"]
+# The commands import dafter from the checkout, installed or not
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNNER = "import sys; from dafter.cli import main; sys.argv = ['dafter'] + " \
+         "sys.argv[1:]; main()"
+
+
+def time_command(command, runs, env=None):
+    """Returns the wall times of `runs` runs of "dafter `command`", in
+    seconds, or None if the command fails: its error is printed on stderr.
+    `env` replaces the environment of the commands."""
+    env = dict(os.environ if env is None else env)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [REPO_ROOT] + [p for p in [env.get("PYTHONPATH")] if p])
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-c", RUNNER] + command.split(),
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env,
+            cwd=REPO_ROOT)
+        times.append(time.perf_counter() - start)
+        if process.returncode != 0:
+            error = process.stderr.decode(errors="replace").strip()
+            print("\"dafter {}\" failed with status {}:\n{}".format(
+                command, process.returncode, error), file=sys.stderr)
+            return None
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("commands", nargs="*", default=DEFAULT_COMMANDS)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--target", type=float, default=0.15,
+                        help="maximal median wall time, in seconds")
+    parser.add_argument("--json", action="store_true",
+                        help="prints machine-readable results")
+    args = parser.parse_args()
+
+    # The interpreter alone, to know what dafter itself costs
+    baseline = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        baseline.append(time.perf_counter() - start)
+
+    results = {"python": statistics.median(baseline), "commands": {}}
+    for command in args.commands:
+        times = time_command(command, args.runs)
+        # None for the commands that failed
+        results["commands"][command] = None if times is None else \
+            statistics.median(times)
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print("{:<20} {:>8.3f}s".format("(python -c pass)", results["python"]))
+        for command, median in results["commands"].items():
+            if median is None:
+                print("{:<20} {:>9}  FAILED".format(command, "-"))
+                continue
+            status = "ok" if median <= args.target else "SLOW"
+            print("{:<20} {:>8.3f}s  {}".format(command, median, status))
+
+    if any(m is None or m > args.target
+           for m in results["commands"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
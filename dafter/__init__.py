@@ -1,2 +1,12 @@
 #!/usr/bin/python
 # coding=utf-8
+
+
+def __getattr__(name):
+    # dafter.load is imported on first use, like the names of dafter.fetcher
+    if name == "load":
+        from .fetcher import load
+        globals()[name] = load
+        return load
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name))
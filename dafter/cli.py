@@ -10,23 +10,53 @@ __version__ = "0.2"
 import sys
 import argparse
 
-from dafter.fetcher.fetcher import get_dataset, delete_dataset, list_datasets, \
-    info_dataset, search_datasets
+# The subcommands import what they use: "dafter version", "list", "search" or
+# "info" never import requests nor tqdm
 
 
 DESCRIPTION = "Fetches all kind of datasets, whatever the format. Without pain."
-USAGE = """usage: dafter [get dataset-name] [delete dataset-name] [info dataset-name] [list [dataset-name] [--tags tag0 .. tagN]] [search [dataset-name] [--tags tag0 .. tagN]]
+USAGE = """usage: dafter [get dataset-name .. [--tags tag0 .. tagN] [options]] [update dataset-name [--append]] [delete dataset-name] [info dataset-name] [convert dataset-name --to parquet|arrow|npy] [list [dataset-name] [--tags tag0 .. tagN]] [search [dataset-name] [--tags tag0 .. tagN] [--fuzzy]] [serve-cache [--host host] [--port port] [--max-size size] [--allow host ..]]
 
 Positional arguments:
-  get dataset-name                               Downloads and saves the dataset files
+  get dataset-name .. [--tags tag0 .. tagN]      Downloads and saves the dataset files
+  update dataset-name [--append]                 Downloads again the dataset files that changed
   delete dataset-name                            Deletes the dataset files from the disk
   info dataset-name                              Describes the dataset
+  convert dataset-name --to parquet|arrow|npy    Converts the csv and tsv files of the dataset
   list [dataset-name] [--tags tag0 .. tagN]      Lists all the datasets that are in database
   search [dataset-name] [--tags tag0 .. tagN]    Lists all the datasets available with these tags
+  serve-cache [--port port] [--max-size size]    Serves the files downloaded through it to the other machines
   version                                        Get the version of dafter
 """
 
 
+def add_rate_arguments(parser):
+    """Adds the --limit-rate and --limit-schedule arguments to `parser`"""
+    parser.add_argument(
+        '--limit-rate', help="bytes per second of all the downloads (eg. "
+        "50M), and of the downloads from a host with HOST=RATE",
+        nargs='+', default=None)
+    parser.add_argument(
+        '--limit-schedule', help="rates replacing the one of --limit-rate "
+        "during some hours, eg. 09:00-18:00=5M 18:00-09:00=unlimited",
+        nargs='+', default=None)
+
+
+def set_rate_arguments(args):
+    """Applies the --limit-rate and --limit-schedule arguments"""
+    if args.limit_rate is None and args.limit_schedule is None:
+        return
+    from dafter.fetcher.ratelimit import parse_limits, parse_schedule, \
+        set_rate_limit
+    try:
+        rate, per_host = parse_limits(args.limit_rate or [])
+        set_rate_limit(rate, per_host,
+                       parse_schedule(args.limit_schedule or []))
+    except ValueError as e:
+        print(e)
+        exit(1)
+
+
 class DafterCLI():
 
     def __init__(self):
@@ -41,11 +71,12 @@ class DafterCLI():
 
         args = self.parser.parse_args(sys.argv[1:2])
 
-        if not hasattr(self, args.command):
+        command = args.command.replace("-", "_")
+        if not hasattr(self, command):
             print("Unrecognized command")
             self.parser.print_help()
             exit(1)
-        getattr(self, args.command)()
+        getattr(self, command)()
 
     def help(self):
         self.parser.print_help()
@@ -55,20 +86,143 @@ class DafterCLI():
         print(__version__)
 
     def get(self):
+        from dafter.fetcher.fetcher import get_dataset, get_datasets
+        from dafter.fetcher.scheduler import DEFAULT_PER_HOST, ORDERS
+        from dafter.fetcher.utils import parse_size
+
         self.parser = argparse.ArgumentParser(
             description="Downloads and saves the dataset files")
-        self.parser.add_argument('datasetname', help="Name of the dataset")
+        self.parser.add_argument(
+            'datasetname', help="Names of the datasets", nargs='*')
+        self.parser.add_argument(
+            '--tags', help="also downloads the datasets with all these tags",
+            nargs='+', required=False)
+        self.parser.add_argument(
+            '--jobs', help="number of files downloaded at the same time",
+            type=int, default=None)
+        self.parser.add_argument(
+            '--per-host', help="number of files downloaded at the same time "
+            "from the same host (default: {})".format(DEFAULT_PER_HOST),
+            type=int, default=None)
+        self.parser.add_argument(
+            '--order', help="order of the downloads (default: size)",
+            choices=ORDERS, default=None)
+        self.parser.add_argument(
+            '--segments', help="number of connections used for each file",
+            type=int, default=1)
+        self.parser.add_argument(
+            '--chunk-size', help="bytes written to the disk at once (eg. 4M)",
+            default=None)
+        self.parser.add_argument(
+            '--readinto', help="read the network into a reusable buffer",
+            action="store_true")
+        self.parser.add_argument(
+            '--extract', help="extract the archives once downloaded",
+            action="store_true")
+        self.parser.add_argument(
+            '--stream-extract', help="extract the tar, tar.gz and gz archives "
+            "while they are downloaded", action="store_true")
+        self.parser.add_argument(
+            '--remove-archive', help="do not keep the extracted archives",
+            action="store_true")
+        self.parser.add_argument(
+            '--extract-jobs', help="number of processes extracting a zip "
+            "file (default: number of cores)", type=int, default=None)
+        self.parser.add_argument(
+            '--cache-url', help="url of a \"dafter serve-cache\" server to "
+            "download through (default: $DAFTER_CACHE_URL)", default=None)
+        self.parser.add_argument(
+            '--metrics', help="write the measures of the downloads to this "
+            "file: JSON lines, or the Prometheus text format if it ends with "
+            ".prom", default=None)
+        add_rate_arguments(self.parser)
 
         args = self.parser.parse_args(sys.argv[2:])
 
-        if not hasattr(args, "datasetname"):
+        if not args.datasetname and not args.tags:
             print("A dataset name is required")
             self.parser.print_help()
             exit(1)
 
-        get_dataset(args.datasetname)
+        if args.jobs is not None and args.jobs < 1:
+            print("--jobs must be at least 1")
+            exit(1)
+        if args.per_host is not None and args.per_host < 1:
+            print("--per-host must be at least 1")
+            exit(1)
+        if args.segments < 1:
+            print("--segments must be at least 1")
+            exit(1)
+        if args.extract_jobs is not None and args.extract_jobs < 1:
+            print("--extract-jobs must be at least 1")
+            exit(1)
+
+        set_rate_arguments(args)
+
+        if args.cache_url is not None:
+            from dafter.fetcher.session import set_cache_url
+            try:
+                set_cache_url(args.cache_url)
+            except ValueError as e:
+                print(e)
+                exit(1)
+
+        kwargs = {"extract": args.extract,
+                  "stream_extract": args.stream_extract,
+                  "remove_archive": args.remove_archive,
+                  "extract_jobs": args.extract_jobs}
+        if args.chunk_size is not None:
+            try:
+                kwargs["chunk_size"] = parse_size(args.chunk_size)
+            except ValueError as e:
+                print(e)
+                exit(1)
+
+        sink = None
+        if args.metrics is not None:
+            from dafter.fetcher.metrics import add_sink, open_sink
+            sink = add_sink(open_sink(args.metrics))
+
+        # --per-host and --order are options of the scheduler of get_datasets,
+        # which downloads a single dataset too when they are given
+        single = len(args.datasetname) == 1 and not args.tags and \
+            args.per_host is None and args.order is None
+        try:
+            if single:
+                get_dataset(args.datasetname[0], jobs=args.jobs or 1,
+                            segments=args.segments, use_readinto=args.readinto,
+                            **kwargs)
+            else:
+                get_datasets(args.datasetname, args.tags, jobs=args.jobs or 4,
+                             per_host=args.per_host or DEFAULT_PER_HOST,
+                             order=args.order or "size",
+                             segments=args.segments,
+                             use_readinto=args.readinto, **kwargs)
+        finally:
+            if sink is not None:
+                from dafter.fetcher.metrics import remove_sink
+                remove_sink(sink)
+
+    def update(self):
+        from dafter.fetcher.fetcher import update_dataset
+
+        self.parser = argparse.ArgumentParser(
+            description="Downloads again the dataset files that changed "
+            "upstream")
+        self.parser.add_argument('datasetname', help="Name of the dataset")
+        self.parser.add_argument(
+            '--append', help="the files only grow: only fetch the bytes "
+            "added since the download", action="store_true")
+        add_rate_arguments(self.parser)
+
+        args = self.parser.parse_args(sys.argv[2:])
+        set_rate_arguments(args)
+
+        update_dataset(args.datasetname, append=args.append)
 
     def delete(self):
+        from dafter.fetcher.fetcher import delete_dataset
+
         self.parser = argparse.ArgumentParser(
             description="Deletes the dataset files from the disk")
         self.parser.add_argument('datasetname', help="Name of the dataset")
@@ -83,6 +237,8 @@ class DafterCLI():
         delete_dataset(args.datasetname)
 
     def info(self):
+        from dafter.fetcher.fetcher import info_dataset
+
         self.parser = argparse.ArgumentParser(
             description="Describes the dataset")
         self.parser.add_argument('datasetname', help="Name of the dataset")
@@ -96,13 +252,82 @@ class DafterCLI():
 
         info_dataset(args.datasetname)
 
+    def convert(self):
+        from dafter.fetcher.fetcher import convert_dataset
+        from dafter.fetcher.utils import parse_size
+
+        self.parser = argparse.ArgumentParser(
+            description="Converts the csv and tsv files of the dataset to a "
+            "columnar format")
+        self.parser.add_argument('datasetname', help="Name of the dataset")
+        self.parser.add_argument(
+            '--to', help="format of the converted files",
+            choices=["parquet", "arrow", "npy"], default="parquet")
+        self.parser.add_argument(
+            '--block-size', help="bytes of text parsed at once (eg. 16M)",
+            default=None)
+
+        args = self.parser.parse_args(sys.argv[2:])
+
+        block_size = None
+        if args.block_size is not None:
+            try:
+                block_size = parse_size(args.block_size)
+            except ValueError as e:
+                print(e)
+                exit(1)
+
+        try:
+            convert_dataset(args.datasetname, args.to, block_size)
+        except ImportError as e:
+            print(e)
+            exit(1)
+
+    def serve_cache(self):
+        from dafter.fetcher.cache import CACHE_FOLDER, DEFAULT_CACHE_PORT, \
+            serve_cache
+        from dafter.fetcher.utils import parse_size
+
+        self.parser = argparse.ArgumentParser(
+            description="Serves the files downloaded through it to the other "
+            "machines, that set DAFTER_CACHE_URL to its url")
+        self.parser.add_argument(
+            '--host', help="address to listen to, 0.0.0.0 for all the "
+            "network (default: only this machine)", default="127.0.0.1")
+        self.parser.add_argument(
+            '--port', help="port to listen to", type=int,
+            default=DEFAULT_CACHE_PORT)
+        self.parser.add_argument(
+            '--folder', help="folder of the cached files", default=CACHE_FOLDER)
+        self.parser.add_argument(
+            '--max-size', help="bytes kept in the cache (eg. 500G)",
+            default="100G")
+        self.parser.add_argument(
+            '--allow', help="hosts the files can be fetched from, on top of "
+            "the hosts of the dataset configs", nargs='+', default=[])
+
+        args = self.parser.parse_args(sys.argv[2:])
+
+        try:
+            max_size = parse_size(args.max_size)
+        except ValueError as e:
+            print(e)
+            exit(1)
+
+        serve_cache(args.host, args.port, args.folder, max_size, args.allow)
+
     def search(self):
+        from dafter.fetcher.fetcher import search_datasets
+
         self.parser = argparse.ArgumentParser(
             description="Lists all the datasets available with these tags")
         self.parser.add_argument(
             "datasetname", help="keyword", nargs="?", default=None)
         self.parser.add_argument(
             '--tags', help="tags", nargs='+', required=False)
+        self.parser.add_argument(
+            '--fuzzy', help="ranks the datasets by similarity of their name "
+            "and description", action="store_true")
 
         args = self.parser.parse_args(sys.argv[2:])
 
@@ -110,9 +335,11 @@ class DafterCLI():
             args, "datasetname") else None
         tags = args.tags if args.tags else []
 
-        search_datasets(datasetname, tags)
+        search_datasets(datasetname, tags, fuzzy=args.fuzzy)
 
     def list(self):
+        from dafter.fetcher.fetcher import list_datasets
+
         self.parser = argparse.ArgumentParser(
             description="Lists all the datasets that are in database")
         self.parser.add_argument(
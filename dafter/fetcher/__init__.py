@@ -1,7 +1,40 @@
 #!/usr/bin/python
 # coding=utf-8
 
-from .fetcher import * 
+import importlib
+
 from .constants import *
-from .dataset import *
-from .utils import *
\ No newline at end of file
+
+# The submodules are only imported when one of their names is used, so that the
+# commands that never touch the network do not pay for importing requests,
+# tqdm or aiohttp.
+_LAZY_NAMES = {
+    "fetcher": ["get_dataset", "get_datasets", "delete_dataset",
+                "get_all_datasets", "search_datasets", "list_datasets",
+                "info_dataset", "convert_dataset", "update_dataset"],
+    "dataset": ["Dataset", "download_file"],
+    "utils": ["is_valid_url", "is_valid_path", "is_valid_config",
+              "get_dataset_status", "is_dataset_being_downloaded",
+              "normalize_filename", "normalize_name", "get_config_dataset",
+              "parse_size", "is_dataset_in_db", "check_internet_connection"],
+    "catalog": ["get_catalog", "build_catalog", "clear_catalog_cache"],
+    "loader": ["load"],
+}
+_LAZY_MODULES = {name: module for module, names in _LAZY_NAMES.items()
+                 for name in names}
+
+__all__ = list(constants.__all__) + list(_LAZY_MODULES)
+
+
+def __getattr__(name):
+    module = _LAZY_MODULES.get(name)
+    if module is None:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_MODULES))
@@ -0,0 +1,277 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .ratelimit import reserve
+from .session import get_backoff, get_validators, via_cache
+from .stream import DEFAULT_CHUNK_SIZE, DEFAULT_BUFFER_SIZE
+
+
+DEFAULT_CONCURRENCY = 64  # number of files downloaded at the same time
+DEFAULT_LIMIT_PER_HOST = 8  # number of connections to the same host
+WRITER_THREADS = 4
+
+
+def check_aiohttp():
+    if aiohttp is None:
+        raise ImportError("The asyncio engine needs aiohttp: "
+                          "pip install dafter[async]")
+
+
+async def download_file_async(session, url, dst, first_byte=None,
+                              chunk_size=DEFAULT_CHUNK_SIZE, writer=None,
+                              pbar=None, hasher=None, validators=None,
+                              stats=None):
+    """Downloads a file without blocking the event loop. The writes to the
+    disk are done by the `writer` threads. A server that does not honour the
+    Range header sends the whole file again, that replaces the bytes already
+    written.
+
+    Args:
+        session (aiohttp.ClientSession): The session sending the request.
+        url (str): The url of the file to download.
+        dst (str): The path where the downloaded file will be stored. The
+            bytes are appended to the file if it already exists.
+        first_byte (int, optional): The number of bytes already downloaded.
+        chunk_size (int, optional): The number of bytes written to the disk
+            at once.
+        writer (concurrent.futures.Executor, optional): The threads writing
+            the files. Uses the default executor of the loop if None.
+        pbar (tqdm.tqdm, optional): The progress bar updated with the number
+            of bytes received.
+        hasher (FileHasher, optional): Computes the checksums of the file in
+            the `writer` threads, along with the writes.
+        validators (dict, optional): Updated with the ETag and Last-Modified
+            headers of the answer, see `session.get_validators`.
+        stats (dict, optional): Updated with the time to first byte of the
+            answer, see `metrics.record_response`. The retries of aiohttp are
+            not counted.
+
+    Returns:
+        written (int): The number of bytes written, 0 if the file was already
+            complete.
+    """
+    loop = asyncio.get_running_loop()
+
+    if hasher is not None:
+        await loop.run_in_executor(writer, hasher.catch_up, dst,
+                                   first_byte or 0)
+
+    headers = {'Range': 'bytes=%s-' % (first_byte or 0)}
+    written = 0
+    request_start = time.perf_counter()
+    async with session.get(via_cache(url), headers=headers) as r:
+        if stats is not None:
+            stats.setdefault("ttfb_s", time.perf_counter() - request_start)
+        if first_byte and r.status == 416:
+            # Nothing left to download, the size and the checksums are checked
+            # once the file is complete
+            return 0
+        r.raise_for_status()
+        if validators is not None:
+            validators.update(get_validators(r.headers))
+
+        mode = 'ab'
+        if first_byte and r.status != 206:
+            # The server ignored the Range header and sends the whole file
+            mode = 'wb'
+            if hasher is not None:
+                hasher.reset()
+        f = await loop.run_in_executor(
+            writer, lambda: open(dst, mode,
+                                 buffering=max(chunk_size, DEFAULT_BUFFER_SIZE)))
+
+        def write(buf):
+            f.write(buf)
+            if hasher is not None:
+                hasher.update(buf)
+
+        try:
+            buf = bytearray()
+            async for data in r.content.iter_chunked(chunk_size):
+                buf += data
+                # r.url is the cache's when downloading through it
+                delay = reserve(url, len(data))
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if len(buf) < chunk_size:
+                    continue
+                await loop.run_in_executor(writer, write, buf)
+                written += len(buf)
+                if pbar is not None:
+                    pbar.update(len(buf))
+                buf = bytearray()
+            if buf:
+                await loop.run_in_executor(writer, write, buf)
+                written += len(buf)
+                if pbar is not None:
+                    pbar.update(len(buf))
+        finally:
+            await loop.run_in_executor(writer, f.close)
+
+    return written
+
+
+async def download_file_resumed(session, url, dst, first_byte=None, **kwargs):
+    """Calls `download_file_async` until the file is downloaded, resuming it
+    from the bytes already written when the connection drops, with the same
+    backoff as `session.resume_on_error`.
+
+    Returns:
+        written (int): The number of bytes written by all the attempts.
+    """
+    def get_offset():
+        return os.path.getsize(dst) if os.path.exists(dst) else 0
+
+    written = 0
+    attempt = 0
+    offset = first_byte or 0
+    while True:
+        try:
+            return written + await download_file_async(
+                session, url, dst, offset, **kwargs)
+        except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError,
+                asyncio.TimeoutError):
+            new_offset = get_offset()
+            if new_offset > offset:
+                written += new_offset - offset
+                attempt = 0
+            offset = new_offset
+            attempt += 1
+            delay = get_backoff(attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+
+async def download_datasets_async(datasets, concurrency=DEFAULT_CONCURRENCY,
+                                  limit_per_host=DEFAULT_LIMIT_PER_HOST,
+                                  chunk_size=DEFAULT_CHUNK_SIZE):
+    """Downloads all the files of several datasets on the running event loop.
+
+    The resume rules are the same as `Dataset.download`. A file whose download
+    was started by segments is resumed by segments in a thread, as is a file
+    with mirrors. The same events as `Scheduler.run` are sent to the metrics
+    sinks. When a file fails, the other downloads are cancelled before the
+    error is raised.
+
+    Args:
+        datasets (list of Dataset): The datasets to download.
+        concurrency (int, optional): The number of files downloaded at the
+            same time.
+        limit_per_host (int, optional): The number of connections opened to
+            the same host.
+        chunk_size (int, optional): The number of bytes written to the disk
+            at once.
+
+    Returns:
+        datasets (list of Dataset): The downloaded datasets.
+    """
+    check_aiohttp()
+    if not isinstance(concurrency, int) or concurrency < 1:
+        raise ValueError(
+            "concurrency must be a positive int, not {}".format(concurrency))
+
+    loop = asyncio.get_running_loop()
+
+    tasks = []
+    for dataset in datasets:
+        for task in dataset._pending_files():
+            tasks.append((dataset, task))
+    if not tasks:
+        return datasets
+
+    semaphore = asyncio.Semaphore(concurrency)
+    writer = ThreadPoolExecutor(max_workers=WRITER_THREADS)
+    pbar = tqdm(total=None, unit='B', unit_scale=True,
+                desc="{} files".format(len(tasks)))
+    # Stops the downloads handled in a thread, that cannot be cancelled
+    cancel = threading.Event()
+
+    async def fetch(session, dataset, task):
+        async with semaphore:
+            if task["segmented"] or len(task["sources"]) > 1:
+                # The segments and the mirrors are handled in a thread
+                future = loop.run_in_executor(
+                    None, lambda: dataset._fetch(task, cancel=cancel))
+                try:
+                    await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    # The thread stops at its next chunk, with the
+                    # KeyboardInterrupt of a cancelled transfer
+                    cancel.set()
+                    await asyncio.wait([future])
+                    future.exception()
+                    raise
+                return
+            start = time.perf_counter()
+            task["stats"]["resume_offset"] = task["first_byte"] or 0
+            received = 0
+            error = None
+            try:
+                received = await download_file_resumed(
+                    session, task["url"], task["incomplete_f_name"],
+                    task["first_byte"], chunk_size=chunk_size, writer=writer,
+                    pbar=pbar, hasher=task["hasher"],
+                    validators=task["validators"], stats=task["stats"])
+                await loop.run_in_executor(writer, dataset._complete, task)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                dataset._emit_file(task, time.perf_counter() - start,
+                                   received, error)
+
+    connector = aiohttp.TCPConnector(limit=concurrency,
+                                     limit_per_host=limit_per_host)
+    try:
+        async with aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None)) as session:
+            start = time.perf_counter()
+            futures = [asyncio.ensure_future(fetch(session, dataset, task))
+                       for dataset, task in tasks]
+            try:
+                await asyncio.gather(*futures)
+            except BaseException:
+                # gather leaves the other downloads running: they are stopped
+                # before their session is closed
+                cancel.set()
+                for future in futures:
+                    future.cancel()
+                await asyncio.gather(*futures, return_exceptions=True)
+                raise
+            seconds = time.perf_counter() - start
+            for dataset in datasets:
+                dataset_tasks = [task for d, task in tasks if d is dataset]
+                if dataset_tasks:
+                    dataset._emit_dataset(dataset_tasks, seconds)
+    finally:
+        pbar.close()
+        writer.shutdown(wait=True)
+
+    return datasets
+
+
+def download_datasets(datasets, **kwargs):
+    """Runs `download_datasets_async` in a new event loop.
+
+    Args:
+        datasets (list of Dataset): The datasets to download.
+        **kwargs: See `download_datasets_async`.
+
+    Returns:
+        datasets (list of Dataset): The downloaded datasets.
+    """
+    return asyncio.run(download_datasets_async(datasets, **kwargs))
@@ -0,0 +1,503 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import re
+import json
+import hashlib
+import threading
+from urllib.parse import urljoin, urlparse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .catalog import get_catalog
+from .constants import DATASETS_FOLDER
+from .session import get_session
+from .stream import DEFAULT_CHUNK_SIZE
+
+
+CACHE_FOLDER = os.path.join(DATASETS_FOLDER, ".cache")
+DEFAULT_CACHE_SIZE = 100 * 1024 ** 3  # in bytes
+DEFAULT_CACHE_PORT = 8080
+
+# The headers of the upstream server sent back to the clients
+FORWARDED_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+MAX_REDIRECTS = 10
+
+
+class CachedFile:
+    """A file of the cache, complete or still being fetched from upstream.
+
+    The bytes fetched are appended to "<path>.incomplete", that the clients
+    read while it grows: all the clients asking for the same url are served
+    from a single upstream fetch.
+    """
+
+    def __init__(self, url, path):
+        self.url = url
+        self.path = path
+        self.status = None  # the status of the upstream answer
+        self.size = None  # None until known
+        self.available = 0  # number of bytes fetched
+        self.headers = {}
+        self.complete = False
+        self.failed = False
+        self.condition = threading.Condition()
+
+    def wait_headers(self):
+        """Waits for the answer of upstream.
+
+        Returns:
+            ok (bool): False if upstream did not send the file.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.status is not None or self.failed)
+            return self.status == 200 and not self.failed
+
+    def wait_complete(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.complete or self.failed)
+            return self.complete
+
+    def wait_bytes(self, offset):
+        """Waits until the byte at `offset` has been fetched.
+
+        Returns:
+            available (int): The number of bytes fetched, 0 if the fetch failed.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.available > offset or
+                                    self.complete or self.failed)
+            return 0 if self.failed else self.available
+
+    def open(self):
+        """Opens the file for reading, complete or not. The file stays
+        readable if it is completed or evicted in the meantime."""
+        with self.condition:
+            if self.complete:
+                return open(self.path, "rb")
+            return open("{}.incomplete".format(self.path), "rb")
+
+
+class Cache:
+    """The files downloaded through the cache, evicted least recently used
+    first once they take more than `max_size` bytes."""
+
+    def __init__(self, folder=CACHE_FOLDER, max_size=DEFAULT_CACHE_SIZE,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Args:
+            folder (str, optional): The folder of the cached files.
+            max_size (int, optional): The number of bytes kept.
+            chunk_size (int, optional): The number of bytes read from upstream
+                and written to the disk at once.
+        """
+        if not isinstance(max_size, int) or isinstance(max_size, bool) or \
+                max_size < 0:
+            raise ValueError(
+                "max_size must be a positive int, not {}".format(max_size))
+        self.folder = folder
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        # The hosts the files are fetched from, any host if None, see
+        # `is_allowed`
+        self.allowed_hosts = None
+        self.lock = threading.Lock()
+        self.files = OrderedDict()  # least recently used first
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Finds the files cached by a previous run, in the order they were
+        last used"""
+        entries = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.endswith(".incomplete"):
+                os.remove(path)
+                continue
+            if not name.endswith(".json"):
+                continue
+            data_path = path[:-len(".json")]
+            try:
+                with open(path) as f:
+                    meta = json.load(f)
+                if os.path.getsize(data_path) != meta["size"]:
+                    raise ValueError("Wrong size for {}".format(data_path))
+            except (OSError, ValueError, KeyError):
+                self._remove(data_path)
+                continue
+            cached = CachedFile(meta["url"], data_path)
+            cached.status = 200
+            cached.size = cached.available = meta["size"]
+            cached.headers = meta["headers"]
+            cached.complete = True
+            entries.append((os.path.getmtime(data_path), cached))
+
+        for _, cached in sorted(entries, key=lambda e: e[0]):
+            self.files[self.get_key(cached.url)] = cached
+
+    @staticmethod
+    def get_key(url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def get(self, url):
+        """Returns the cached file of `url`, and starts fetching it from
+        upstream if it is not cached nor being fetched.
+
+        Returns:
+            cached (CachedFile): The file.
+        """
+        key = self.get_key(url)
+        with self.lock:
+            cached = self.files.get(key)
+            if cached is not None and not cached.failed:
+                self.files.move_to_end(key)
+                if cached.complete:
+                    # The order survives a restart of the cache
+                    os.utime(cached.path)
+                return cached
+
+            cached = CachedFile(url, os.path.join(self.folder, key))
+            self.files[key] = cached
+        threading.Thread(target=self._fetch, args=(key, cached),
+                         daemon=True).start()
+        return cached
+
+    def _fetch(self, key, cached):
+        incomplete_path = "{}.incomplete".format(cached.path)
+        try:
+            r = self.request("GET", cached.url, stream=True)
+            with open(incomplete_path, "wb", buffering=0) as f:
+                with cached.condition:
+                    if "Content-Length" in r.headers:
+                        cached.size = int(r.headers["Content-Length"])
+                    cached.headers = {h: r.headers[h]
+                                      for h in FORWARDED_HEADERS
+                                      if h in r.headers}
+                    cached.status = r.status_code
+                    cached.condition.notify_all()
+                if r.status_code != 200:
+                    raise ValueError("{} answered {}".format(cached.url,
+                                                            r.status_code))
+
+                for chunk in r.iter_content(self.chunk_size):
+                    f.write(chunk)
+                    with cached.condition:
+                        cached.available += len(chunk)
+                        cached.condition.notify_all()
+
+            if cached.size is not None and cached.available != cached.size:
+                raise ValueError("{} sent {} bytes instead of {}".format(
+                    cached.url, cached.available, cached.size))
+
+            with open("{}.json".format(cached.path), "w") as f:
+                json.dump({"url": cached.url, "size": cached.available,
+                           "headers": cached.headers}, f)
+            with cached.condition:
+                os.replace(incomplete_path, cached.path)
+                cached.size = cached.available
+                cached.complete = True
+                cached.condition.notify_all()
+        except Exception:
+            with cached.condition:
+                cached.failed = True
+                cached.condition.notify_all()
+            with self.lock:
+                if self.files.get(key) is cached:
+                    del self.files[key]
+            self._remove(cached.path)
+            return
+
+        self.evict()
+
+    def is_allowed(self, url):
+        """Tells if the host of `url`, with or without its port, is one of
+        `allowed_hosts`"""
+        if self.allowed_hosts is None:
+            return True
+        parsed = urlparse(url)
+        return parsed.netloc.lower() in self.allowed_hosts or \
+            parsed.hostname in self.allowed_hosts
+
+    def request(self, method, url, **kwargs):
+        """Sends a request upstream, following the redirections to the
+        allowed hosts only.
+
+        Raises:
+            ValueError: If a redirection leads to a host that is not allowed,
+                or after MAX_REDIRECTS redirections.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            r = get_session().request(method, url, allow_redirects=False,
+                                      **kwargs)
+            if not r.is_redirect:
+                return r
+            r.close()
+            location = urljoin(url, r.headers["Location"])
+            if not self.is_allowed(location):
+                raise ValueError("{} redirects to {}, not an allowed "
+                                 "host".format(url, location))
+            url = location
+        raise ValueError("Too many redirections from {}".format(url))
+
+    def head(self, url):
+        """Returns what a HEAD request of `url` answers, without fetching the
+        file: the cached metadata if the file is cached or being fetched,
+        the answer of a HEAD request to upstream otherwise.
+
+        Returns:
+            (status, size, headers) (tuple): The status of the answer, the
+                size of the file (None if unknown) and its forwarded headers.
+        """
+        with self.lock:
+            cached = self.files.get(self.get_key(url))
+        if cached is not None:
+            with cached.condition:
+                if not cached.failed and cached.status is not None and \
+                        cached.size is not None:
+                    return cached.status, cached.size, dict(cached.headers)
+
+        r = self.request("HEAD", url)
+        size = r.headers.get("Content-Length")
+        headers = {h: r.headers[h] for h in FORWARDED_HEADERS
+                   if h in r.headers}
+        return r.status_code, int(size) if size is not None else None, \
+            headers
+
+    def get_size(self):
+        """Returns the number of bytes of the complete files"""
+        with self.lock:
+            return sum(cached.size for cached in self.files.values()
+                       if cached.complete)
+
+    def evict(self):
+        """Removes the least recently used complete files until the cache
+        takes at most `max_size` bytes. The files being read stay readable by
+        their clients until they are closed."""
+        with self.lock:
+            total = sum(cached.size for cached in self.files.values()
+                        if cached.complete)
+            for key, cached in list(self.files.items()):
+                if total <= self.max_size:
+                    break
+                if not cached.complete:
+                    continue
+                del self.files[key]
+                total -= cached.size
+                self._remove(cached.path)
+
+    @staticmethod
+    def _remove(path):
+        for p in [path, "{}.json".format(path), "{}.incomplete".format(path)]:
+            if os.path.exists(p):
+                os.remove(p)
+
+
+def get_catalog_hosts():
+    """Returns the hosts of the urls and mirrors of all the dataset configs,
+    the only ones a cache fetches from by default"""
+    hosts = set()
+    for config in get_catalog()["configs"].values():
+        for url_ in config.get("urls", []):
+            if not isinstance(url_, dict):
+                continue
+            for url in [url_.get("url")] + list(url_.get("mirrors", [])):
+                if isinstance(url, str):
+                    hosts.add(urlparse(url).netloc.lower())
+    return hosts
+
+
+def parse_range(header, size):
+    """Parses a "Range: bytes=start-end" header, the only form sent by dafter.
+
+    Returns:
+        (start, end) (tuple): The inclusive byte range, None if the header is
+            not a single byte range, or (None, None) if the range cannot be
+            satisfied: it starts after the end of the file, or asks for the
+            last 0 bytes.
+    """
+    match = re.match(r"^bytes=(\d*)-(\d*)$", header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # The last `end` bytes
+        if int(end) == 0:
+            return None, None
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    if start >= size:
+        return None, None
+    end = min(int(end), size - 1) if end else size - 1
+    if end < start:
+        return None
+    return start, end
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    """Serves "GET /<url>" from the cache, eg.
+    "GET /http://yann.lecun.com/exdb/mnist/train-images-idx3-ubyte.gz"."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = self.get_url()
+        if url is not None:
+            self.serve(url, body=True)
+
+    def do_HEAD(self):
+        url = self.get_url()
+        if url is not None:
+            self.serve_head(url)
+
+    def get_url(self):
+        """Returns the upstream url asked for, None once an error has been
+        sent if it is not an url of an allowed host"""
+        url = self.path[1:]
+        if not url.startswith(("http://", "https://")):
+            self.send_error(400, "The path must be an http or https url")
+            return None
+        if not self.server.cache.is_allowed(url):
+            self.send_error(403, "Not an allowed host: {}".format(
+                urlparse(url).netloc))
+            return None
+        return url
+
+    def serve_head(self, url):
+        """Answers a HEAD request without fetching the file"""
+        try:
+            status, size, headers = self.server.cache.head(url)
+        except Exception:
+            self.send_error(502)
+            return
+        if status != 200:
+            self.send_error(status)
+            return
+        self.send_response(200)
+        if size is not None:
+            # The ranges are served once the size is known
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(size))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def serve(self, url, body):
+        cached = self.server.cache.get(url)
+        if not cached.wait_headers():
+            self.send_error(cached.status if cached.status and
+                            cached.status != 200 else 502)
+            return
+        if cached.size is None and not cached.wait_complete():
+            # Upstream did not send the size: it is known once fetched
+            self.send_error(502)
+            return
+        size = cached.size
+
+        start, end = 0, size - 1
+        header = self.headers.get("Range")
+        byte_range = parse_range(header, size) if header else None
+        if byte_range == (None, None):
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */{}".format(size))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if byte_range is not None:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header("Content-Range",
+                             "bytes {}-{}/{}".format(start, end, size))
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        for name, value in cached.headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        if body and end >= start:
+            self.copy(cached, start, end)
+
+    def copy(self, cached, start, end):
+        """Sends the bytes from `start` to `end`, as soon as they are fetched"""
+        try:
+            with cached.open() as f:
+                f.seek(start)
+                offset = start
+                while offset <= end:
+                    available = cached.wait_bytes(offset)
+                    if available <= offset:
+                        # Upstream failed: the client sees a short answer
+                        self.close_connection = True
+                        return
+                    while offset < min(available, end + 1):
+                        chunk = f.read(min(self.server.cache.chunk_size,
+                                           available - offset,
+                                           end + 1 - offset))
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                        offset += len(chunk)
+        except (ConnectionError, OSError):
+            self.close_connection = True
+
+
+class CacheServer(ThreadingHTTPServer):
+    """A HTTP server caching the files downloaded through it"""
+
+    daemon_threads = True
+
+    def __init__(self, address, cache, verbose=False, allowed_hosts=None):
+        """
+        Args:
+            address (tuple): The (host, port) the server listens to.
+            cache (Cache): The cached files.
+            verbose (bool, optional): Logs each request.
+            allowed_hosts (iterable of str, optional): The hosts, with or
+                without their port, the files are fetched from, redirections
+                included. The hosts of the dataset configs if None, see
+                `get_catalog_hosts`: the server must not fetch any url for
+                anyone on the network.
+        """
+        super().__init__(address, CacheRequestHandler)
+        self.cache = cache
+        self.verbose = verbose
+        if allowed_hosts is None:
+            allowed_hosts = get_catalog_hosts()
+        cache.allowed_hosts = {host.lower() for host in allowed_hosts}
+
+
+def serve_cache(host="127.0.0.1", port=DEFAULT_CACHE_PORT, folder=CACHE_FOLDER,
+                max_size=DEFAULT_CACHE_SIZE, allow=()):
+    """Runs a cache server until it is interrupted. The clients download
+    through it when the DAFTER_CACHE_URL environment variable is its url, eg.
+    "http://cache-host:8080".
+
+    Args:
+        host (str, optional): The address the server listens to. Only the
+            local machine by default, "0.0.0.0" for all the network.
+        port (int, optional): The port the server listens to.
+        folder (str, optional): The folder of the cached files.
+        max_size (int, optional): The number of bytes kept in the cache.
+        allow (list of str, optional): The hosts the files are fetched from,
+            on top of the hosts of the dataset configs.
+    """
+    cache = Cache(folder, max_size)
+    allowed_hosts = get_catalog_hosts() | {h.lower() for h in allow}
+    server = CacheServer((host, port), cache, verbose=True,
+                         allowed_hosts=allowed_hosts)
+    print("Serving {} bytes of cache from {} on http://{}:{}".format(
+        cache.get_size(), folder, host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import json
+import threading
+
+from .constants import DATASETS_CONFIG_FOLDER, CATALOG_INDEX_FILE
+
+
+CATALOG_VERSION = 1
+
+_catalogs = {}  # In-memory catalogs, by (config_folder, index_file)
+_lock = threading.Lock()
+
+
+def get_signature(config_folder):
+    """Returns the name, modification time and size of every config file. The
+    catalog index is rebuilt when the signature changes.
+
+    Args:
+        config_folder (str): The folder of the json config files.
+
+    Returns:
+        signature (list of list): One [filename, mtime_ns, size] list per
+            config file, sorted by filename.
+    """
+    signature = []
+    for entry in os.scandir(config_folder):
+        if not entry.name.endswith(".json") or not entry.is_file():
+            continue
+        stat = entry.stat()
+        signature.append([entry.name, stat.st_mtime_ns, stat.st_size])
+    return sorted(signature)
+
+
+def build_catalog(config_folder, signature=None):
+    """Parses every config file of `config_folder`.
+
+    Args:
+        config_folder (str): The folder of the json config files.
+        signature (list, optional): The signature of the folder, computed if
+            None.
+
+    Returns:
+        catalog (dict): "configs" maps the name of each config file (without
+            ".json") to its config, "tags" maps each tag to the sorted names
+            of the configs having it.
+    """
+    if signature is None:
+        signature = get_signature(config_folder)
+
+    configs = {}
+    tags = {}
+    for filename, _, _ in signature:
+        with open(os.path.join(config_folder, filename)) as f:
+            try:
+                config = json.load(f)
+            except ValueError:
+                continue
+        name = filename.replace(".json", "")
+        configs[name] = config
+        for tag in config.get("tags", []):
+            tags.setdefault(tag, []).append(name)
+
+    for tag in tags:
+        tags[tag] = sorted(tags[tag])
+
+    return {
+        "version": CATALOG_VERSION,
+        "signature": signature,
+        "configs": configs,
+        "tags": tags,
+    }
+
+
+def write_catalog(catalog, index_file):
+    """Atomically writes the catalog index. Does nothing if the folder of the
+    index cannot be written."""
+    tmp = "{}.{}.tmp".format(index_file, os.getpid())
+    try:
+        with open(tmp, "w") as f:
+            json.dump(catalog, f)
+        os.replace(tmp, index_file)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def read_catalog(index_file):
+    """Reads the catalog index, or returns None if there is no valid one"""
+    try:
+        with open(index_file) as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(catalog, dict) or \
+            catalog.get("version") != CATALOG_VERSION:
+        return None
+    return catalog
+
+
+def get_catalog(config_folder=DATASETS_CONFIG_FOLDER,
+                index_file=CATALOG_INDEX_FILE):
+    """Returns the catalog of all the dataset configs.
+
+    The catalog is compiled once into `index_file` and rebuilt only when a
+    config file is added, removed or modified. In the same process, it is kept
+    in memory as long as the config folder does not change, so that every
+    lookup is a dictionary hit.
+
+    Args:
+        config_folder (str, optional): The folder of the json config files.
+        index_file (str, optional): The compiled catalog index.
+
+    Returns:
+        catalog (dict): See `build_catalog`. Must not be modified.
+    """
+    key = (config_folder, index_file)
+    folder_mtime = os.stat(config_folder).st_mtime_ns
+
+    with _lock:
+        cached = _catalogs.get(key)
+        if cached is not None and cached[0] == folder_mtime:
+            return cached[1]
+
+        signature = get_signature(config_folder)
+        catalog = read_catalog(index_file)
+        if catalog is None or catalog["signature"] != signature:
+            catalog = build_catalog(config_folder, signature)
+            write_catalog(catalog, index_file)
+
+        _catalogs[key] = (folder_mtime, catalog)
+        return catalog
+
+
+def clear_catalog_cache():
+    """Forgets the catalogs kept in memory"""
+    with _lock:
+        _catalogs.clear()
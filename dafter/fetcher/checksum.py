@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import re
+import hashlib
+import threading
+
+from .stream import DEFAULT_CHUNK_SIZE
+
+
+# The algorithms a config can give for each url, strongest first, with the
+# length of their hexadecimal digest
+CHECKSUM_ALGORITHMS = [("sha256", 64), ("md5", 32)]
+
+
+def is_valid_checksum(algorithm, value):
+    """Tells if `value` looks like a hexadecimal digest of `algorithm`"""
+    length = dict(CHECKSUM_ALGORITHMS).get(algorithm)
+    if length is None or not isinstance(value, str):
+        return False
+    return re.match(r'^[0-9a-fA-F]{%d}$' % length, value) is not None
+
+
+def get_expected_checksums(url_):
+    """Gets the checksums given by the config for one url.
+
+    Args:
+        url_ (dict): The entry of the url in the config.
+
+    Returns:
+        checksums (dict): Maps each algorithm to the expected lowercase
+            hexadecimal digest.
+    """
+    return {algorithm: url_[algorithm].lower()
+            for algorithm, _ in CHECKSUM_ALGORITHMS if url_.get(algorithm)}
+
+
+def format_checksum(checksums):
+    """Returns the strongest checksum as an "algorithm:digest" string, or None
+    if `checksums` is empty.
+
+    Args:
+        checksums (dict): Maps algorithms to hexadecimal digests.
+    """
+    for algorithm, _ in CHECKSUM_ALGORITHMS:
+        if algorithm in checksums:
+            return "{}:{}".format(algorithm, checksums[algorithm])
+    return None
+
+
+class FileHasher:
+    """Computes the checksums of a file while it is written, in order.
+
+    The hash objects cannot be saved to the disk: a download resumed by another
+    process hashes the bytes already on the disk once, with `catch_up`, while
+    a download resumed in the same process keeps its `FileHasher` and carries
+    on where it stopped.
+    """
+
+    def __init__(self, checksums, algorithms=()):
+        """
+        Args:
+            checksums (dict): The expected digests, by algorithm.
+            algorithms (iterable of str, optional): Other algorithms to
+                compute, without expected digest.
+        """
+        self.checksums = checksums
+        self.algorithms = set(checksums) | set(algorithms)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hashers = {algorithm: hashlib.new(algorithm)
+                        for algorithm in self.algorithms}
+        self.offset = 0  # number of bytes hashed
+
+    def update(self, chunk):
+        """Hashes the next bytes of the file"""
+        for hasher in self.hashers.values():
+            hasher.update(chunk)
+        self.offset += len(chunk)
+
+    def catch_up(self, path, size, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Hashes the bytes of the file at `path` up to `size`.
+
+        Args:
+            path (str): The file being written.
+            size (int): The number of bytes of the file that must be hashed.
+            chunk_size (int, optional): The number of bytes read at once.
+        """
+        with self.lock:
+            if self.offset > size:
+                # The file has been truncated since: starts again
+                self.reset()
+            if self.offset == size:
+                return
+            buf = bytearray(chunk_size)
+            view = memoryview(buf)
+            with open(path, "rb", buffering=0) as f:
+                f.seek(self.offset)
+                while self.offset < size:
+                    n = f.readinto(view[:min(chunk_size, size - self.offset)])
+                    if not n:
+                        raise ValueError("{} is smaller than {} bytes".format(
+                            path, size))
+                    self.update(view[:n])
+
+    def hexdigest(self, algorithm):
+        return self.hashers[algorithm].hexdigest()
+
+    def get_mismatches(self):
+        """Returns the algorithms whose digest is not the expected one"""
+        return [algorithm for algorithm, digest in self.checksums.items()
+                if self.hexdigest(algorithm) != digest]
+
+    def get_checksum(self):
+        """Returns the strongest checksum among the expected ones (among the
+        computed ones if none is expected), see `format_checksum`"""
+        return format_checksum({algorithm: self.hexdigest(algorithm)
+                                for algorithm in self.checksums or
+                                self.algorithms})
@@ -6,8 +6,13 @@ import os
 HOME = os.path.expanduser("~")
 CURRENT_FOLDER = os.sep.join(__file__.split(os.sep)[:-1])
 
-DATASETS_CONFIG_FOLDER = os.path.join(
+# Replaces the configs shipped with dafter, eg. by a folder of private configs
+CONFIGS_FOLDER_ENV = "DAFTER_CONFIGS_FOLDER"
+
+DATASETS_CONFIG_FOLDER = os.environ.get(CONFIGS_FOLDER_ENV) or os.path.join(
     CURRENT_FOLDER, os.pardir, "datasets-configs")
 DATASETS_FOLDER = os.path.join(HOME, ".dafter")
+CATALOG_INDEX_FILE = os.path.join(DATASETS_FOLDER, ".catalog-index.json")
+STATE_DB_NAME = ".state.db"
 
-__all__ = ["DATASETS_CONFIG_FOLDER", "DATASETS_FOLDER"]
+__all__ = ["DATASETS_CONFIG_FOLDER", "DATASETS_FOLDER", "CATALOG_INDEX_FILE"]
@@ -0,0 +1,312 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import re
+import json
+import shutil
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .extract import detect_format
+
+
+CONVERT_FORMATS = ("parquet", "arrow", "npy")
+TABULAR_TYPES = {"csv": ",", "tsv": "\t"}  # delimiter of each config type
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024  # bytes of text parsed at once
+NPY_HEADER_SIZE = 128  # the data of the npy files is aligned on 64 bytes
+SCHEMA_SUFFIX = ".schema.json"
+
+
+def check_dependencies(to):
+    # pyarrow is slow to import: only imported by the conversions, not by the
+    # modules importing this one
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("The conversion needs pyarrow: "
+                          "pip install dafter[convert]")
+    if to == "npy" and numpy is None:
+        raise ImportError("The conversion to npy needs numpy: "
+                          "pip install dafter[convert]")
+
+
+def get_stem(filename):
+    """Returns the name of a tabular file without its extensions, eg. "data"
+    for "data.csv.gz\""""
+    if filename.endswith(".gz"):
+        filename = filename[:-3]
+    for ext in list(TABULAR_TYPES) + ["txt"]:
+        if filename.endswith("." + ext):
+            return filename[:-len(ext) - 1]
+    return filename
+
+
+def get_delimiter(filename, config_type=None):
+    """Returns the delimiter of a tabular file, from its extension or else
+    from the type of its dataset, or None if the file is not tabular"""
+    name = filename[:-3] if filename.endswith(".gz") else filename
+    for ext, delimiter in TABULAR_TYPES.items():
+        if name.endswith("." + ext):
+            return delimiter
+    return TABULAR_TYPES.get(config_type)
+
+
+def get_output_path(path, to):
+    """Returns the path of the converted file (a folder for npy)"""
+    stem = os.path.join(os.path.dirname(path), get_stem(os.path.basename(path)))
+    if to == "npy":
+        return "{}-npy".format(stem)
+    return "{}.{}".format(stem, to)
+
+
+def write_npy_header(f, dtype, rows):
+    """Writes a npy header of NPY_HEADER_SIZE bytes, so that it can be
+    rewritten in place once the number of rows is known"""
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(
+        numpy.lib.format.dtype_to_descr(dtype), rows)
+    header = header.ljust(NPY_HEADER_SIZE - 11) + "\n"
+    f.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) +
+            header.encode("latin1"))
+
+
+class NpyWriter:
+    """Appends arrays to a 1-D npy file whose length is not known in
+    advance"""
+
+    def __init__(self, path, dtype):
+        self.f = open(path, "wb")
+        self.dtype = numpy.dtype(dtype)
+        self.rows = 0
+        write_npy_header(self.f, self.dtype, 0)
+
+    def write(self, array):
+        array = numpy.ascontiguousarray(array, dtype=self.dtype)
+        self.f.write(array.data)
+        self.rows += len(array)
+
+    def close(self):
+        self.f.seek(0)
+        write_npy_header(self.f, self.dtype, self.rows)
+        self.f.close()
+
+
+class NpyColumnsWriter:
+    """Writes each column of a table into its own npy files, in a folder.
+
+    A numeric, boolean or temporal column is one "<index>.npy" file, the nulls
+    of its integer and boolean columns being written as 0 and False. A text
+    column is stored like in Arrow: "<index>.offsets.npy" gives the position
+    of each value in the utf-8 bytes of "<index>.values.npy".
+    """
+
+    def __init__(self, folder, schema):
+        os.makedirs(folder)
+        self.columns = []
+        for i, field in enumerate(schema):
+            try:
+                dtype = numpy.dtype(field.type.to_pandas_dtype())
+            except (NotImplementedError, TypeError):
+                dtype = numpy.dtype(object)
+            if dtype.kind in "biufmM":
+                files = {"data": "{}.npy".format(i)}
+                writers = {"data": NpyWriter(os.path.join(folder, files["data"]),
+                                             dtype)}
+            else:
+                files = {"offsets": "{}.offsets.npy".format(i),
+                         "values": "{}.values.npy".format(i)}
+                writers = {
+                    "offsets": NpyWriter(os.path.join(folder, files["offsets"]),
+                                         numpy.int64),
+                    "values": NpyWriter(os.path.join(folder, files["values"]),
+                                        numpy.uint8),
+                }
+                writers["offsets"].write(numpy.zeros(1, numpy.int64))
+                dtype = None
+            self.columns.append({"files": files, "writers": writers,
+                                 "dtype": dtype, "size": 0})
+
+    def write_batch(self, batch):
+        import pyarrow.compute
+
+        for column, array in zip(self.columns, batch.columns):
+            writers = column["writers"]
+            if column["dtype"] is not None:
+                if column["dtype"].kind in "biu" and array.null_count:
+                    array = pyarrow.compute.fill_null(
+                        array, False if column["dtype"].kind == "b" else 0)
+                writers["data"].write(array.to_numpy(zero_copy_only=False))
+                continue
+
+            array = array.cast(pyarrow.large_string())
+            if array.null_count:
+                array = pyarrow.compute.fill_null(array, "")
+            offsets = numpy.frombuffer(array.buffers()[1], numpy.int64)
+            offsets = offsets[array.offset:array.offset + len(array) + 1]
+            values = numpy.frombuffer(array.buffers()[2], numpy.uint8)
+            writers["values"].write(values[offsets[0]:offsets[-1]])
+            writers["offsets"].write(offsets[1:] - offsets[0] + column["size"])
+            column["size"] += int(offsets[-1] - offsets[0])
+
+    def close(self):
+        for column in self.columns:
+            for writer in column["writers"].values():
+                writer.close()
+
+
+def remove_output(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def get_conflicting_column(error, schema):
+    """Returns the name of the column whose inferred type a later block does
+    not fit, from the error of the csv reader, or None"""
+    match = re.match(r"In CSV column #(\d+):", str(error))
+    if match is None or int(match.group(1)) >= len(schema):
+        return None
+    return schema[int(match.group(1))].name
+
+
+def open_writer(path, to, schema):
+    if to == "parquet":
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(path, schema)
+    if to == "arrow":
+        # The Arrow IPC file format is read back with a memory map, without
+        # any copy
+        import pyarrow.ipc
+        return pyarrow.ipc.new_file(path, schema)
+    return NpyColumnsWriter(path, schema)
+
+
+def convert_file(path, to="parquet", delimiter=",",
+                 block_size=DEFAULT_BLOCK_SIZE):
+    """Converts a csv or tsv file (compressed with gzip or not) to a columnar
+    file next to it, with a "<stem>.schema.json" sidecar.
+
+    The file is parsed `block_size` bytes at a time, so the memory used does
+    not depend on the size of the file. The types of the columns are inferred
+    from the first block: when a later block does not fit the type of a
+    column, the file is read again with that column as text.
+
+    Args:
+        path (str): The path of the tabular file.
+        to (str, optional): One of CONVERT_FORMATS.
+        delimiter (str, optional): The delimiter of the fields.
+        block_size (int, optional): The number of bytes parsed at once.
+
+    Returns:
+        schema (dict): The content of the sidecar: the "source" file, the
+            "format", the "path" of the converted file relative to the folder
+            of the source, the number of "rows" and the "columns", each with
+            its "name", "type", number of "nulls" and, for npy, its "files".
+    """
+    if to not in CONVERT_FORMATS:
+        raise ValueError("to must be one of {}, not {}".format(
+            ", ".join(CONVERT_FORMATS), to))
+    if not isinstance(block_size, int) or isinstance(block_size, bool) or \
+            block_size < 1:
+        raise ValueError(
+            "block_size must be a positive int, not {}".format(block_size))
+    check_dependencies(to)
+    import pyarrow.csv
+
+    output = get_output_path(path, to)
+    incomplete = "{}.incomplete".format(output)
+    remove_output(incomplete)
+
+    compression = "gzip" if detect_format(path) == "gz" else None
+    text_columns = []
+    while True:
+        reader = pyarrow.csv.open_csv(
+            pyarrow.input_stream(path, compression=compression),
+            read_options=pyarrow.csv.ReadOptions(block_size=block_size),
+            parse_options=pyarrow.csv.ParseOptions(delimiter=delimiter),
+            convert_options=pyarrow.csv.ConvertOptions(
+                column_types={name: pyarrow.string()
+                              for name in text_columns}))
+
+        schema = reader.schema
+        rows = 0
+        nulls = [0] * len(schema)
+        try:
+            writer = open_writer(incomplete, to, schema)
+            try:
+                for batch in reader:
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+                    for i, column in enumerate(batch.columns):
+                        nulls[i] += column.null_count
+            finally:
+                writer.close()
+        except pyarrow.ArrowInvalid as e:
+            remove_output(incomplete)
+            name = get_conflicting_column(e, schema)
+            if name is None or name in text_columns:
+                raise
+            text_columns.append(name)
+            continue
+        except BaseException:
+            remove_output(incomplete)
+            raise
+        break
+
+    remove_output(output)
+    os.replace(incomplete, output)
+
+    columns = []
+    for i, field in enumerate(schema):
+        column = {"name": field.name, "type": str(field.type),
+                  "nulls": nulls[i]}
+        if to == "npy":
+            column["files"] = writer.columns[i]["files"]
+        columns.append(column)
+
+    sidecar = {
+        "source": os.path.basename(path),
+        "format": to,
+        "path": os.path.basename(output),
+        "rows": rows,
+        "columns": columns,
+    }
+    stem = os.path.join(os.path.dirname(path), get_stem(os.path.basename(path)))
+    with open(stem + SCHEMA_SUFFIX, "w") as f:
+        json.dump(sidecar, f, indent=2)
+    return sidecar
+
+
+def find_tabular_files(folder, config_type=None, filenames=None):
+    """Finds the tabular files of a dataset folder.
+
+    Args:
+        folder (str): The folder of the dataset.
+        config_type (str, optional): The type of the dataset, which gives the
+            delimiter of the `filenames` that have no tabular extension.
+        filenames (list of str, optional): The names of the downloaded files.
+
+    Returns:
+        files (list of tuple): The (path, delimiter) pairs, sorted by path.
+    """
+    filenames = set(filenames or [])
+    files = []
+    for root, _, names in os.walk(folder):
+        for name in names:
+            if name.endswith((".incomplete", ".corrupt", SCHEMA_SUFFIX)):
+                continue
+            path = os.path.join(root, name)
+            downloaded = root == folder and name in filenames
+            delimiter = get_delimiter(name, config_type if downloaded else None)
+            if delimiter is None:
+                continue
+            # A downloaded file can be an archive of tabular files
+            if downloaded and detect_format(path) not in (None, "gz"):
+                continue
+            files.append((path, delimiter))
+    return sorted(files)
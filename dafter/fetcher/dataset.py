@@ -2,12 +2,201 @@
 # coding=utf-8
 
 import os
+import time
 import shutil
-import requests
 from tqdm import tqdm
 
 from .constants import DATASETS_FOLDER
 from .utils import normalize_name, normalize_filename
+from .checksum import FileHasher, format_checksum, get_expected_checksums
+from .extract import StreamExtractor, extract_archive
+from .metrics import emit, record_response
+from .mirrors import STALL_TIMEOUT, get_sources, rank_sources, with_failover
+from .scheduler import Scheduler, get_host
+from .segmented import download_segmented, get_sidecar_path, load_sidecar
+from .session import get_session, get_validators, resume_on_error, via_cache
+from .state import COMPLETE, CORRUPT, EXTRACTED, INCOMPLETE, get_state
+from .store import STORE_ALGORITHM, clone_file, collect_garbage, \
+    restore_file, store_file
+from .stream import DEFAULT_CHUNK_SIZE, DEFAULT_BUFFER_SIZE, ThrottledProgress, \
+    copy_response
+
+
+# The number of bytes at the end of a file compared with the server before
+# appending the bytes added to it since, see `Dataset.update`
+APPEND_CHECK_SIZE = 64 * 1024
+
+
+def fit_desc_size(s):
+    LEN_FINAL_DESC = 20
+    if s is None:
+        return " " * LEN_FINAL_DESC
+    if len(s) == LEN_FINAL_DESC:
+        return s
+    if len(s) <= LEN_FINAL_DESC:
+        return " " * (LEN_FINAL_DESC-len(s)) + s
+    index = (LEN_FINAL_DESC-1)//2
+    return s[:index] + ".." + s[-index:]
+
+
+def get_size_file(path):
+    size = str(os.path.getsize(path))  # eg. 56282L
+    size = "".join(c for c in size if c.isdigit())
+    size = int(size)
+    return size
+
+
+def get_hasher(url_):
+    """Returns the `FileHasher` of a file of a config, None if the config
+    gives no checksum for it. The sha256 naming the objects of the store is
+    computed too, so that the file can be shared with the other datasets:
+    the files without checksum are neither hashed nor stored.
+
+    Args:
+        url_ (dict): The entry of the file in the "urls" of the config.
+    """
+    checksums = get_expected_checksums(url_)
+    if not checksums:
+        return None
+    return FileHasher(checksums, [STORE_ALGORITHM])
+
+
+def download_file(url, dst, first_byte=None, total_bytes=None, desc=None,
+                  position=None, cancel=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                  use_readinto=False, hasher=None, validators=None,
+                  stats=None, sources=None):
+    """Download a file. When the connection drops, the download is resumed
+    from the bytes already written, see `session.resume_on_error`. A server
+    that does not honour the Range header sends the whole file again: the
+    bytes already written are then replaced instead of being appended to.
+    With several sources, the download moves to the next one when a source
+    fails or stalls, see `mirrors.with_failover`.
+
+    Args:
+        url (str): The url of the file to download
+        dst (str or file object): The name of the file and its path where the
+            downloaded file will be stored, or a file object opened for
+            writing, eg. a `StreamExtractor`. A file object is not resumed.
+        first_byte (int): Non zero if the file has already been
+            downloaded but the download has previously been
+            interrupted. Number of bytes already downloaded
+        total_bytes (int): The total file size of the downloaded file
+        desc (str): The description string that is used to decorate
+            the progress bar
+        position (int, optional): The line of the progress bar, when several
+            files are downloaded at the same time
+        cancel (threading.Event, optional): When set by another thread, the
+            download stops and KeyboardInterrupt is raised
+        chunk_size (int, optional): The number of bytes read from the network
+            and written to the disk at once
+        use_readinto (bool, optional): Reads the network into one reusable
+            buffer instead of allocating a new one for each chunk
+        hasher (FileHasher, optional): Computes the checksums of the file
+            while it is written. The bytes already downloaded are hashed
+            first, unless `hasher` already went through them.
+        validators (dict, optional): Updated with the ETag and Last-Modified
+            headers of the answer from `url`, see `session.get_validators`.
+            The validators of the mirrors are not the ones of `url`.
+        stats (dict, optional): Updated with the time to first byte and the
+            retries of the request, see `metrics.record_response`.
+        sources (list of str, optional): The urls to download the file from,
+            fastest first, see `mirrors.rank_sources`. Only `url` by default.
+
+    Returns:
+        None
+    """
+
+    sources = sources or [url]
+    # A mirror sending nothing for a while is given up for the next one
+    timeout = STALL_TIMEOUT if len(sources) > 1 else None
+    if first_byte is None:
+        first_byte = 0
+    if hasher is not None and first_byte:
+        hasher.catch_up(dst, first_byte)
+    if total_bytes is None:
+        headers = get_session().head(via_cache(sources[0]),
+                                     timeout=timeout).headers
+        if "Content-Length" in headers:
+            total_bytes = int(headers["Content-Length"])
+
+    progress = ThrottledProgress(
+        tqdm(total=total_bytes, initial=first_byte, unit='B', unit_scale=True,
+             desc=desc, position=position, leave=position is None))
+
+    def get_offset():
+        if not isinstance(dst, str):
+            return first_byte
+        return os.path.getsize(dst) if os.path.exists(dst) else 0
+
+    def transfer(source):
+        start = get_offset()
+        resume_header = {'Range': 'bytes=%s-' % (start)}
+
+        request_start = time.perf_counter()
+        r = get_session().get(via_cache(source), headers=resume_header,
+                              stream=True, timeout=timeout)
+        if stats is not None:
+            record_response(stats, r, time.perf_counter() - request_start)
+        if start and r.status_code == 416:
+            # Nothing left to download, the size and the checksums are checked
+            # once the file is complete
+            return
+        r.raise_for_status()
+        if validators is not None and source == url:
+            validators.update(get_validators(r.headers))
+
+        if not isinstance(dst, str):
+            copy_response(r, dst, chunk_size, use_readinto, progress, cancel,
+                          hasher=hasher, url=source)
+            return
+
+        mode = 'ab'
+        if start and r.status_code != 206:
+            # The server ignored the Range header and sends the whole file
+            mode = 'wb'
+            start = 0
+            progress.reset()
+            if hasher is not None:
+                hasher.reset()
+        with open(dst, mode, buffering=max(chunk_size, DEFAULT_BUFFER_SIZE)) as f:
+            written = copy_response(r, f, chunk_size, use_readinto, progress,
+                                    cancel, hasher=hasher, url=source)
+
+        # The body read into a buffer ends silently when the connection drops
+        expected = r.headers.get("Content-Length")
+        if expected is not None and written < int(expected):
+            raise ConnectionError(
+                "The connection closed after {} of the {} bytes of {}".format(
+                    start + written, start + int(expected), source))
+
+    try:
+        if not isinstance(dst, str):
+            transfer(sources[0])
+        else:
+            resume_on_error(with_failover(transfer, sources), get_offset,
+                            cancel)
+    finally:
+        progress.close()
+
+
+def get_conditional_headers(record):
+    """Returns the headers of a request asking for a file only if it changed
+    since it was downloaded.
+
+    Args:
+        record (dict): The record of the file in the state database, with its
+            "etag" and "last_modified" validators.
+
+    Returns:
+        headers (dict): The If-None-Match and If-Modified-Since headers, empty
+            if no validator was recorded.
+    """
+    headers = {}
+    if record.get("etag"):
+        headers["If-None-Match"] = record["etag"]
+    if record.get("last_modified"):
+        headers["If-Modified-Since"] = record["last_modified"]
+    return headers
 
 
 class Dataset:
@@ -50,110 +239,726 @@ class Dataset:
             raise ValueError("Incorrect save_path : {}".format(save_path))
 
 
-    def download(self):
-        """Handles the download of the different files of the dataset located at
-        different urls.
-        """
-        def fit_desc_size(s):
-            LEN_FINAL_DESC = 20
-            if s is None:
-                return " " * LEN_FINAL_DESC
-            if len(s) == LEN_FINAL_DESC:
-                return s
-            if len(s) <= LEN_FINAL_DESC:
-                return " " * (LEN_FINAL_DESC-len(s)) + s
-            index = (LEN_FINAL_DESC-1)//2
-            return s[:index] + ".." + s[-index:]
-
-        def download_file(url, dst, first_byte=None, total_bytes=None, desc=None):
-            """Download a file
-
-            Args:
-                url (str): The url of the file to download
-                dst (str): The name of the file and its path where the
-                    downloaded file will be stored
-                first_byte (int): Non zero if the file has already been
-                    downloaded but the download has previously been
-                    interrupted. Number of bytes already downloaded
-                total_bytes (int): The total file size of the downloaded file
-                desc (str): The description string that is used to decorate
-                    the progress bar
-
-            Returns:
-                None
-            """
-
-            if first_byte is None:
-                first_byte = 0
-            if total_bytes is None:
-                headers = requests.head(url).headers
-                if "Content-Length" in headers:
-                    total_bytes = int(headers["Content-Length"])
-
-            resume_header = {'Range': 'bytes=%s-' % (first_byte)}
-
-            pbar = tqdm(total=total_bytes, initial=first_byte, unit='B', unit_scale=True, desc=desc)
-
-            r = requests.get(url, headers=resume_header, stream=True)
-            with open(dst, 'ab') as f:
-                for chunk in r.iter_content(chunk_size=1024):
-                    if chunk:
-                        f.write(chunk)
-                        f.flush()
-                        pbar.update(len(chunk))
-            pbar.close()
-
-        def get_size_file(path):
-            size = str(os.path.getsize(path))  # eg. 56282L
-            size = "".join(c for c in size if c.isdigit())
-            size = int(size)
-            return size
+    def _pending_files(self):
+        """Lists the files of the dataset that still have to be downloaded.
+
+        Applies the resume rules: a complete file of the right size is
+        skipped, a complete file of the wrong size is deleted, and an
+        ".incomplete" file is resumed from its current size (or simply renamed
+        if it already has the expected size). When the config gives a checksum,
+        a complete file that has never been verified is hashed once, and moved
+        to "<file>.corrupt" if it does not match. An extracted archive that
+        has been removed is not downloaded again, neither is a file whose
+        sha256 is given by the config and already in the store (it is linked
+        from the store instead).
 
+        Returns:
+            tasks (list of dict): One dict per file to download, with the
+                "index", "url", "total_bytes", "f_name", "incomplete_f_name"
+                "first_byte", "segmented", "hasher", "validators", "stats"
+                and "sources" fields, see `_make_task`.
+        """
         # Files that are already stored in the save_path folder
         stored_f_name = [os.path.join(self.save_folder, f_name)
                                 for f_name in os.listdir(self.save_folder)]
-                                
+
+        state = get_state(self.save_path)
+        known = state.get_files(self.name) if state is not None else {}
+
+        tasks = []
+        records = []
         for i, url_ in enumerate(self.urls):
             url = url_.get("url", None)
             total_bytes = url_.get("bytes", None)
+            checksums = get_expected_checksums(url_)
 
             url_filename = normalize_filename(url)
+            record = known.get(url_filename, {})
+            checksum = record.get("checksum")
+            status = EXTRACTED if record.get("status") == EXTRACTED \
+                else COMPLETE
 
             f_name = os.path.join(self.save_folder, url_filename)
 
             # Test if already downloaded
             if f_name in stored_f_name:
-                if total_bytes:
-                    saved_size = get_size_file(f_name)
-                    if saved_size != total_bytes:
-                        # Cannot take any risk: the file must be downloaded again
-                        os.remove(f_name)
+                saved_size = get_size_file(f_name)
+                # A file refreshed by `update` has outgrown the size of the
+                # config: the size recorded with its validators is trusted
+                refreshed = record.get("status") in (COMPLETE, EXTRACTED) \
+                    and record.get("size") == saved_size \
+                    and (record.get("etag") or record.get("last_modified"))
+                if total_bytes and saved_size != total_bytes and \
+                        not refreshed:
+                    # Cannot take any risk: the file must be downloaded again
+                    os.remove(f_name)
+                elif checksums and checksum != format_checksum(checksums):
+                    hasher = FileHasher(checksums)
+                    hasher.catch_up(f_name, saved_size)
+                    if hasher.get_mismatches():
+                        os.replace(f_name, "{}.corrupt".format(f_name))
                     else:
+                        records.append((url_filename, status, saved_size,
+                                        hasher.get_checksum()))
                         continue
                 else:
+                    records.append((url_filename, status, saved_size,
+                                    checksum))
                     continue
+            elif status == EXTRACTED:
+                # The archive has been removed once extracted
+                records.append((url_filename, EXTRACTED, record.get("size"),
+                                checksum))
+                continue
+            elif STORE_ALGORITHM in checksums and restore_file(
+                    self.save_path, checksums[STORE_ALGORITHM], f_name):
+                # Already downloaded for another dataset
+                records.append((url_filename, COMPLETE, get_size_file(f_name),
+                                format_checksum(checksums)))
+                continue
 
             # Test if incomplete download
             incomplete_f_name = "{}.incomplete".format(f_name)
+            segmented = get_sidecar_path(incomplete_f_name) in stored_f_name
             if incomplete_f_name in stored_f_name:
                 first_byte = get_size_file(incomplete_f_name)
+            else:
+                first_byte = None
+
+            task = self._make_task(i, first_byte, segmented)
+
+            # If already downloaded, just misnamed. A file downloaded by
+            # segments has its final size from the start, its sidecar tells if
+            # it is complete.
+            if total_bytes and total_bytes == first_byte and not segmented:
+                try:
+                    size, checksum = self._complete(task, record=False)
+                    records.append((url_filename, COMPLETE, size, checksum))
+                    continue
+                except ValueError:
+                    # Moved to ".corrupt": downloads it again from scratch
+                    task["first_byte"] = first_byte = None
+
+            records.append((url_filename, INCOMPLETE, first_byte, None))
+            tasks.append(task)
+
+        if state is not None:
+            state.set_files(self.name, records)
+
+        return tasks
+
+    def _make_task(self, index, first_byte=None, segmented=False):
+        """Describes the download of the file of the url at `index`.
+
+        Args:
+            index (int): The index of the url in the config.
+            first_byte (int, optional): The size of the ".incomplete" file,
+                None if there is none.
+            segmented (bool, optional): True if the ".incomplete" file is
+                downloaded by segments.
+
+        Returns:
+            task (dict): The "index", "url", "total_bytes", "f_name",
+                "incomplete_f_name", "first_byte", "segmented", "hasher" (the
+                `FileHasher` of the file, see `get_hasher`) and "validators" (the ETag and
+                Last-Modified headers, filled by the download), "stats" (the
+                measures of the download, see `_emit_file`) and "sources" (the
+                url and the mirrors of the file) fields.
+        """
+        url_ = self.urls[index]
+        f_name = os.path.join(self.save_folder,
+                              normalize_filename(url_["url"]))
+        return {
+            "index": index,
+            "url": url_["url"],
+            "total_bytes": url_.get("bytes", None),
+            "f_name": f_name,
+            "incomplete_f_name": "{}.incomplete".format(f_name),
+            "first_byte": first_byte,
+            "segmented": segmented,
+            "hasher": get_hasher(url_),
+            "validators": {},
+            "stats": {},
+            "sources": get_sources(url_),
+        }
+
+    def _complete(self, task, record=True, status=COMPLETE, size=None):
+        """Verifies the checksums of a downloaded file, gives it its final
+        name and puts it in the store, see `store_file`.
+
+        Args:
+            task (dict): The downloaded file, see `_pending_files`.
+            record (bool, optional): Records the file in the state database.
+            status (str, optional): The status recorded, COMPLETE or EXTRACTED.
+            size (int, optional): The size of a file that has been extracted
+                while it was downloaded, without being stored.
+
+        Returns:
+            size (int): The size of the file.
+            checksum (str): The strongest checksum of the file given by the
+                config, None if the config gives none.
+
+        Raises:
+            ValueError: If a checksum does not match. The file is moved to
+                "<file>.corrupt" so that the next download starts over.
+        """
+        stored = size is None
+        if stored:
+            size = get_size_file(task["incomplete_f_name"])
+        filename = os.path.basename(task["f_name"])
+        state = get_state(self.save_path) if record else None
+
+        checksum = None
+        hasher = task["hasher"]
+        if hasher is not None:
+            # Only reads the bytes that were not hashed during the download
+            verify_start = time.perf_counter()
+            if stored:
+                hasher.catch_up(task["incomplete_f_name"], size)
+            mismatches = hasher.get_mismatches()
+            task["stats"]["verify_s"] = time.perf_counter() - verify_start
+            if mismatches:
+                hasher.reset()
+                if state is not None:
+                    state.set_file(self.name, filename, CORRUPT, size)
+                if not stored:
+                    raise ValueError("Wrong {} checksum for {}".format(
+                        ", ".join(mismatches), task["url"]))
+                corrupt_f_name = "{}.corrupt".format(task["f_name"])
+                os.replace(task["incomplete_f_name"], corrupt_f_name)
+                raise ValueError("Wrong {} checksum for {}, the file has been "
+                                 "moved to {}".format(", ".join(mismatches),
+                                                      task["url"],
+                                                      corrupt_f_name))
+            checksum = hasher.get_checksum()
+
+        # From "datasetname.incomplete" to "datasetname"
+        if stored:
+            os.rename(task["incomplete_f_name"], task["f_name"])
+            if hasher is not None:
+                store_file(self.save_path, task["f_name"],
+                           hasher.hexdigest(STORE_ALGORITHM))
+
+        if state is not None:
+            state.set_file(self.name, filename, status, size, checksum,
+                           **task["validators"])
+
+        return size, checksum
+
+    def _fetch(self, task, segments=1, position=None, cancel=None,
+               chunk_size=DEFAULT_CHUNK_SIZE, use_readinto=False,
+               stream_extract=False, keep_archive=True):
+        """Downloads one file returned by `_pending_files` and renames it once
+        it is complete and its checksums match. A "file" event is sent to the
+        metrics sinks, see `_emit_file`.
+
+        Args:
+            task (dict): The file to download.
+            segments (int, optional): The number of connections used to
+                download the file, if the server accepts byte ranges.
+            position (int, optional): The line of the progress bar.
+            cancel (threading.Event, optional): Stops the transfer when set.
+            chunk_size (int, optional): See `download_file`.
+            use_readinto (bool, optional): See `download_file`.
+            stream_extract (bool, optional): Extracts a tar, tar.gz or gz
+                archive while it is downloaded, see `StreamExtractor`. Only
+                for a file downloaded from its start on a single connection.
+            keep_archive (bool, optional): Also stores the archive extracted
+                while it is downloaded.
+
+        Returns:
+            bytes (int): The number of bytes received.
+        """
+        start = time.perf_counter()
+        received = 0
+        error = None
+        try:
+            received = self._transfer(task, segments, position, cancel,
+                                      chunk_size, use_readinto, stream_extract,
+                                      keep_archive)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._emit_file(task, time.perf_counter() - start, received, error)
+        return received
+
+    def _transfer(self, task, segments, position, cancel, chunk_size,
+                  use_readinto, stream_extract, keep_archive):
+        """Does the work of `_fetch`, whose arguments it takes"""
+        # String displayed on the progress bar
+        small_url = fit_desc_size(normalize_filename(task["url"]))
+        desc = "{} / {} - {}".format(task["index"]+1, len(self.urls), small_url)
+
+        # Bytes already on the disk before this download
+        first_byte = task["first_byte"] or 0
+        if task["segmented"]:
+            state = load_sidecar(task["incomplete_f_name"])
+            first_byte = sum(s[2] for s in state["segments"]) if state else 0
+        task["stats"]["resume_offset"] = first_byte
+
+        # The fastest mirror first
+        sources = None
+        if len(task["sources"]) > 1:
+            sources = rank_sources(task["sources"])
+
+        if stream_extract and task["first_byte"] is None and \
+                not task["segmented"] and segments == 1:
+            extractor = StreamExtractor(self.save_folder,
+                                        os.path.basename(task["f_name"]),
+                                        task["incomplete_f_name"],
+                                        keep_archive)
+            try:
+                download_file(task["url"], extractor, 0, task["total_bytes"],
+                              desc, position=position, cancel=cancel,
+                              chunk_size=chunk_size, use_readinto=use_readinto,
+                              hasher=task["hasher"],
+                              validators=task["validators"],
+                              stats=task["stats"], sources=sources)
+                extractor.close()
+            except BaseException:
+                extractor.abort()
+                raise
+
+            status = EXTRACTED if extractor.extracted else COMPLETE
+            stored = extractor.f is not None
+            size, _ = self._complete(task, status=status,
+                                     size=None if stored else extractor.size)
+            return size
+
+        # A download started by segments is always resumed by segments, a
+        # download started on a single connection is resumed the same way
+        done = False
+        if task["segmented"] or (segments > 1 and task["first_byte"] is None):
+            done = download_segmented(task["url"], task["incomplete_f_name"],
+                                      task["total_bytes"], segments, desc,
+                                      position=position, cancel=cancel,
+                                      chunk_size=chunk_size,
+                                      use_readinto=use_readinto,
+                                      hasher=task["hasher"],
+                                      validators=task["validators"],
+                                      stats=task["stats"], sources=sources)
+        if not done:
+            download_file(task["url"], task["incomplete_f_name"],
+                          task["first_byte"], task["total_bytes"], desc,
+                          position=position, cancel=cancel,
+                          chunk_size=chunk_size, use_readinto=use_readinto,
+                          hasher=task["hasher"],
+                          validators=task["validators"],
+                          stats=task["stats"], sources=sources)
 
-                # If already downloaded, just misnamed
-                if total_bytes and total_bytes == first_byte:
-                    os.rename(incomplete_f_name, f_name)
+        size, _ = self._complete(task)
+        return size - first_byte
+
+    def _emit_file(self, task, seconds, received, error=None):
+        """Sends the measures of the download of a file to the metrics sinks,
+        as a "file" event.
+
+        Args:
+            task (dict): The file, see `_make_task`.
+            seconds (float): The duration of the download.
+            received (int): The number of bytes received, 0 if it failed.
+            error (BaseException, optional): Why the download failed.
+        """
+        stats = task["stats"]
+        stats["bytes"] = received
+        stats["seconds"] = seconds
+        if error is None:
+            status = "complete"
+        elif isinstance(error, KeyboardInterrupt):
+            status = "interrupted"
+        else:
+            status = "failed"
+        stats["status"] = status
+        emit("file", dataset=self.name, file=os.path.basename(task["f_name"]),
+             url=task["url"], host=get_host(task["url"]), status=status,
+             error=None if error is None else repr(error), bytes=received,
+             seconds=seconds,
+             bytes_per_s=received / seconds if seconds > 0 else 0.,
+             resume_offset=stats.get("resume_offset", 0),
+             ttfb_s=stats.get("ttfb_s"), retries=stats.get("retries", 0),
+             verify_s=stats.get("verify_s"))
+
+    def _emit_dataset(self, tasks, seconds):
+        """Sends the totals of the files of the dataset downloaded by a run to
+        the metrics sinks, as a "dataset" event.
+
+        Args:
+            tasks (list of dict): The files of the dataset downloaded by the
+                run, see `_emit_file`.
+            seconds (float): The time between the start of the first file and
+                the end of the last one.
+        """
+        received = sum(task["stats"].get("bytes", 0) for task in tasks)
+        emit("dataset", dataset=self.name, files=len(tasks),
+             failed=sum(task["stats"].get("status") != "complete"
+                        for task in tasks),
+             bytes=received, seconds=seconds,
+             bytes_per_s=received / seconds if seconds > 0 else 0.,
+             retries=sum(task["stats"].get("retries", 0) for task in tasks))
+
+    def download(self, jobs=1, segments=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                 use_readinto=False, extract=False, stream_extract=False,
+                 remove_archive=False, extract_jobs=None):
+        """Handles the download of the different files of the dataset located at
+        different urls.
+
+        Args:
+            jobs (int, optional): The number of files downloaded at the same
+                time. With the default value, the files are downloaded one
+                after another.
+            segments (int, optional): The number of connections used for each
+                file. Each connection downloads its own byte range of the file.
+            chunk_size (int, optional): The number of bytes read from the
+                network and written to the disk at once.
+            use_readinto (bool, optional): Reads the network into one reusable
+                buffer for each file instead of allocating a new one for each
+                chunk.
+            extract (bool, optional): Extracts the archives once downloaded,
+                see `extract`.
+            stream_extract (bool, optional): Extracts the tar, tar.gz and gz
+                archives while they are downloaded, which saves writing and
+                reading them back. The other archives are extracted once
+                downloaded.
+            remove_archive (bool, optional): Does not keep the extracted
+                archives.
+            extract_jobs (int, optional): The number of processes extracting
+                a zip file, the number of cores if None.
+        """
+        if not isinstance(jobs, int) or isinstance(jobs, bool) or jobs < 1:
+            raise ValueError("jobs must be a positive int, not {}".format(jobs))
+        if not isinstance(segments, int) or isinstance(segments, bool) or \
+                segments < 1:
+            raise ValueError(
+                "segments must be a positive int, not {}".format(segments))
+        if not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or \
+                chunk_size < 1:
+            raise ValueError(
+                "chunk_size must be a positive int, not {}".format(chunk_size))
+
+        scheduler = Scheduler(jobs=jobs, per_host=None, order="config",
+                              segments=segments, chunk_size=chunk_size,
+                              use_readinto=use_readinto,
+                              stream_extract=stream_extract,
+                              keep_archive=not remove_archive)
+        scheduler.add(self)
+        scheduler.run()
+
+        if extract or stream_extract:
+            self.extract(remove_archive=remove_archive, jobs=extract_jobs)
+
+        return self
+
+    def extract(self, remove_archive=False, jobs=None):
+        """Extracts the downloaded archives of the dataset into its folder.
+
+        The format of each file is recognized from its first bytes: the files
+        that are not tar, tar.gz, zip or gz archives are left as they are. An
+        archive is only extracted once, its status becomes "extracted".
+
+        Args:
+            remove_archive (bool, optional): Removes each archive once
+                extracted.
+            jobs (int, optional): The number of processes extracting a zip
+                file, the number of cores if None.
+
+        Returns:
+            extracted (list of str): The names of the archives extracted by
+                this call.
+        """
+        state = get_state(self.save_path)
+        known = state.get_files(self.name) if state is not None else {}
+
+        extracted = []
+        for url_ in self.urls:
+            filename = normalize_filename(url_["url"])
+            f_name = os.path.join(self.save_folder, filename)
+            if not os.path.isfile(f_name):
+                continue
+            record = known.get(filename, {})
+
+            if record.get("status") != EXTRACTED:
+                if extract_archive(f_name, self.save_folder,
+                                   jobs=jobs) is None:
+                    continue
+                extracted.append(filename)
+                if state is not None:
+                    state.set_file(self.name, filename, EXTRACTED,
+                                   get_size_file(f_name),
+                                   record.get("checksum"))
+
+            if remove_archive:
+                os.remove(f_name)
+
+        if remove_archive:
+            # The objects of the removed archives
+            collect_garbage(self.save_path)
+
+        return extracted
+
+    def update(self, append=False, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Downloads again the files that changed upstream since they were
+        downloaded.
+
+        For each downloaded file, a conditional request is sent with the
+        validators recorded by the download: the server answers "304 Not
+        Modified" without any byte if the file did not change. A file
+        downloaded without validators is compared with the size announced by a
+        HEAD request. The new version replaces the old one once it is
+        complete, and its checksums match the config. An archive that had been
+        extracted is extracted again, and removed again if it had been
+        removed once extracted.
+
+        Args:
+            append (bool, optional): The files only grow, eg. the csv files
+                to which new rows are added: only the bytes added since the
+                download are fetched, see `_append`.
+            chunk_size (int, optional): The number of bytes read from the
+                network and written to the disk at once.
+
+        Returns:
+            updated (list of str): The names of the files downloaded again.
+        """
+        state = get_state(self.save_path)
+        known = state.get_files(self.name) if state is not None else {}
+
+        updated = []
+        for i, url_ in enumerate(self.urls):
+            filename = normalize_filename(url_["url"])
+            record = known.get(filename)
+            if record is None or record["status"] not in (COMPLETE, EXTRACTED):
+                # Not downloaded yet: left to `download`
+                continue
+
+            task = self._make_task(i)
+            extracted = record["status"] == EXTRACTED
+            removed = not os.path.isfile(task["f_name"])
+            if append:
+                appended = self._append(task, record, chunk_size)
+                if appended is not None:
+                    if appended:
+                        updated.append(filename)
+                        if extracted:
+                            self._extract_again(task, removed)
                     continue
+                # Not only appended to: downloaded again
+                record = None
+
+            r = self._revalidate(task, record)
+            if r is None:
+                continue
+
+            small_url = fit_desc_size(filename)
+            desc = "{} / {} - {}".format(i + 1, len(self.urls), small_url)
+            total_bytes = r.headers.get("Content-Length")
+            progress = ThrottledProgress(
+                tqdm(total=int(total_bytes) if total_bytes else None,
+                     unit='B', unit_scale=True, desc=desc))
+            try:
+                with r, open(task["incomplete_f_name"], "wb",
+                             buffering=max(chunk_size,
+                                           DEFAULT_BUFFER_SIZE)) as f:
+                    copy_response(r, f, chunk_size, progress=progress,
+                                  hasher=task["hasher"], url=task["url"])
+            finally:
+                progress.close()
+            self._complete(task)
+            updated.append(filename)
+            if extracted:
+                self._extract_again(task, removed)
+
+        if updated:
+            # The objects of the previous versions
+            collect_garbage(self.save_path)
+
+        return updated
+
+    def _extract_again(self, task, remove_archive):
+        """Extracts the new version of an archive over the files extracted
+        from the previous one, and records it as extracted.
+
+        Args:
+            task (dict): The archive, see `_make_task`.
+            remove_archive (bool): Removes the archive once extracted.
+        """
+        if extract_archive(task["f_name"], self.save_folder) is None:
+            # No longer an archive: stays complete
+            return
+        state = get_state(self.save_path)
+        if state is not None:
+            filename = os.path.basename(task["f_name"])
+            record = state.get_files(self.name)[filename]
+            state.set_file(self.name, filename, EXTRACTED, record["size"],
+                           record["checksum"])
+        if remove_archive:
+            os.remove(task["f_name"])
+
+    def _append(self, task, record, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Fetches the bytes appended to a file since it was downloaded, with
+        a Range request starting at its current size, and appends them to it.
+
+        The last APPEND_CHECK_SIZE bytes of the file are requested too, and
+        compared with the ones on the disk: if they differ, the file has not
+        only grown and must be downloaded again. The file on the disk may be
+        shared with other datasets through the store: the new version is
+        written to a copy of it (a reflink when the file system can), which
+        replaces it once complete. Otherwise the file is appended to in place,
+        as "<file>.incomplete" recorded INCOMPLETE: an interrupted append is
+        resumed by the next `download`.
+
+        The bytes already on the disk are only hashed again when the config
+        gives checksums, that the new version must match: appending a few
+        rows to a large file without checksums does not read it all again.
+
+        Args:
+            task (dict): The file, see `_make_task`.
+            record (dict): The record of the file in the state database.
+            chunk_size (int, optional): The number of bytes read from the
+                network and written to the disk at once.
+
+        Returns:
+            appended (bool): True if bytes have been appended, False if the
+                file did not change, None if it must be downloaded again.
+        """
+        if not os.path.isfile(task["f_name"]):
+            # An archive removed once extracted
+            return None
+        size = get_size_file(task["f_name"])
+        # Straight to upstream: the cache does not revalidate its files
+        url = task["url"]
+
+        headers = get_conditional_headers(record)
+        r = get_session().head(url, headers=headers, allow_redirects=True)
+        if r.status_code == 304:
+            return False
+        r.raise_for_status()
+        if "Content-Length" not in r.headers:
+            return None
+        remote_size = int(r.headers["Content-Length"])
+        if remote_size == size and not headers:
+            return False
+        if remote_size <= size or \
+                r.headers.get("Accept-Ranges", "").lower() != "bytes":
+            return None
+
+        start = max(size - APPEND_CHECK_SIZE, 0)
+        with open(task["f_name"], "rb") as f:
+            f.seek(start)
+            tail = f.read()
+
+        r = get_session().get(url, headers={"Range": "bytes={}-".format(start)},
+                              stream=True)
+        with r:
+            content_range = r.headers.get("Content-Range", "")
+            if r.status_code != 206 or \
+                    not content_range.startswith("bytes {}-".format(start)):
+                return None
+            received = b""
+            while len(received) < len(tail):
+                chunk = r.raw.read(len(tail) - len(received))
+                if not chunk:
+                    break
+                received += chunk
+            if received != tail:
+                return None
+
+            task["validators"].update(get_validators(r.headers))
+
+            # Never appends to the object of the store
+            cloned = os.stat(task["f_name"]).st_nlink > 1
+            if cloned:
+                # Left by an interrupted append
+                if os.path.exists(task["incomplete_f_name"]):
+                    os.remove(task["incomplete_f_name"])
+                clone_file(task["f_name"], task["incomplete_f_name"])
             else:
-                first_byte = None
+                # The only copy of the file becomes the download to resume
+                state = get_state(self.save_path)
+                if state is not None:
+                    state.set_file(self.name,
+                                   os.path.basename(task["f_name"]),
+                                   INCOMPLETE, size, **task["validators"])
+                os.rename(task["f_name"], task["incomplete_f_name"])
+            os.chmod(task["incomplete_f_name"], 0o644)
+
+            if task["hasher"] is not None:
+                task["hasher"].catch_up(task["incomplete_f_name"], size)
+
+            small_url = fit_desc_size(os.path.basename(task["f_name"]))
+            desc = "{} / {} - {}".format(task["index"] + 1, len(self.urls),
+                                         small_url)
+            progress = ThrottledProgress(
+                tqdm(total=remote_size, initial=size, unit='B',
+                     unit_scale=True, desc=desc))
+            try:
+                with open(task["incomplete_f_name"], "ab",
+                          buffering=max(chunk_size, DEFAULT_BUFFER_SIZE)) as f:
+                    copy_response(r, f, chunk_size, progress=progress,
+                                  hasher=task["hasher"], url=task["url"])
+            except BaseException:
+                if cloned:
+                    # The file is still the previous version
+                    os.remove(task["incomplete_f_name"])
+                raise
+            finally:
+                progress.close()
 
-            # String displayed on the progress bar
-            small_url = fit_desc_size(url_filename)
-            desc = "{} / {} - {}".format(i+1, len(self.urls), small_url)
+        self._complete(task)
+        return True
 
-            download_file(url, incomplete_f_name, first_byte, total_bytes, desc)
+    def _revalidate(self, task, record):
+        """Asks the server if a downloaded file changed. The request bypasses
+        the cache set with `session.set_cache_url`.
 
-            # From "datasetname.incomplete" to "datasetname"
-            os.rename(incomplete_f_name, f_name)
+        Args:
+            task (dict): The file, see `_make_task`. Its validators are
+                updated with the ones of the answer.
+            record (dict): The record of the file in the state database, None
+                to download the file without condition.
+
+        Returns:
+            r (requests.Response): The streamed answer with the new version of
+                the file, None if the file did not change.
+        """
+        # Straight to upstream: the cache would answer with its own copy,
+        # without asking upstream if it changed
+        url = task["url"]
+        headers = get_conditional_headers(record) if record else {}
+        if record is not None and not headers:
+            # Not downloaded by this version of dafter, or the server sends no
+            # validator
+            r = get_session().head(url, allow_redirects=True)
+            r.raise_for_status()
+            size = r.headers.get("Content-Length")
+            if size is None or int(size) == record["size"]:
+                return None
+
+        r = get_session().get(url, headers=headers, stream=True)
+        if r.status_code == 304:
+            r.close()
+            return None
+        r.raise_for_status()
+        task["validators"].update(get_validators(r.headers))
+        return r
+
+    async def download_async(self, concurrency=None,
+                             chunk_size=DEFAULT_CHUNK_SIZE):
+        """Downloads the files of the dataset on the running event loop, for
+        the callers that already run one. Needs aiohttp.
+
+        Args:
+            concurrency (int, optional): The number of files downloaded at the
+                same time, aio.DEFAULT_CONCURRENCY if None.
+            chunk_size (int, optional): The number of bytes written to the
+                disk at once.
+        """
+        # Deferred: aiohttp is slow to import and only needed here
+        from .aio import DEFAULT_CONCURRENCY, download_datasets_async
 
+        if concurrency is None:
+            concurrency = DEFAULT_CONCURRENCY
+        await download_datasets_async([self], concurrency=concurrency,
+                                      chunk_size=chunk_size)
         return self
 
     def __repr__(self):
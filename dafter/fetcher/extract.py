@@ -0,0 +1,410 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import zlib
+import heapq
+import queue
+import tarfile
+import zipfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from .stream import DEFAULT_CHUNK_SIZE
+
+
+ARCHIVE_FORMATS = ("tar", "tar.gz", "zip", "gz")
+STREAM_FORMATS = ("tar", "tar.gz", "gz")  # can be extracted while downloaded
+SNIFF_SIZE = 64 * 1024  # bytes read to recognize the format of an archive
+QUEUE_SIZE = 16  # chunks waiting for the extraction thread
+QUEUE_TIMEOUT = 0.1  # in seconds
+MIN_PARALLEL_SIZE = 16 * 1024 * 1024  # smaller zip files are extracted serially
+
+
+def is_tar_header(block):
+    """Tells if `block` starts with the header of a POSIX tar member"""
+    return len(block) >= 262 and block[257:262] == b"ustar"
+
+
+def sniff_format(head):
+    """Recognizes the format of an archive from its first bytes.
+
+    Args:
+        head (bytes): The first bytes of the file, at least 512 when the file
+            is large enough.
+
+    Returns:
+        format (str): One of ARCHIVE_FORMATS, or None if the file is not an
+            archive.
+    """
+    head = bytes(head)
+    if head.startswith(b"PK\x03\x04") or head.startswith(b"PK\x05\x06"):
+        return "zip"
+    if head.startswith(b"\x1f\x8b"):
+        try:
+            block = zlib.decompressobj(31).decompress(head, 512)
+        except zlib.error:
+            return "gz"
+        return "tar.gz" if is_tar_header(block) else "gz"
+    if is_tar_header(head):
+        return "tar"
+    return None
+
+
+def detect_format(path):
+    """Recognizes the format of the archive at `path`, see `sniff_format`"""
+    with open(path, "rb") as f:
+        return sniff_format(f.read(SNIFF_SIZE))
+
+
+def get_gz_name(filename):
+    """Returns the name of the file compressed in the gz file `filename`"""
+    if filename.endswith(".gz") and len(filename) > 3:
+        return filename[:-3]
+    return "{}.out".format(filename)
+
+
+def safe_members(tar, folder):
+    """Yields the members of `tar` that are extracted inside `folder`. Used
+    when tarfile does not have extraction filters."""
+    folder = os.path.realpath(folder)
+    for member in tar:
+        path = os.path.realpath(os.path.join(folder, member.name))
+        if os.path.commonpath([folder, path]) != folder:
+            raise ValueError("The archive member {} is outside of the "
+                             "extraction folder".format(member.name))
+        if member.issym() or member.islnk() or member.isdev():
+            continue
+        yield member
+
+
+def extract_tar(tar, folder):
+    """Extracts an opened tar archive into `folder`, without letting any
+    member be written outside of it"""
+    if hasattr(tarfile, "data_filter"):
+        tar.extractall(folder, filter="data")
+    else:
+        tar.extractall(folder, members=safe_members(tar, folder))
+
+
+class GzipWriter:
+    """Decompresses the gz file written into it"""
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Where the decompressed file is written.
+        """
+        self.f = open(path, "wb")
+        self.decompressor = zlib.decompressobj(31)
+
+    def write(self, data):
+        n = len(data)
+        while data:
+            self.f.write(self.decompressor.decompress(data))
+            if not self.decompressor.eof:
+                break
+            # A gz file can have several members, one after another
+            data = self.decompressor.unused_data
+            if not data.strip(b"\x00"):
+                break
+            self.decompressor = zlib.decompressobj(31)
+        return n
+
+    def close(self):
+        self.f.close()
+        if not self.decompressor.eof:
+            raise ValueError("The gz file {} is truncated".format(self.f.name))
+
+    def abort(self):
+        self.f.close()
+
+
+class TarPipe:
+    """Extracts the tar archive written into it, in a thread that reads the
+    written chunks through a bounded queue"""
+
+    def __init__(self, folder):
+        """
+        Args:
+            folder (str): Where the members of the archive are extracted.
+        """
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.chunk = b""
+        self.pos = 0
+        self.eof = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, args=(folder,),
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self, folder):
+        try:
+            # "r|*" reads the archive as a stream, compressed or not
+            with tarfile.open(fileobj=self, mode="r|*") as tar:
+                extract_tar(tar, folder)
+        except BaseException as e:
+            self.error = e
+
+    def read(self, n=-1):
+        """Called by tarfile in the extraction thread"""
+        parts = []
+        while n != 0:
+            if self.pos >= len(self.chunk):
+                if self.eof:
+                    break
+                chunk = self.queue.get()
+                if chunk is None:
+                    self.eof = True
+                    break
+                self.chunk, self.pos = chunk, 0
+                continue
+            available = len(self.chunk) - self.pos
+            take = available if n < 0 else min(n, available)
+            parts.append(self.chunk[self.pos:self.pos + take])
+            self.pos += take
+            if n > 0:
+                n -= take
+        return b"".join(parts)
+
+    def put(self, item):
+        while self.thread.is_alive():
+            try:
+                self.queue.put(item, timeout=QUEUE_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+        # The extraction is over: the end of the archive is padding
+        if self.error is not None:
+            raise self.error
+
+    def write(self, data):
+        self.put(bytes(data))
+        return len(data)
+
+    def close(self):
+        self.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        # Unblocks the thread, which fails on the truncated archive
+        while self.thread.is_alive():
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                pass
+            self.thread.join(QUEUE_TIMEOUT)
+
+
+class StreamExtractor:
+    """File-like object that extracts the archive written into it.
+
+    The format is recognized from the first bytes. A tar, tar.gz or gz archive
+    is extracted as it is written, and only stored in `archive` if
+    `keep_archive` is True. Any other file (zip or not an archive) is stored in
+    `archive` so that it can be handled once complete.
+    """
+
+    def __init__(self, folder, filename, archive, keep_archive=True):
+        """
+        Args:
+            folder (str): Where the archive is extracted.
+            filename (str): The name of the archive, which gives the name of
+                the file decompressed from a gz file.
+            archive (str): The path where the archive is stored.
+            keep_archive (bool, optional): Also stores the tar, tar.gz and gz
+                archives.
+        """
+        self.folder = folder
+        self.filename = filename
+        self.archive = archive
+        self.keep_archive = keep_archive
+        self.format = None
+        self.extracted = False
+        self.size = 0  # number of bytes written
+
+        self.f = open(archive, "wb") if keep_archive else None
+        self.head = []
+        self.head_size = 0
+        self.target = None
+
+    def start(self):
+        """Chooses where the bytes go, once the format is known"""
+        head = b"".join(self.head)
+        self.head = None
+
+        self.format = sniff_format(head)
+        if self.format in ("tar", "tar.gz"):
+            self.target = TarPipe(self.folder)
+        elif self.format == "gz":
+            self.target = GzipWriter(
+                os.path.join(self.folder, get_gz_name(self.filename)))
+        elif self.f is None:
+            self.f = open(self.archive, "wb")
+        self.extracted = self.target is not None
+
+        if self.f is not None:
+            self.f.write(head)
+        if self.target is not None:
+            self.target.write(head)
+
+    def write(self, data):
+        self.size += len(data)
+        if self.head is not None:
+            self.head.append(bytes(data))
+            self.head_size += len(data)
+            if self.head_size >= SNIFF_SIZE:
+                self.start()
+            return len(data)
+
+        if self.f is not None:
+            self.f.write(data)
+        if self.target is not None:
+            self.target.write(data)
+        return len(data)
+
+    def close(self):
+        """Finishes the extraction. Raises the errors of the extraction."""
+        if self.head is not None:
+            self.start()
+        try:
+            if self.target is not None:
+                self.target.close()
+        finally:
+            if self.f is not None:
+                self.f.close()
+
+    def abort(self):
+        """Stops the extraction after an error"""
+        if self.target is not None:
+            self.target.abort()
+        if self.f is not None:
+            self.f.close()
+
+
+def split_members(infos, jobs):
+    """Splits the members of a zip file into `jobs` lists of about the same
+    compressed size, the largest members first (longest processing time).
+
+    Args:
+        infos (list of zipfile.ZipInfo): The members.
+        jobs (int): The number of lists.
+
+    Returns:
+        bins (list of list of str): The names of the members of each list,
+            without the empty lists.
+    """
+    bins = [[] for _ in range(jobs)]
+    heap = [(0, i) for i in range(jobs)]
+    for info in sorted(infos, key=lambda i: -i.compress_size):
+        size, i = heapq.heappop(heap)
+        bins[i].append(info.filename)
+        heapq.heappush(heap, (size + info.compress_size, i))
+    return [b for b in bins if b]
+
+
+def extract_zip_members(path, folder, names):
+    """Extracts some members of a zip file. Runs in a worker process.
+
+    Reading a member to its end checks its CRC-32: zipfile raises BadZipFile
+    if it does not match.
+
+    Returns:
+        size (int): The number of bytes extracted.
+    """
+    size = 0
+    with zipfile.ZipFile(path) as z:
+        for name in names:
+            try:
+                z.extract(name, folder)
+            except FileExistsError:
+                # Another process created the same parent folder meanwhile
+                z.extract(name, folder)
+            size += z.getinfo(name).file_size
+    return size
+
+
+def extract_zip(path, folder, jobs=None):
+    """Extracts a zip file, with `jobs` processes inflating its members at
+    the same time.
+
+    Args:
+        path (str): The path of the zip file.
+        folder (str): Where the zip file is extracted.
+        jobs (int, optional): The number of processes, the number of cores if
+            None. A zip file smaller than MIN_PARALLEL_SIZE is extracted by the
+            current process.
+
+    Returns:
+        size (int): The number of bytes extracted.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if not isinstance(jobs, int) or isinstance(jobs, bool) or jobs < 1:
+        raise ValueError("jobs must be a positive int, not {}".format(jobs))
+
+    with zipfile.ZipFile(path) as z:
+        infos = z.infolist()
+
+    if jobs == 1 or len(infos) < 2 or \
+            sum(i.compress_size for i in infos) < MIN_PARALLEL_SIZE:
+        return extract_zip_members(path, folder, [i.filename for i in infos])
+
+    bins = split_members(infos, jobs)
+    with ProcessPoolExecutor(max_workers=len(bins)) as executor:
+        futures = [executor.submit(extract_zip_members, path, folder, names)
+                   for names in bins]
+        return sum(future.result() for future in futures)
+
+
+def extract_archive(path, folder, archive_format=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, jobs=None):
+    """Extracts an archive.
+
+    Args:
+        path (str): The path of the archive.
+        folder (str): Where the archive is extracted.
+        archive_format (str, optional): One of ARCHIVE_FORMATS. Recognized
+            from the first bytes of the file if None.
+        chunk_size (int, optional): The number of bytes decompressed at once
+            from a gz file.
+        jobs (int, optional): The number of processes extracting a zip file,
+            see `extract_zip`.
+
+    Returns:
+        format (str): The format of the archive, None if the file is not an
+            archive (and nothing was extracted).
+    """
+    if archive_format is None:
+        archive_format = detect_format(path)
+    elif archive_format not in ARCHIVE_FORMATS:
+        raise ValueError("archive_format must be one of {}, not {}".format(
+            ", ".join(ARCHIVE_FORMATS), archive_format))
+
+    if archive_format in ("tar", "tar.gz"):
+        with tarfile.open(path, "r:*") as tar:
+            extract_tar(tar, folder)
+    elif archive_format == "zip":
+        extract_zip(path, folder, jobs)
+    elif archive_format == "gz":
+        writer = GzipWriter(
+            os.path.join(folder, get_gz_name(os.path.basename(path))))
+        try:
+            with open(path, "rb") as f:
+                while True:
+                    data = f.read(chunk_size)
+                    if not data:
+                        break
+                    writer.write(data)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+
+    return archive_format
@@ -2,16 +2,57 @@
 # coding=utf-8
 
 import os
-import json
 import shutil
 
-from .constants import DATASETS_FOLDER, DATASETS_CONFIG_FOLDER
-from .dataset import Dataset
+from .constants import DATASETS_FOLDER
+from .catalog import get_catalog
+from .scheduler import DEFAULT_PER_HOST, Scheduler, format_stats
+from .search import get_search_index
+from .state import get_state
+from .store import collect_garbage
+from .stream import DEFAULT_CHUNK_SIZE
 from .utils import is_dataset_in_db, normalize_name, is_dataset_being_downloaded, \
-    check_internet_connection, get_config_dataset
+    check_internet_connection, get_config_dataset, normalize_filename
 
 
-def get_dataset(datasetname):
+def post_process(dataset, dataset_config):
+    """Runs the post-processing hooks of the config of a downloaded dataset
+    that have not run yet, see `hooks.run_hooks`.
+
+    Args:
+        dataset (Dataset): The downloaded dataset.
+        dataset_config (dict): Its config.
+
+    Returns:
+        bool (bool): False if a hook failed. A hook needing an optional
+            dependency that is not installed is skipped, it runs the next
+            time the dataset is fetched.
+    """
+    if not dataset_config.get("hooks"):
+        return True
+
+    from .hooks import run_hooks
+
+    try:
+        ran = run_hooks(dataset.save_folder, dataset_config["hooks"])
+    except ImportError as e:
+        print("Skipped post-processing {}: {}".format(dataset.name, e))
+        print("It will run the next time {} is fetched".format(dataset.name))
+        return True
+    except Exception as e:
+        print("Failed post-processing {}".format(dataset.name))
+        print("The following exception occurred : ", e)
+        return False
+    if ran:
+        print("{} has been post-processed ({})".format(
+            dataset.name, ", ".join(ran)))
+    return True
+
+
+def get_dataset(datasetname, jobs=1, segments=1,
+                chunk_size=DEFAULT_CHUNK_SIZE, use_readinto=False,
+                extract=False, stream_extract=False, remove_archive=False,
+                extract_jobs=None):
     """Downloads the files of the dataset from the urls and saves them on the
     disk.
 
@@ -19,6 +60,18 @@ def get_dataset(datasetname):
         dataset_config (dict): The config of the dataset to download, as stored
             in the json file of the dataset located in
             "dafter/datasets-configs"
+        jobs (int, optional): The number of files downloaded at the same time
+        segments (int, optional): The number of connections used for each file
+        chunk_size (int, optional): The number of bytes read from the network
+            and written to the disk at once
+        use_readinto (bool, optional): Reads the network into one reusable
+            buffer instead of allocating a new one for each chunk
+        extract (bool, optional): Extracts the archives once downloaded
+        stream_extract (bool, optional): Extracts the tar, tar.gz and gz
+            archives while they are downloaded
+        remove_archive (bool, optional): Does not keep the extracted archives
+        extract_jobs (int, optional): The number of processes extracting a zip
+            file, the number of cores if None
 
     Returns:
         None
@@ -40,14 +93,28 @@ def get_dataset(datasetname):
         print("Check your internet connection. Cannot download {}".format(name))
         return None
 
+    # Deferred: the download machinery imports requests and tqdm
+    from .dataset import Dataset
+
     if is_dataset_in_db(name) and not is_dataset_being_downloaded(name):
         print("The dataset has already been fetched")
+        dataset = Dataset(name, urls, save_path=DATASETS_FOLDER)
+        if extract or stream_extract:
+            if dataset.extract(remove_archive=remove_archive,
+                               jobs=extract_jobs):
+                print("The archives have been extracted in {}".format(
+                    dataset.save_folder))
+        post_process(dataset, dataset_config)
         return None
 
     dataset = Dataset(name, urls, save_path=DATASETS_FOLDER)
     try:
         print("Downloading {}...".format(dataset.name))
-        dataset.download()
+        dataset.download(jobs=jobs, segments=segments, chunk_size=chunk_size,
+                         use_readinto=use_readinto, extract=extract,
+                         stream_extract=stream_extract,
+                         remove_archive=remove_archive,
+                         extract_jobs=extract_jobs)
     except KeyboardInterrupt as e:
         print("\nThe download has been interrupted. "
               "Run \"dafter get {}\" to resume download".format(name))
@@ -55,12 +122,247 @@ def get_dataset(datasetname):
         print("Failed downloading {}".format(name))
         print("The following exception occurred : ", e)
     else:
+        post_process(dataset, dataset_config)
         print("The dataset has been stored in {}".format(dataset.save_folder))
         return dataset
 
     return None
 
 
+def get_datasets(datasetnames=None, tags=None, jobs=4, per_host=DEFAULT_PER_HOST,
+                 order="size", segments=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                 use_readinto=False, extract=False, stream_extract=False,
+                 remove_archive=False, extract_jobs=None):
+    """Downloads the files of several datasets at the same time. All the files
+    of all the datasets are ordered by one scheduler, which limits the number
+    of files downloaded at the same time, in total and for each host.
+
+    Args:
+        datasetnames (list of str, optional): The names, urls or json files of
+            the datasets to download.
+        tags (list of str, optional): Also downloads all the datasets that have
+            all these tags.
+        jobs (int, optional): The number of files downloaded at the same time
+        per_host (int, optional): The number of files downloaded at the same
+            time from the same host
+        order (str, optional): "size" downloads the largest files first,
+            "host" alternates between the hosts, "config" keeps the order of
+            the configs
+        segments (int, optional): The number of connections used for each file
+        chunk_size (int, optional): The number of bytes read from the network
+            and written to the disk at once
+        use_readinto (bool, optional): Reads the network into one reusable
+            buffer instead of allocating a new one for each chunk
+        extract (bool, optional): Extracts the archives once downloaded
+        stream_extract (bool, optional): Extracts the tar, tar.gz and gz
+            archives while they are downloaded
+        remove_archive (bool, optional): Does not keep the extracted archives
+        extract_jobs (int, optional): The number of processes extracting a zip
+            file, the number of cores if None
+
+    Returns:
+        datasets (list of Dataset): The datasets that have been downloaded.
+    """
+    if datasetnames is None:
+        datasetnames = []
+    if not isinstance(datasetnames, list) or \
+            not all(isinstance(d, str) for d in datasetnames):
+        raise ValueError(
+            "datasetnames must be a list of str, not {}".format(datasetnames))
+    if tags is None:
+        tags = []
+    if not isinstance(tags, list) or not all(isinstance(t, str) for t in tags):
+        raise ValueError("tags must be a list of str, not {}".format(tags))
+
+    configs = []
+    for datasetname in datasetnames:
+        dataset_config = get_config_dataset(datasetname)
+        if dataset_config is None:
+            print("{} is not a valid dataset name, dataset url or "
+                  "json file".format(datasetname))
+            continue
+        configs.append(dataset_config)
+
+    if tags:
+        tags = [t.strip() for t in tags]
+        for config in get_all_datasets():
+            if all(t in config.get("tags", []) for t in tags):
+                configs.append(config)
+
+    if not configs:
+        print("No dataset to download")
+        return []
+
+    if not check_internet_connection():
+        print("Check your internet connection. Cannot download the datasets")
+        return []
+
+    from .dataset import Dataset
+
+    scheduler = Scheduler(jobs=jobs, per_host=per_host, order=order,
+                          segments=segments, chunk_size=chunk_size,
+                          use_readinto=use_readinto,
+                          stream_extract=stream_extract,
+                          keep_archive=not remove_archive)
+
+    datasets = []
+    dataset_configs = {}
+    for dataset_config in configs:
+        name = dataset_config["name"]
+        if any(d.name == normalize_name(name) for d in datasets):
+            continue
+        if is_dataset_in_db(name) and not is_dataset_being_downloaded(name):
+            print("{} has already been fetched".format(name))
+            continue
+        dataset = Dataset(name, dataset_config["urls"], save_path=DATASETS_FOLDER)
+        scheduler.add(dataset)
+        datasets.append(dataset)
+        dataset_configs[dataset.name] = dataset_config
+
+    if not datasets:
+        return []
+
+    try:
+        print("Downloading {}...".format(", ".join(d.name for d in datasets)))
+        stats = scheduler.run(fail_fast=False)
+    except KeyboardInterrupt as e:
+        print("\nThe download has been interrupted. "
+              "Run \"dafter get {}\" to resume download".format(
+                  " ".join(d.name for d in datasets)))
+        return []
+
+    failed = []
+    for dataset, task, e in stats["errors"]:
+        print("Failed downloading {} from {}".format(dataset.name, task["url"]))
+        print("The following exception occurred : ", e)
+        if dataset not in failed:
+            failed.append(dataset)
+
+    print("Downloaded {}".format(format_stats(stats)))
+
+    datasets = [d for d in datasets if d not in failed]
+    for dataset in datasets:
+        if extract or stream_extract:
+            try:
+                dataset.extract(remove_archive=remove_archive,
+                                jobs=extract_jobs)
+            except Exception as e:
+                print("Failed extracting {}".format(dataset.name))
+                print("The following exception occurred : ", e)
+                continue
+        post_process(dataset, dataset_configs[dataset.name])
+        print("{} has been stored in {}".format(dataset.name, dataset.save_folder))
+    return datasets
+
+
+def update_dataset(datasetname, append=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Downloads again the files of a downloaded dataset that changed upstream,
+    see `Dataset.update`. The files that did not change are not transferred.
+
+    Args:
+        datasetname (str): The name of the dataset.
+        append (bool, optional): The files only grow: only the bytes added
+            since the download are fetched.
+        chunk_size (int, optional): The number of bytes read from the network
+            and written to the disk at once.
+
+    Returns:
+        updated (list of str): The names of the files downloaded again.
+    """
+    if not isinstance(datasetname, str):
+        raise ValueError(
+            "datasetname must of type str, not {}".format(type(datasetname)))
+
+    dataset_config = get_config_dataset(datasetname)
+    if dataset_config is None:
+        print("Not a valid datasetname")
+        return []
+
+    name = dataset_config["name"]
+    if not is_dataset_in_db(name) or is_dataset_being_downloaded(name):
+        print("The dataset must be fetched first: dafter get {}".format(name))
+        return []
+
+    if not check_internet_connection():
+        print("Check your internet connection. Cannot update {}".format(name))
+        return []
+
+    # Deferred: the download machinery imports requests and tqdm
+    from .dataset import Dataset
+
+    dataset = Dataset(name, dataset_config["urls"], save_path=DATASETS_FOLDER)
+    try:
+        updated = dataset.update(append=append, chunk_size=chunk_size)
+    except KeyboardInterrupt:
+        print("\nThe update has been interrupted")
+        return []
+    except Exception as e:
+        print("Failed updating {}".format(name))
+        print("The following exception occurred : ", e)
+        return []
+
+    if updated:
+        print("{} has been updated ({})".format(name, ", ".join(updated)))
+    else:
+        print("{} is up to date".format(name))
+    return updated
+
+
+def convert_dataset(datasetname, to="parquet", block_size=None):
+    """Converts the csv and tsv files of a downloaded dataset to a columnar
+    format that can be loaded without parsing. Needs pyarrow (and numpy for
+    npy).
+
+    Args:
+        datasetname (str): The name of the dataset.
+        to (str, optional): "parquet", "arrow" or "npy".
+        block_size (int, optional): The number of bytes of text parsed at once.
+
+    Returns:
+        schemas (list of dict): The schema of each converted file, see
+            `convert.convert_file`.
+    """
+    if not isinstance(datasetname, str):
+        raise ValueError(
+            "datasetname must of type str, not {}".format(type(datasetname)))
+
+    # Deferred: pyarrow is slow to import
+    from .convert import CONVERT_FORMATS, DEFAULT_BLOCK_SIZE, convert_file, \
+        find_tabular_files
+
+    if to not in CONVERT_FORMATS:
+        raise ValueError("to must be one of {}, not {}".format(
+            ", ".join(CONVERT_FORMATS), to))
+    if block_size is None:
+        block_size = DEFAULT_BLOCK_SIZE
+
+    dataset_config = get_config_dataset(datasetname)
+    if dataset_config is None:
+        print("Not a valid datasetname")
+        return []
+
+    name = dataset_config["name"]
+    if not is_dataset_in_db(name) or is_dataset_being_downloaded(name):
+        print("The dataset must be fetched first: dafter get {}".format(name))
+        return []
+
+    folder = os.path.join(DATASETS_FOLDER, normalize_name(name))
+    filenames = [normalize_filename(u_["url"]) for u_ in dataset_config["urls"]]
+    files = find_tabular_files(folder, dataset_config.get("type"), filenames)
+    if not files:
+        print("{} has no csv or tsv file to convert".format(name))
+        return []
+
+    schemas = []
+    for path, delimiter in files:
+        print("Converting {}...".format(os.path.relpath(path, folder)))
+        schema = convert_file(path, to, delimiter, block_size)
+        print("{} rows, {} columns stored in {}".format(
+            schema["rows"], len(schema["columns"]), schema["path"]))
+        schemas.append(schema)
+    return schemas
+
+
 def delete_dataset(datasetname):
     """Deletes the files of the dataset located on the disk.
     Args:
@@ -87,28 +389,32 @@ def delete_dataset(datasetname):
         return None
 
     name = normalize_name(name)
-    name = os.path.join(DATASETS_FOLDER, name)
+    folder = os.path.join(DATASETS_FOLDER, name)
     try:
-        print("Deleting {}...".format(name))
-        shutil.rmtree(name)
+        print("Deleting {}...".format(folder))
+        shutil.rmtree(folder)
+        state = get_state()
+        if state is not None:
+            state.delete_dataset(name)
+        # The files shared with other datasets stay in the store
+        freed = collect_garbage(DATASETS_FOLDER)
+        if freed:
+            print("{} bytes freed in the store".format(freed))
         print("The dataset has been deleted!")
         return dataset_config
     except Exception as e:
-        print("An exception occurred while deleting {}: {}".format(name, e))
+        print("An exception occurred while deleting {}: {}".format(folder, e))
 
     return None
 
 
 def get_all_datasets():
     """Yields all the available datasets configs"""
-    for config_file in os.listdir(DATASETS_CONFIG_FOLDER):
-        cf = os.path.join(DATASETS_CONFIG_FOLDER, config_file)
-        with open(cf) as f:
-            config = json.load(f)
+    for config in get_catalog()["configs"].values():
         yield config
 
 
-def search_datasets(dataset_name, tags):
+def search_datasets(dataset_name, tags, fuzzy=False):
     """Lists all the datasets names in the config files that have the tags
     `tags` and the name `dataset_name`. Prints all the names and the statuses of
     all the datasets that match this criteria.
@@ -117,21 +423,13 @@ def search_datasets(dataset_name, tags):
         dataset_name (str): A string which is a substring of the datasets' names
             we will return
         tag (list of str): The tags.
+        fuzzy (bool, optional): Ranks the datasets by similarity between
+            `dataset_name` and their name and description, instead of looking
+            for an exact substring of their name.
 
     Returns:
         None
     """
-    def valid_dataset(dataset_name, dn, tags, config):
-        if dataset_name:
-            if dataset_name not in dn:
-                return False
-
-        if tags:
-            for t in tags:
-                if t not in config_tags:
-                    return False
-        return True
-
     def get_status_icon(dataset_name):
         # Our dataset has all the tags needed
         in_db = is_dataset_in_db(dn)
@@ -162,22 +460,22 @@ def search_datasets(dataset_name, tags):
     if dataset_name:
         dataset_name = dataset_name.strip()
 
-    configs = []
+    index = get_search_index()
+    if fuzzy and dataset_name:
+        configs = [config for _, config in index.fuzzy(dataset_name, tags)]
+    else:
+        configs = index.match(dataset_name, tags)
+
     printed_list = []
-    for config in get_all_datasets():
-        config_tags = config["tags"]
+    for config in configs:
         dn = config["name"]
-
-        if not valid_dataset(dataset_name, dn, tags, config):
-            continue
-
         status = get_status_icon(dn)
         printed_list.append("{} {}".format(status, dn))
 
-        configs.append(config)
-
     if printed_list:
-        printed_list = sorted(printed_list)
+        # Fuzzy results are printed by rank
+        if not (fuzzy and dataset_name):
+            printed_list = sorted(printed_list)
         print("\n".join(printed_list))
 
     return configs
@@ -194,21 +492,6 @@ def list_datasets(dataset_name, tags):
     Returns:
         None
     """
-    def valid_dataset(dataset_name, dn, tags, config):
-        in_db = is_dataset_in_db(dn)
-        if not in_db:
-            return False
-
-        if dataset_name:
-            if dataset_name not in dn:
-                return False
-
-        if tags:
-            for t in tags:
-                if t not in config_tags:
-                    return False
-        return True
-
     def get_status_icon(dataset_name):
         # Our dataset has all the tags needed
         in_db = is_dataset_in_db(dn)
@@ -223,11 +506,10 @@ def list_datasets(dataset_name, tags):
         return status
 
     printed_list = []
-    for config in get_all_datasets():
-        config_tags = config["tags"]
+    for config in get_search_index().match(dataset_name, tags):
         dn = config["name"]
 
-        if not valid_dataset(dataset_name, dn, tags, config):
+        if not is_dataset_in_db(dn):
             continue
 
         status = get_status_icon(dn)
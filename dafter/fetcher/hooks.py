@@ -0,0 +1,256 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import gzip
+import json
+import pickle
+import tarfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .extract import detect_format, get_gz_name
+
+
+MANIFEST_NAME = "manifest.json"
+
+HOOKS = {}  # The post-processing hooks, by name
+
+# The only globals a pickle of numpy arrays needs
+PICKLE_GLOBALS = {
+    ("_codecs", "encode"),
+    ("numpy", "ndarray"),
+    ("numpy", "dtype"),
+    ("numpy.core.multiarray", "_reconstruct"),
+    ("numpy.core.multiarray", "scalar"),
+    ("numpy._core.multiarray", "_reconstruct"),
+    ("numpy._core.multiarray", "scalar"),
+    ("numpy.core.numeric", "_frombuffer"),
+    ("numpy._core.numeric", "_frombuffer"),
+}
+
+
+def register_hook(name):
+    """Registers a post-processing hook under `name`, so that the configs can
+    list it in their "hooks" field.
+
+    The hook is called with the folder of the dataset and the arguments given
+    in the config, and returns the arrays it has written, see `save_arrays`.
+    """
+    def decorator(f):
+        HOOKS[name] = f
+        return f
+    return decorator
+
+
+def get_hook_entries(hooks):
+    """Normalizes the "hooks" field of a config: a list whose items are a hook
+    name or a dict with a "name" field and the arguments of the hook.
+
+    Returns:
+        entries (list of dict): One dict with at least a "name" per hook.
+    """
+    entries = []
+    for hook in hooks or []:
+        if isinstance(hook, str):
+            hook = {"name": hook}
+        if not isinstance(hook, dict) or not isinstance(hook.get("name"), str):
+            raise ValueError("A hook must be a name or a dict with a \"name\" "
+                             "field, not {}".format(hook))
+        entries.append(hook)
+    return entries
+
+
+def read_manifest(folder):
+    path = os.path.join(folder, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return {"hooks": [], "arrays": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(folder, manifest):
+    path = os.path.join(folder, MANIFEST_NAME)
+    tmp = "{}.tmp".format(path)
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def save_arrays(folder, arrays):
+    """Saves arrays as npy files in `folder`, each one under the name of its
+    key, so that they can be memory-mapped by `dafter.load`.
+
+    Args:
+        folder (str): The folder of the dataset.
+        arrays (dict): Maps names to numpy arrays.
+
+    Returns:
+        arrays (dict): Maps each name to the "file", "dtype" and "shape" of its
+            npy file, as written in the manifest.
+    """
+    saved = {}
+    for key, array in arrays.items():
+        f_name = "{}.npy".format(key)
+        path = os.path.join(folder, f_name)
+        tmp = "{}.incomplete".format(path)
+        with open(tmp, "wb") as f:
+            numpy.save(f, numpy.ascontiguousarray(array))
+        os.replace(tmp, path)
+        saved[key] = {"file": f_name, "dtype": str(array.dtype),
+                      "shape": list(array.shape)}
+    return saved
+
+
+def run_hooks(folder, hooks):
+    """Runs the post-processing hooks of a downloaded dataset that have not
+    run yet. The hooks that ran and the arrays they wrote are recorded in the
+    "manifest.json" file of the dataset folder.
+
+    Args:
+        folder (str): The folder of the dataset.
+        hooks (list): The "hooks" field of the config.
+
+    Returns:
+        ran (list of str): The names of the hooks run by this call.
+    """
+    entries = get_hook_entries(hooks)
+    if not entries:
+        return []
+
+    manifest = read_manifest(folder)
+    ran = []
+    for entry in entries:
+        if entry in manifest["hooks"]:
+            continue
+        hook = HOOKS.get(entry["name"])
+        if hook is None:
+            raise ValueError("Unknown hook {}, the hooks are {}".format(
+                entry["name"], ", ".join(sorted(HOOKS))))
+        args = {k: v for k, v in entry.items() if k != "name"}
+        manifest["arrays"].update(hook(folder, **args))
+        manifest["hooks"].append(entry)
+        write_manifest(folder, manifest)
+        ran.append(entry["name"])
+    return ran
+
+
+class ArraysUnpickler(pickle.Unpickler):
+    """Only unpickles containers of numpy arrays: the pickles come from the
+    network, any other global is refused"""
+
+    def find_class(self, module, name):
+        if (module, name) not in PICKLE_GLOBALS:
+            raise pickle.UnpicklingError(
+                "{}.{} is not allowed in a pickle of arrays".format(module, name))
+        return super().find_class(module, name)
+
+
+def flatten_arrays(obj, names):
+    """Pairs the nested tuples of arrays `obj` with the nested lists of names
+    `names`"""
+    if isinstance(names, str):
+        return {names: obj}
+    if len(obj) != len(names):
+        raise ValueError("The pickle has {} items where {} names are "
+                         "given".format(len(obj), len(names)))
+    arrays = {}
+    for item, item_names in zip(obj, names):
+        arrays.update(flatten_arrays(item, item_names))
+    return arrays
+
+
+@register_hook("pickle-arrays")
+def pickle_arrays(folder, file, arrays):
+    """Turns a pickle (gzipped or not) of nested tuples of numpy arrays into
+    one npy file per array. The pickle is read once, the later loads are
+    memory maps.
+
+    Args:
+        folder (str): The folder of the dataset.
+        file (str): The name of the pickle, eg. "mnist.pkl.gz". If it has been
+            decompressed by the extraction, the decompressed file is used.
+        arrays (list): The names of the arrays, nested like the tuples of the
+            pickle, eg. [["train_x", "train_y"], ["test_x", "test_y"]].
+    """
+    if numpy is None:
+        raise ImportError("The pickle-arrays hook needs numpy: "
+                          "pip install dafter[convert]")
+
+    path = os.path.join(folder, file)
+    if not os.path.isfile(path) and file.endswith(".gz"):
+        path = os.path.join(folder, get_gz_name(file))
+
+    opener = gzip.open if detect_format(path) == "gz" else open
+    with opener(path, "rb") as f:
+        # Pickled by Python 2
+        obj = ArraysUnpickler(f, encoding="latin1").load()
+
+    return save_arrays(folder, flatten_arrays(obj, arrays))
+
+
+def read_cifar_batches(folder, file, names):
+    """Yields the name and the unpickled content of the CIFAR batches called
+    `names`, from the archive `file` if it is still in `folder`, from the
+    files extracted from it otherwise"""
+    path = os.path.join(folder, file)
+    if os.path.isfile(path):
+        with tarfile.open(path) as tar:
+            for member in tar:
+                name = os.path.basename(member.name)
+                if member.isfile() and name in names:
+                    with tar.extractfile(member) as f:
+                        yield name, ArraysUnpickler(
+                            f, encoding="latin1").load()
+        return
+
+    for root, _, filenames in os.walk(folder):
+        for name in filenames:
+            if name in names:
+                with open(os.path.join(root, name), "rb") as f:
+                    yield name, ArraysUnpickler(f, encoding="latin1").load()
+
+
+@register_hook("cifar-batches")
+def cifar_batches(folder, file, batches, labels="labels"):
+    """Turns the pickled batches of CIFAR into one npy file of images and one
+    of labels per split.
+
+    Args:
+        folder (str): The folder of the dataset.
+        file (str): The archive of the batches, eg. "cifar-10-python.tar.gz".
+            If it has been removed once extracted, the extracted batches are
+            used.
+        batches (dict): The names of the batch files of each split, eg.
+            {"train": ["data_batch_1", ...], "test": ["test_batch"]}.
+        labels (str, optional): The key of the labels in the batches,
+            "fine_labels" for CIFAR-100.
+
+    Returns:
+        arrays (dict): "<split>_x", the uint8 images of shape
+            (n, 3, 32, 32), and "<split>_y", the int64 labels, see
+            `save_arrays`.
+    """
+    if numpy is None:
+        raise ImportError("The cifar-batches hook needs numpy: "
+                          "pip install dafter[convert]")
+
+    names = {name for split in batches.values() for name in split}
+    content = dict(read_cifar_batches(folder, file, names))
+    missing = names - set(content)
+    if missing:
+        raise ValueError("The batches {} are not in {}".format(
+            ", ".join(sorted(missing)), file))
+
+    arrays = {}
+    for split, split_names in batches.items():
+        arrays["{}_x".format(split)] = numpy.concatenate(
+            [content[name]["data"] for name in split_names]).reshape(
+                -1, 3, 32, 32)
+        arrays["{}_y".format(split)] = numpy.concatenate(
+            [numpy.asarray(content[name][labels], dtype=numpy.int64)
+             for name in split_names])
+    return save_arrays(folder, arrays)
@@ -0,0 +1,203 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import json
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .constants import DATASETS_FOLDER
+from .convert import SCHEMA_SUFFIX, TABULAR_TYPES
+from .state import INCOMPLETE
+from .utils import get_config_dataset, get_dataset_status, normalize_name
+
+
+def check_numpy():
+    if numpy is None:
+        raise ImportError("Loading the datasets needs numpy: "
+                          "pip install dafter[convert]")
+
+
+class TextColumn:
+    """A text column of a dataset converted to npy: the utf-8 bytes of all the
+    values in one memory-mapped array, and the offset of each value in
+    another. The values are only decoded when they are read."""
+
+    def __init__(self, offsets, values):
+        self.offsets = offsets
+        self.values = values
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("index {} is out of range".format(i))
+        return bytes(self.values[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return "TextColumn({} values)".format(len(self))
+
+
+def load_npy(path):
+    """Memory-maps a npy file: the pages are read when they are accessed, and
+    shared by all the processes mapping the same file"""
+    check_numpy()
+    return numpy.load(path, mmap_mode="r")
+
+
+def load_converted(folder, schema):
+    """Loads a tabular file converted by `dafter convert`.
+
+    Args:
+        folder (str): The folder of the schema sidecar.
+        schema (dict): The content of the sidecar.
+
+    Returns:
+        data (pyarrow.Table or dict): A table for the parquet and arrow
+            formats, a dict of memory-mapped columns for npy.
+    """
+    path = os.path.join(folder, schema["path"])
+    if schema["format"] == "npy":
+        columns = {}
+        for column in schema["columns"]:
+            files = column["files"]
+            if "data" in files:
+                columns[column["name"]] = load_npy(
+                    os.path.join(path, files["data"]))
+            else:
+                columns[column["name"]] = TextColumn(
+                    load_npy(os.path.join(path, files["offsets"])),
+                    load_npy(os.path.join(path, files["values"])))
+        return columns
+
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Loading {} files needs pyarrow: "
+                          "pip install dafter[convert]".format(schema["format"]))
+    if schema["format"] == "arrow":
+        import pyarrow.ipc
+        return pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all()
+    import pyarrow.parquet
+    return pyarrow.parquet.read_table(path, memory_map=True)
+
+
+class LoadedDataset:
+    """The arrays and tables of a dataset, by name. Each one is only loaded
+    the first time it is accessed, then kept."""
+
+    def __init__(self, name, folder, loaders):
+        """
+        Args:
+            name (str): The name of the dataset.
+            folder (str): The folder of the dataset.
+            loaders (dict): Maps each key to a function loading its value.
+        """
+        self.name = name
+        self.folder = folder
+        self.loaders = loaders
+        self.loaded = {}
+
+    def __getitem__(self, key):
+        if key not in self.loaded:
+            if key not in self.loaders:
+                raise KeyError(key)
+            self.loaded[key] = self.loaders[key]()
+        return self.loaded[key]
+
+    def __contains__(self, key):
+        return key in self.loaders
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.loaders)
+
+    def keys(self):
+        return sorted(self.loaders)
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __repr__(self):
+        return "LoadedDataset({}: {})".format(self.name, ", ".join(self.keys()))
+
+
+def find_loaders(folder):
+    """Lists what can be loaded from a dataset folder.
+
+    Args:
+        folder (str): The folder of the dataset.
+
+    Returns:
+        loaders (dict): Maps each key to a function loading its value. The
+            npy files are named after their path without extension, the
+            converted tabular files after their stem.
+    """
+    loaders = {}
+    for root, dirs, names in os.walk(folder):
+        # The folders of the tabular files converted to npy are loaded through
+        # their schema
+        dirs[:] = [d for d in dirs if not d.endswith("-npy")]
+        for name in names:
+            path = os.path.join(root, name)
+            key = os.path.relpath(path, folder).replace(os.sep, "/")
+            if name.endswith(SCHEMA_SUFFIX):
+                with open(path) as f:
+                    schema = json.load(f)
+                loaders[key[:-len(SCHEMA_SUFFIX)]] = \
+                    lambda root=root, schema=schema: load_converted(root, schema)
+            elif name.endswith(".npy"):
+                loaders[key[:-len(".npy")]] = lambda path=path: load_npy(path)
+    return loaders
+
+
+def load(name, save_path=DATASETS_FOLDER):
+    """Loads a downloaded dataset without reading it: the npy files and the
+    converted tabular files are memory-mapped, so that several processes
+    loading the same dataset share one copy in the page cache.
+
+    Args:
+        name (str): The name of the dataset.
+        save_path (str, optional): The folder of the datasets.
+
+    Returns:
+        dataset (LoadedDataset): The arrays and tables of the dataset, loaded
+            the first time they are accessed.
+
+    Raises:
+        ValueError: If the dataset has not been downloaded, or has nothing that
+            can be loaded.
+    """
+    if not isinstance(name, str):
+        raise ValueError("name must be a str, not {}".format(type(name)))
+
+    config = get_config_dataset(name)
+    name = normalize_name(config["name"] if config else name)
+    folder = os.path.join(save_path, name)
+    if not os.path.isdir(folder) or (save_path == DATASETS_FOLDER and
+                                     get_dataset_status(name) == INCOMPLETE):
+        raise ValueError("{} has not been downloaded: dafter get {}".format(
+            name, name))
+
+    loaders = find_loaders(folder)
+    if not loaders:
+        if config and config.get("type") in TABULAR_TYPES:
+            raise ValueError("{} must be converted first: dafter convert {} "
+                             "--to arrow".format(name, name))
+        raise ValueError("{} has no npy or converted file to load".format(name))
+
+    return LoadedDataset(name, folder, loaders)
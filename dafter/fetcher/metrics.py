@@ -0,0 +1,191 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import json
+import time
+import threading
+
+
+_sinks = []
+_lock = threading.Lock()
+
+
+class JSONLinesSink:
+    """Appends each event to a file, as one JSON object per line"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.f = open(path, "a")
+
+    def emit(self, event):
+        line = json.dumps(event, sort_keys=True)
+        with self.lock:
+            self.f.write(line + "\n")
+            self.f.flush()
+
+    def close(self):
+        with self.lock:
+            self.f.close()
+
+
+class CallbackSink:
+    """Calls a function with each event"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def emit(self, event):
+        self.callback(event)
+
+    def close(self):
+        pass
+
+
+class PrometheusSink:
+    """Aggregates the events into counters written in the Prometheus text
+    format, eg. for the textfile collector of the node exporter. The file is
+    rewritten atomically after each event."""
+
+    # name: (type, help)
+    METRICS = {
+        "dafter_files_total": (
+            "counter", "Files downloaded, by dataset and status."),
+        "dafter_bytes_total": (
+            "counter", "Bytes received, by dataset and host."),
+        "dafter_download_seconds_total": (
+            "counter", "Seconds spent downloading, by dataset and host."),
+        "dafter_retries_total": (
+            "counter", "Requests retried, by host."),
+        "dafter_verify_seconds_total": (
+            "counter", "Seconds spent verifying the checksums, by dataset."),
+        "dafter_ttfb_seconds": (
+            "gauge", "Time to first byte of the last file, by host."),
+        "dafter_dataset_bytes_per_second": (
+            "gauge", "Throughput of the last download, by dataset."),
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.values = {}  # (name, labels): value
+
+    def add(self, name, labels, value, gauge=False):
+        key = (name, tuple(sorted(labels.items())))
+        if gauge:
+            self.values[key] = value
+        else:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def emit(self, event):
+        with self.lock:
+            if event["event"] == "file":
+                dataset, host = event["dataset"], event["host"]
+                self.add("dafter_files_total",
+                         {"dataset": dataset, "status": event["status"]}, 1)
+                labels = {"dataset": dataset, "host": host}
+                self.add("dafter_bytes_total", labels, event["bytes"])
+                self.add("dafter_download_seconds_total", labels,
+                         event["seconds"])
+                self.add("dafter_retries_total", {"host": host},
+                         event.get("retries", 0))
+                if event.get("verify_s") is not None:
+                    self.add("dafter_verify_seconds_total",
+                             {"dataset": dataset}, event["verify_s"])
+                if event.get("ttfb_s") is not None:
+                    self.add("dafter_ttfb_seconds", {"host": host},
+                             event["ttfb_s"], gauge=True)
+            elif event["event"] == "dataset":
+                self.add("dafter_dataset_bytes_per_second",
+                         {"dataset": event["dataset"]},
+                         event["bytes_per_s"], gauge=True)
+            self.write()
+
+    def write(self):
+        lines = []
+        for name, (kind, description) in self.METRICS.items():
+            samples = [(labels, value) for (n, labels), value
+                       in sorted(self.values.items()) if n == name]
+            if not samples:
+                continue
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, value in samples:
+                lines.append("{}{{{}}} {}".format(name, ",".join(
+                    '{}="{}"'.format(k, str(v).replace("\\", "\\\\")
+                                     .replace('"', '\\"'))
+                    for k, v in labels), value))
+        tmp = "{}.tmp".format(self.path)
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.path)
+
+    def close(self):
+        pass
+
+
+def record_response(stats, r, elapsed):
+    """Records the measures of an answer in the stats of a file.
+
+    Args:
+        stats (dict): The stats of the file. "ttfb_s" is the time between the
+            first request and its headers, including the connection to the
+            server if a new one was needed; "retries" the number of requests
+            retried by the session.
+        r (requests.Response): The answer.
+        elapsed (float): The seconds between the request and the headers.
+    """
+    stats.setdefault("ttfb_s", elapsed)
+    retries = getattr(r.raw, "retries", None)
+    history = getattr(retries, "history", None) or ()
+    stats["retries"] = stats.get("retries", 0) + len(history)
+
+
+def open_sink(path):
+    """Returns the sink writing the events to `path`: a Prometheus text file if
+    it ends with ".prom", JSON lines otherwise"""
+    if path.endswith(".prom"):
+        return PrometheusSink(path)
+    return JSONLinesSink(path)
+
+
+def add_sink(sink):
+    """Sends the next events to `sink`, an object with `emit(event)` and
+    `close()` methods, or a function called with each event.
+
+    Returns:
+        sink: The sink added, to give to `remove_sink`.
+    """
+    if callable(sink) and not hasattr(sink, "emit"):
+        sink = CallbackSink(sink)
+    with _lock:
+        _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    """Stops sending the events to `sink`, and closes it"""
+    with _lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+    sink.close()
+
+
+def emit(event, **fields):
+    """Sends an event to all the sinks. Does nothing if there is none.
+
+    Args:
+        event (str): The kind of event: "file" once a file has been
+            downloaded (or failed), "dataset" once all the files of a dataset
+            have been downloaded.
+        **fields: The measures of the event.
+    """
+    if not _sinks:
+        return
+    fields["event"] = event
+    fields["time"] = time.time()
+    with _lock:
+        sinks = list(_sinks)
+    for sink in sinks:
+        sink.emit(fields)
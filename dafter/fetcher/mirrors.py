@@ -0,0 +1,154 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .session import RESUMABLE_ERRORS, get_session
+
+
+PROBE_SIZE = 64 * 1024  # in bytes
+PROBE_TIMEOUT = 10  # in seconds
+# The seconds without receiving any byte after which a source with mirrors is
+# given up for the next one
+STALL_TIMEOUT = 30
+
+# The errors after which the next source is used: the network errors, the
+# error statuses, and the ValueError of a source not sending a range
+FAILOVER_ERRORS = RESUMABLE_ERRORS + (requests.exceptions.HTTPError,
+                                      ValueError)
+
+_lock = threading.Lock()
+_probes = {}  # url: result of `probe`, for the sources that answered
+
+
+def get_sources(url_):
+    """Returns the urls a file of a config can be downloaded from: its "url",
+    then its "mirrors".
+
+    Args:
+        url_ (dict): The entry of the file in the "urls" of the config.
+
+    Returns:
+        sources (list of str): The urls, without duplicates.
+    """
+    sources = [url_["url"]]
+    for mirror in url_.get("mirrors", []):
+        if mirror not in sources:
+            sources.append(mirror)
+    return sources
+
+
+def probe(url, size=PROBE_SIZE, timeout=PROBE_TIMEOUT):
+    """Measures how fast a source sends the first `size` bytes of a file.
+    The source is asked directly, not through the cache, which would fetch
+    the whole file from each source.
+
+    Args:
+        url (str): The url of the file on the source.
+        size (int, optional): The number of bytes asked for.
+        timeout (float, optional): The seconds after which the source is
+            considered down.
+
+    Returns:
+        result (dict): The "latency" (seconds until the headers), the
+            "bytes_per_s" (over the whole probe, latency included) and
+            "ranges" (True if the source sent the range asked for), None if
+            the source did not send the file.
+    """
+    start = time.perf_counter()
+    try:
+        r = get_session().get(url, stream=True, timeout=timeout,
+                              headers={"Range": "bytes=0-{}".format(size - 1)})
+        latency = time.perf_counter() - start
+        if r.status_code not in (200, 206):
+            r.close()
+            return None
+        received = 0
+        for chunk in r.iter_content(16 * 1024):
+            received += len(chunk)
+            if received >= size:
+                break
+        # Only the first bytes of a source ignoring the range are read
+        r.close()
+    except requests.exceptions.RequestException:
+        return None
+    elapsed = time.perf_counter() - start
+    return {"latency": latency,
+            "bytes_per_s": received / elapsed if elapsed > 0 else 0.,
+            "ranges": r.status_code == 206}
+
+
+def rank_sources(sources):
+    """Orders the sources of a file from the fastest one, the sources that
+    send parts of files first. The sources are probed in parallel, once per
+    url and process for the sources that answered, again each time for the
+    others.
+
+    Args:
+        sources (list of str): The urls of the file, see `get_sources`.
+
+    Returns:
+        sources (list of str): The same urls, the sources that did not answer
+            the probe last, in their order of the config.
+    """
+    def get_probe(url):
+        with _lock:
+            if url in _probes:
+                return _probes[url]
+        result = probe(url)
+        if result is not None:
+            with _lock:
+                _probes[url] = result
+        return result
+
+    with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+        results = list(executor.map(get_probe, sources))
+
+    def key(i):
+        result = results[i]
+        if result is None:
+            return (2, 0., i)
+        return (0 if result["ranges"] else 1, -result["bytes_per_s"], i)
+
+    return [sources[i] for i in sorted(range(len(sources)), key=key)]
+
+
+def clear_probes():
+    """Forgets the results of the probes, so that the sources are probed
+    again"""
+    with _lock:
+        _probes.clear()
+
+
+def with_failover(transfer, sources, first=0):
+    """Makes a transfer move to the next source each time it fails.
+
+    Args:
+        transfer (function): Called with the url of the source to use.
+        sources (list of str): The urls of the file, see `rank_sources`.
+        first (int, optional): The index of the first source used.
+
+    Returns:
+        function: Calls `transfer` with the current source. When it fails
+            with one of FAILOVER_ERRORS and there are other sources, the error
+            is raised as a ConnectionError, so that `session.resume_on_error`
+            resumes the transfer from the next source.
+    """
+    current = [first]
+
+    def call():
+        source = sources[current[0] % len(sources)]
+        try:
+            return transfer(source)
+        except FAILOVER_ERRORS as e:
+            if len(sources) == 1:
+                raise
+            current[0] += 1
+            raise ConnectionError("{} failed ({}), moving to {}".format(
+                source, e, sources[current[0] % len(sources)])) from e
+
+    return call
@@ -0,0 +1,239 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import re
+import time
+import datetime
+import threading
+from urllib.parse import urlparse
+
+
+# The bytes a bucket lets through at once after being idle, in seconds of its
+# rate
+DEFAULT_BURST = 1.
+
+_lock = threading.Lock()
+_limits = {
+    "rate": None,  # bytes per second of all the downloads, None if unlimited
+    "per_host": {},  # host: bytes per second
+    "schedule": None,
+}
+_buckets = {}  # host, or None for all the downloads: TokenBucket
+
+
+class TokenBucket:
+    """Lets through `rate` bytes per second, with bursts of up to `burst`
+    seconds of that rate after being idle.
+
+    The bytes are granted in the order they are asked for: the transfers
+    sharing a bucket get the same share of its rate when they read chunks of
+    the same size.
+    """
+
+    def __init__(self, rate, burst=DEFAULT_BURST):
+        """
+        Args:
+            rate (int): The bytes per second.
+            burst (float, optional): The seconds of `rate` let through at once
+                after being idle.
+        """
+        self.rate = None
+        self.burst = burst
+        self.lock = threading.Lock()
+        # The time at which all the bytes granted so far have been let through
+        self.tat = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        if not isinstance(rate, (int, float)) or isinstance(rate, bool) or \
+                rate <= 0:
+            raise ValueError(
+                "rate must be a positive number, not {}".format(rate))
+        with self.lock:
+            self.rate = rate
+
+    def reserve(self, n):
+        """Grants `n` bytes.
+
+        Args:
+            n (int): The number of bytes.
+
+        Returns:
+            delay (float): The seconds to wait before using the bytes.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tat = max(self.tat, now) + n / self.rate
+            return max(0., self.tat - self.burst - now)
+
+
+def parse_time(s):
+    """Parses a time of the day like "09:00" or "9".
+
+    Returns:
+        minutes (int): The minutes since midnight.
+    """
+    match = re.match(r'^\s*(\d{1,2})(?::(\d{2}))?\s*$', s)
+    if match is None or int(match.group(1)) > 24 or \
+            int(match.group(2) or 0) > 59:
+        raise ValueError("Not a valid time : {}".format(s))
+    return (int(match.group(1)) * 60 + int(match.group(2) or 0)) % (24 * 60)
+
+
+def parse_rate(s):
+    """Parses a bytes per second rate like "50M", or "unlimited".
+
+    Returns:
+        rate (int): The bytes per second, None if unlimited.
+    """
+    # utils imports the stream module, which imports this one
+    from .utils import parse_size
+
+    if isinstance(s, str) and s.strip().lower() in ("unlimited", "none",
+                                                     "off"):
+        return None
+    rate = parse_size(s)
+    if rate <= 0:
+        raise ValueError("Not a valid rate : {}".format(s))
+    return rate
+
+
+def parse_schedule(entries):
+    """Parses the windows of the day with their own rate, like
+    "09:00-18:00=5M". A window may go over midnight, eg. "22:00-06:00=1G".
+
+    Args:
+        entries (list of str): The windows.
+
+    Returns:
+        schedule (list of tuple): The (start, end, rate) windows, start and
+            end in minutes since midnight and rate in bytes per second (None
+            if unlimited).
+    """
+    schedule = []
+    for entry in entries:
+        match = re.match(r'^([^-=]+)-([^-=]+)=(.+)$', entry)
+        if match is None:
+            raise ValueError("Not a valid schedule : {}, expected "
+                             "HH:MM-HH:MM=RATE".format(entry))
+        start, end, rate = match.groups()
+        schedule.append((parse_time(start), parse_time(end),
+                         parse_rate(rate)))
+    return schedule
+
+
+def parse_limits(entries):
+    """Parses the rate of all the downloads and the rates of some hosts, like
+    ["50M", "image-net.org=10M"].
+
+    Args:
+        entries (list of str): The rates, "HOST=RATE" for a host.
+
+    Returns:
+        (rate, per_host) (tuple): The rate of all the downloads (None if not
+            given) and a {host: rate} dict.
+    """
+    rate = None
+    per_host = {}
+    for entry in entries:
+        if "=" in entry:
+            host, host_rate = entry.split("=", 1)
+            if not host.strip():
+                raise ValueError("Not a valid host rate : {}".format(entry))
+            per_host[host.strip().lower()] = parse_rate(host_rate)
+        else:
+            rate = parse_rate(entry)
+    return rate, per_host
+
+
+def get_scheduled_rate(schedule, rate, when=None):
+    """Returns the rate of the first window of `schedule` containing `when`,
+    `rate` if there is none.
+
+    Args:
+        schedule (list of tuple): See `parse_schedule`.
+        rate (int): The rate out of the windows, None if unlimited.
+        when (datetime.datetime, optional): The time, now if None.
+    """
+    when = when or datetime.datetime.now()
+    minute = when.hour * 60 + when.minute
+    for start, end, window_rate in schedule or ():
+        if start <= end:
+            inside = start <= minute < end
+        else:
+            inside = minute >= start or minute < end
+        if inside:
+            return window_rate
+    return rate
+
+
+def set_rate_limit(rate=None, per_host=None, schedule=None):
+    """Limits the bandwidth of all the downloads of the process.
+
+    Args:
+        rate (int, optional): The bytes per second of all the downloads
+            together, unlimited if None.
+        per_host (dict, optional): The bytes per second of the downloads from
+            each host, eg. {"image-net.org": 10 * 1024 ** 2}, on top of
+            `rate`.
+        schedule (list of tuple, optional): Replaces `rate` during some hours
+            of the day, see `parse_schedule`.
+    """
+    for value in [rate] + list((per_host or {}).values()) + \
+            [r for _, _, r in schedule or ()]:
+        if value is not None and (not isinstance(value, (int, float)) or
+                                  isinstance(value, bool) or value <= 0):
+            raise ValueError(
+                "rate must be a positive number, not {}".format(value))
+    with _lock:
+        _limits["rate"] = rate
+        _limits["per_host"] = {host.lower(): host_rate for host, host_rate
+                               in (per_host or {}).items()}
+        _limits["schedule"] = schedule
+        _buckets.clear()
+
+
+def _get_bucket(key, rate):
+    if rate is None:
+        return None
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(rate)
+    if bucket.rate != rate:
+        # The schedule changed the rate
+        bucket.set_rate(rate)
+    return bucket
+
+
+def reserve(url, n):
+    """Grants `n` bytes received from `url` under the global and per host
+    rates.
+
+    Returns:
+        delay (float): The seconds to wait before receiving more bytes.
+    """
+    if _limits["rate"] is None and not _limits["per_host"] and \
+            not _limits["schedule"]:
+        return 0.
+    delay = 0.
+    rate = get_scheduled_rate(_limits["schedule"], _limits["rate"])
+    bucket = _get_bucket(None, rate)
+    if bucket is not None:
+        delay = bucket.reserve(n)
+    # The hosts are given with or without their port
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    if host not in _limits["per_host"]:
+        host = parsed.hostname
+    bucket = _get_bucket(host, _limits["per_host"].get(host))
+    if bucket is not None:
+        delay = max(delay, bucket.reserve(n))
+    return delay
+
+
+def throttle(url, n):
+    """Waits until `n` more bytes can be received from `url`, see `reserve`"""
+    delay = reserve(url, n)
+    if delay > 0:
+        time.sleep(delay)
@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import time
+import threading
+from urllib.parse import urlparse
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .stream import DEFAULT_CHUNK_SIZE
+
+
+DEFAULT_PER_HOST = 4  # number of files downloaded at the same time per host
+ORDERS = ("size", "host", "config")
+
+
+def get_host(url):
+    return urlparse(url).netloc.lower()
+
+
+def order_tasks(tasks, order):
+    """Orders the files to download.
+
+    Args:
+        tasks (list of tuple): The (dataset, task) pairs to download.
+        order (str): "size" puts the largest files first (the files whose size
+            is unknown come last), "host" alternates between the hosts so that
+            no host gets all the first connections, "config" keeps the order
+            of the configs.
+
+    Returns:
+        tasks (list of tuple): The ordered (dataset, task) pairs.
+    """
+    if order == "size":
+        return sorted(tasks, key=lambda t: -(t[1]["total_bytes"] or -1))
+
+    if order == "host":
+        by_host = OrderedDict()
+        for t in tasks:
+            by_host.setdefault(get_host(t[1]["url"]), []).append(t)
+        ordered = []
+        queues = list(by_host.values())
+        while queues:
+            for q in queues:
+                ordered.append(q.pop(0))
+            queues = [q for q in queues if q]
+        return ordered
+
+    return list(tasks)
+
+
+class Scheduler:
+    """Downloads the files of several datasets with a global limit of files
+    downloaded at the same time and a limit per host"""
+
+    def __init__(self, jobs=4, per_host=DEFAULT_PER_HOST, order="size",
+                 segments=1, chunk_size=DEFAULT_CHUNK_SIZE, use_readinto=False,
+                 stream_extract=False, keep_archive=True):
+        """
+        Args:
+            jobs (int, optional): The number of files downloaded at the same
+                time, all hosts included.
+            per_host (int, optional): The number of files downloaded at the
+                same time from the same host. No limit if None.
+            order (str, optional): The order of the downloads, see
+                `order_tasks`.
+            segments (int, optional): The number of connections used for each
+                file.
+            chunk_size (int, optional): The number of bytes written to the
+                disk at once.
+            use_readinto (bool, optional): Reads the network into one reusable
+                buffer for each file.
+            stream_extract (bool, optional): Extracts the tar, tar.gz and gz
+                archives while they are downloaded.
+            keep_archive (bool, optional): Also stores the archives extracted
+                while they are downloaded.
+        """
+        if not isinstance(jobs, int) or isinstance(jobs, bool) or jobs < 1:
+            raise ValueError("jobs must be a positive int, not {}".format(jobs))
+        if per_host is not None and (not isinstance(per_host, int) or
+                                     isinstance(per_host, bool) or
+                                     per_host < 1):
+            raise ValueError(
+                "per_host must be a positive int, not {}".format(per_host))
+        if order not in ORDERS:
+            raise ValueError("order must be one of {}, not {}".format(
+                ", ".join(ORDERS), order))
+
+        self.jobs = jobs
+        self.per_host = per_host
+        self.order = order
+        self.segments = segments
+        self.chunk_size = chunk_size
+        self.use_readinto = use_readinto
+        self.stream_extract = stream_extract
+        self.keep_archive = keep_archive
+        self.tasks = []
+
+    def add(self, dataset):
+        """Adds the files of `dataset` that still have to be downloaded"""
+        for task in dataset._pending_files():
+            self.tasks.append((dataset, task))
+
+    def run(self, fail_fast=True):
+        """Downloads all the files added to the scheduler. Once all its files
+        have been tried, a "dataset" event is sent to the metrics sinks for
+        each dataset, see `Dataset._emit_dataset`.
+
+        Args:
+            fail_fast (bool, optional): If True, the first error stops all the
+                downloads and is raised. Otherwise, the errors are returned
+                and the other files are still downloaded.
+
+        Returns:
+            stats (dict): "files" is the number of downloaded files, "bytes"
+                the number of bytes received, "seconds" the duration of the
+                run, "bytes_per_second" the throughput and "errors" a list of
+                (dataset, task, exception) tuples.
+        """
+        pending = order_tasks(self.tasks, self.order)
+        self.tasks = []
+
+        stats = {"files": 0, "bytes": 0, "seconds": 0.,
+                 "bytes_per_second": 0., "errors": []}
+        if not pending:
+            return stats
+
+        from .session import reserve_connections
+
+        jobs = min(self.jobs, len(pending))
+        per_host = self.per_host or jobs
+        reserve_connections(min(jobs, per_host) * self.segments)
+
+        # With a single job, the progress bars stay on the screen
+        positions = [None] if jobs == 1 else list(range(jobs))
+        positions_lock = threading.Lock()
+        cancel = threading.Event()
+        running_per_host = Counter()
+        start = time.time()
+
+        # id(dataset): [dataset, tasks, first start, last end, files left]
+        datasets = OrderedDict()
+        for dataset, task in pending:
+            entry = datasets.setdefault(id(dataset),
+                                        [dataset, [], None, None, 0])
+            entry[1].append(task)
+            entry[4] += 1
+
+        def worker(dataset, task):
+            with positions_lock:
+                position = positions.pop(0)
+            try:
+                return dataset._fetch(task, segments=self.segments,
+                                      position=position, cancel=cancel,
+                                      chunk_size=self.chunk_size,
+                                      use_readinto=self.use_readinto,
+                                      stream_extract=self.stream_extract,
+                                      keep_archive=self.keep_archive)
+            finally:
+                with positions_lock:
+                    positions.append(position)
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            running = {}
+            try:
+                while pending or running:
+                    # Starts the first files whose host is not saturated
+                    i = 0
+                    while len(running) < jobs and i < len(pending):
+                        dataset, task = pending[i]
+                        host = get_host(task["url"])
+                        if running_per_host[host] >= per_host:
+                            i += 1
+                            continue
+                        pending.pop(i)
+                        running_per_host[host] += 1
+                        entry = datasets[id(dataset)]
+                        if entry[2] is None:
+                            entry[2] = time.perf_counter()
+                        future = executor.submit(worker, dataset, task)
+                        running[future] = (dataset, task, host)
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        dataset, task, host = running.pop(future)
+                        running_per_host[host] -= 1
+                        try:
+                            stats["bytes"] += future.result()
+                            stats["files"] += 1
+                        except Exception as e:
+                            if fail_fast:
+                                raise
+                            stats["errors"].append((dataset, task, e))
+                        entry = datasets[id(dataset)]
+                        entry[3] = time.perf_counter()
+                        entry[4] -= 1
+                        if not entry[4]:
+                            dataset._emit_dataset(entry[1],
+                                                  entry[3] - entry[2])
+            except BaseException:
+                # Stops the transfers in progress, the ".incomplete" files are
+                # kept so that the download can be resumed
+                cancel.set()
+                for future in running:
+                    future.cancel()
+                raise
+
+        stats["seconds"] = time.time() - start
+        if stats["seconds"] > 0:
+            stats["bytes_per_second"] = stats["bytes"] / stats["seconds"]
+        return stats
+
+
+def format_stats(stats):
+    """Returns a one line summary of the stats returned by `Scheduler.run`"""
+    from tqdm import tqdm
+
+    return "{} files, {} in {:.1f}s ({}){}".format(
+        stats["files"],
+        tqdm.format_sizeof(stats["bytes"], "B", 1024),
+        stats["seconds"],
+        tqdm.format_sizeof(stats["bytes_per_second"], "B/s", 1024),
+        ", {} failed".format(len(stats["errors"])) if stats["errors"] else "")
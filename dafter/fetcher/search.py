@@ -0,0 +1,161 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import re
+import threading
+from collections import defaultdict
+
+from .catalog import get_catalog
+
+
+FUZZY_THRESHOLD = 0.4  # minimal score of a fuzzy match, between 0 and 1
+NAME_WEIGHT = 2  # a trigram found in the name counts more than in the text
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def get_trigrams(s):
+    """Returns the set of the substrings of length 3 of `s`"""
+    return {s[i:i+3] for i in range(len(s) - 2)}
+
+
+def get_word_trigrams(s):
+    """Returns the trigrams of the lowercased words of `s`, each word being
+    padded with spaces so that short words and word boundaries count"""
+    grams = set()
+    for word in re.findall(r"\w+", s.lower()):
+        grams |= get_trigrams(" {} ".format(word))
+    return grams
+
+
+def iter_bits(bitset):
+    """Yields the position of every bit set in the int `bitset`"""
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+class SearchIndex:
+    """Inverted indexes over the catalog of datasets.
+
+    Each dataset gets an id, and every posting list is a bitset stored in a
+    Python int: matching several tags or several trigrams is a bitwise AND.
+    """
+
+    def __init__(self, catalog):
+        """
+        Args:
+            catalog (dict): The catalog returned by `get_catalog`.
+        """
+        self.configs = list(catalog["configs"].values())
+        self.names = [c.get("name", "") for c in self.configs]
+        self.all = (1 << len(self.configs)) - 1
+
+        self.tags = defaultdict(int)
+        self.name_grams = defaultdict(int)
+        self.fuzzy_name_grams = defaultdict(int)
+        self.fuzzy_text_grams = defaultdict(int)
+
+        for i, config in enumerate(self.configs):
+            bit = 1 << i
+            for tag in config.get("tags", []):
+                self.tags[tag] |= bit
+            for gram in get_trigrams(self.names[i]):
+                self.name_grams[gram] |= bit
+            for gram in get_word_trigrams(self.names[i].replace("-", " ")):
+                self.fuzzy_name_grams[gram] |= bit
+            for gram in get_word_trigrams(config.get("description") or ""):
+                self.fuzzy_text_grams[gram] |= bit
+
+    def filter_tags(self, tags):
+        """Returns the bitset of the datasets having all the `tags`"""
+        bitset = self.all
+        for tag in tags or []:
+            bitset &= self.tags.get(tag, 0)
+            if not bitset:
+                break
+        return bitset
+
+    def match(self, name=None, tags=None):
+        """Finds the datasets whose name contains `name` and that have all the
+        `tags`.
+
+        Args:
+            name (str, optional): A substring of the names of the datasets.
+            tags (list of str, optional): The tags.
+
+        Returns:
+            configs (list of dict): The configs of the matching datasets,
+                sorted by name.
+        """
+        bitset = self.filter_tags(tags)
+
+        if name:
+            # Only the names having all the trigrams of `name` can contain it
+            for gram in get_trigrams(name):
+                bitset &= self.name_grams.get(gram, 0)
+                if not bitset:
+                    break
+            ids = [i for i in iter_bits(bitset) if name in self.names[i]]
+        elif bitset == self.all:
+            ids = range(len(self.configs))
+        else:
+            ids = list(iter_bits(bitset))
+
+        return sorted((self.configs[i] for i in ids), key=lambda c: c["name"])
+
+    def fuzzy(self, query, tags=None, threshold=FUZZY_THRESHOLD, limit=None):
+        """Ranks the datasets by similarity between `query` and their name and
+        description.
+
+        Args:
+            query (str): The words to look for.
+            tags (list of str, optional): The datasets must have all these
+                tags.
+            threshold (float, optional): The minimal score of the results.
+            limit (int, optional): The maximal number of results.
+
+        Returns:
+            results (list of tuple): (score, config) tuples, best first. The
+                score is between 0 and 1.
+        """
+        allowed = self.filter_tags(tags)
+        grams = get_word_trigrams(query)
+        if not grams or not allowed:
+            return []
+
+        scores = defaultdict(int)
+        for gram in grams:
+            for i in iter_bits(self.fuzzy_name_grams.get(gram, 0) & allowed):
+                scores[i] += NAME_WEIGHT
+            for i in iter_bits(self.fuzzy_text_grams.get(gram, 0) & allowed):
+                scores[i] += 1
+
+        # A dataset whose name has all the trigrams of the query scores 1. The
+        # ties are broken by the matches in the description, then by the
+        # shortest name.
+        max_score = float(NAME_WEIGHT * len(grams))
+        results = [(s, i) for i, s in scores.items()
+                   if s / max_score >= threshold]
+        results.sort(key=lambda r: (-r[0], len(self.names[r[1]]),
+                                    self.names[r[1]]))
+        if limit is not None:
+            results = results[:limit]
+        return [(min(1., s / max_score), self.configs[i]) for s, i in results]
+
+
+def get_search_index(catalog=None):
+    """Returns the search index of `catalog` (by default, the catalog of all
+    the dataset configs). The index is built once per catalog."""
+    if catalog is None:
+        catalog = get_catalog()
+
+    with _lock:
+        cached = _cache.get("index")
+        if cached is not None and cached[0] is catalog:
+            return cached[1]
+        index = SearchIndex(catalog)
+        _cache["index"] = (catalog, index)
+        return index
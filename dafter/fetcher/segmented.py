@@ -0,0 +1,274 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+from .metrics import record_response
+from .mirrors import STALL_TIMEOUT, with_failover
+from .session import get_session, get_validators, resume_on_error, \
+    via_cache
+from .stream import DEFAULT_CHUNK_SIZE, DEFAULT_BUFFER_SIZE, ThrottledProgress, \
+    copy_response
+
+
+MIN_SEGMENT_SIZE = 1024 * 1024  # in bytes
+SIDECAR_SAVE_INTERVAL = 1  # in seconds
+
+
+def get_sidecar_path(dst):
+    """Returns the path of the file recording the progress of the segments of
+    `dst`"""
+    return "{}.segments".format(dst)
+
+
+def accepts_ranges(url):
+    """Sends a HEAD request to know if the server can send parts of the file.
+
+    Args:
+        url (str): The url of the file.
+
+    Returns:
+        (accept_ranges, total_bytes) (tuple): accept_ranges (bool) is True if
+            the server answers "Accept-Ranges: bytes", total_bytes (int) is the
+            size of the file, or None if the server does not send it.
+    """
+    r = get_session().head(via_cache(url), allow_redirects=True)
+    headers = r.headers
+
+    total_bytes = None
+    if "Content-Length" in headers:
+        total_bytes = int(headers["Content-Length"])
+
+    accept_ranges = headers.get("Accept-Ranges", "").lower() == "bytes"
+    return accept_ranges, total_bytes
+
+
+def split_segments(total_bytes, segments):
+    """Splits `total_bytes` bytes into `segments` contiguous byte ranges.
+
+    Args:
+        total_bytes (int): The size of the file.
+        segments (int): The maximal number of segments. Segments are never
+            smaller than MIN_SEGMENT_SIZE.
+
+    Returns:
+        segments (list of list): One [start, end, done] list per segment, where
+            start and end are inclusive and done is the number of bytes of the
+            segment already downloaded.
+    """
+    segments = max(1, min(segments, total_bytes // MIN_SEGMENT_SIZE))
+    size = total_bytes // segments
+
+    ranges = []
+    for i in range(segments):
+        start = i * size
+        end = total_bytes - 1 if i == segments - 1 else start + size - 1
+        ranges.append([start, end, 0])
+    return ranges
+
+
+def load_sidecar(dst):
+    """Loads the segments progress of `dst`, or None if there is none"""
+    sidecar = get_sidecar_path(dst)
+    if not os.path.isfile(sidecar):
+        return None
+    try:
+        with open(sidecar) as f:
+            return json.load(f)
+    except ValueError:
+        return None
+
+
+def save_sidecar(dst, state):
+    """Atomically writes the segments progress of `dst`"""
+    sidecar = get_sidecar_path(dst)
+    tmp = "{}.tmp".format(sidecar)
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, sidecar)
+
+
+def download_segmented(url, dst, total_bytes=None, segments=4, desc=None,
+                       position=None, cancel=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE, use_readinto=False,
+                       hasher=None, validators=None, stats=None,
+                       sources=None):
+    """Downloads a file over several connections, each one fetching its own
+    byte range into a preallocated file.
+
+    The progress of each segment is recorded in a sidecar file next to `dst`,
+    so that every segment resumes on its own after an interruption. A segment
+    whose connection drops is resumed right away, see
+    `session.resume_on_error`. With several sources, the segments are spread
+    over them, and a segment moves to the next source when its source fails
+    or stalls.
+
+    Args:
+        url (str): The url of the file to download. The progress recorded for
+            another url is not resumed.
+        dst (str): The path where the downloaded file will be stored.
+        total_bytes (int, optional): The expected size of the file.
+        segments (int, optional): The number of parallel connections.
+        desc (str, optional): The description of the progress bar.
+        position (int, optional): The line of the progress bar.
+        cancel (threading.Event, optional): When set by another thread, the
+            download stops and KeyboardInterrupt is raised.
+        chunk_size (int, optional): The number of bytes read from the network
+            and written to the disk at once.
+        use_readinto (bool, optional): Reads the network into one reusable
+            buffer for each segment.
+        hasher (FileHasher, optional): Computes the checksums of the file.
+            The first segment is hashed while it is received, the next ones
+            are read back in order as soon as they are complete, while the
+            last segments are still being downloaded.
+        validators (dict, optional): Updated with the ETag and Last-Modified
+            headers of the answers, see `session.get_validators`.
+        stats (dict, optional): Updated with the time to first byte of the
+            first answer and the retries of all the segments, see
+            `metrics.record_response`.
+        sources (list of str, optional): The urls to download the file from,
+            fastest first, see `mirrors.rank_sources`. Only `url` by default.
+
+    Returns:
+        bool (bool): False if the file cannot be downloaded by segments (the
+            server does not accept ranges or does not send the file size),
+            True once the file is complete.
+    """
+    sources = sources or [url]
+    # A mirror sending nothing for a while is given up for the next one
+    timeout = STALL_TIMEOUT if len(sources) > 1 else None
+
+    state = load_sidecar(dst)
+    if state is None or state.get("url") != url or not os.path.isfile(dst):
+        accept_ranges, remote_bytes = accepts_ranges(sources[0])
+        if not accept_ranges or not remote_bytes:
+            return False
+        if total_bytes and total_bytes != remote_bytes:
+            raise ValueError("The server announces {} bytes for {} instead of "
+                             "{}".format(remote_bytes, url, total_bytes))
+
+        state = {
+            "url": url,
+            "total_bytes": remote_bytes,
+            "segments": split_segments(remote_bytes, segments),
+        }
+
+        # Sparse file: the blocks are only allocated when they are written
+        with open(dst, "wb") as f:
+            f.truncate(remote_bytes)
+        save_sidecar(dst, state)
+
+    total_bytes = state["total_bytes"]
+    ranges = state["segments"]
+
+    lock = threading.Lock()
+    stop = threading.Event()
+    progress = ThrottledProgress(
+        tqdm(total=total_bytes, initial=sum(s[2] for s in ranges), unit='B',
+             unit_scale=True, desc=desc, position=position,
+             leave=position is None))
+
+    class Stopper:
+        """Set when another segment failed or when the download is cancelled"""
+        def is_set(self):
+            return stop.is_set() or (cancel is not None and cancel.is_set())
+
+    class SegmentProgress:
+        """Records the progress of a segment in the sidecar file every
+        SIDECAR_SAVE_INTERVAL seconds"""
+
+        def __init__(self, segment, f):
+            self.segment = segment
+            self.f = f
+            self.done = segment[2]
+            self.last_save = time.time()
+
+        def update(self, n):
+            self.done += n
+            with lock:
+                progress.update(n)
+            if time.time() - self.last_save > SIDECAR_SAVE_INTERVAL:
+                self.save()
+
+        def save(self):
+            # The bytes must be on the disk before being recorded
+            self.f.flush()
+            with lock:
+                self.segment[2] = self.done
+                save_sidecar(dst, state)
+            self.last_save = time.time()
+
+    def fetch_segment(segment, source):
+        start, end, done = segment
+        if start + done > end:
+            return
+
+        headers = {'Range': 'bytes=%s-%s' % (start + done, end)}
+        request_start = time.perf_counter()
+        r = get_session().get(via_cache(source), headers=headers, stream=True,
+                              timeout=timeout)
+        if stats is not None:
+            with lock:
+                record_response(stats, r, time.perf_counter() - request_start)
+        if r.status_code != 206:
+            raise ValueError("The server did not send the range {} of "
+                             "{}".format(headers['Range'], source))
+        if validators is not None and source == url:
+            validators.update(get_validators(r.headers))
+
+        # Only the first segment arrives in the order of the file
+        inline_hasher = hasher if segment is ranges[0] else None
+        if inline_hasher is not None:
+            inline_hasher.catch_up(dst, start + done)
+
+        with open(dst, "r+b", buffering=max(chunk_size, DEFAULT_BUFFER_SIZE)) as f:
+            f.seek(start + done)
+            segment_progress = SegmentProgress(segment, f)
+            try:
+                copy_response(r, f, chunk_size, use_readinto, segment_progress,
+                              Stopper(), limit=end + 1 - start - done,
+                              hasher=inline_hasher, url=source)
+            finally:
+                segment_progress.save()
+
+        if start + segment[2] <= end:
+            raise ConnectionError("The connection closed before the end of "
+                                  "the range {} of {}".format(headers['Range'],
+                                                              source))
+
+    def fetch_segment_resumed(segment):
+        # A segment interrupted by the network is resumed on its own, the
+        # segments start on different sources
+        transfer = with_failover(lambda source: fetch_segment(segment, source),
+                                 sources, ranges.index(segment))
+        resume_on_error(transfer, lambda: segment[2], Stopper())
+
+    def hash_segments():
+        # Hashes the complete segments that follow the hashed part of the file
+        for (start, end, done), future in zip(ranges, futures):
+            if not future.done() or start + done <= end:
+                break
+            hasher.catch_up(dst, end + 1, chunk_size)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [executor.submit(fetch_segment_resumed, s)
+                       for s in ranges]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    if hasher is not None:
+                        hash_segments()
+            except BaseException:
+                stop.set()
+                raise
+    finally:
+        progress.close()
+
+    os.remove(get_sidecar_path(dst))
+    return True
@@ -0,0 +1,240 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import time
+import random
+import threading
+import http.client
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+DEFAULT_POOL_CONNECTIONS = 10  # number of hosts whose connections are kept
+DEFAULT_POOL_MAXSIZE = 16  # number of connections kept for each host
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5  # in seconds
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_RESUMES = 5
+MAX_BACKOFF = 60  # in seconds
+
+# The errors of a transfer interrupted by the network, that is resumed from
+# the bytes already received
+RESUMABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.ReadTimeoutError,
+    http.client.IncompleteRead,
+    ConnectionError,
+    TimeoutError,
+)
+
+# The url of a `dafter serve-cache` server the files are downloaded through
+CACHE_URL_ENV = "DAFTER_CACHE_URL"
+
+_session = None
+_settings = {
+    "pool_connections": DEFAULT_POOL_CONNECTIONS,
+    "pool_maxsize": DEFAULT_POOL_MAXSIZE,
+    "retries": DEFAULT_RETRIES,
+    "backoff_factor": DEFAULT_BACKOFF_FACTOR,
+    "resumes": DEFAULT_RESUMES,
+}
+_lock = threading.Lock()
+_cache_url = os.environ.get(CACHE_URL_ENV) or None
+
+
+def _build_session():
+    retry = Retry(total=_settings["retries"],
+                  backoff_factor=_settings["backoff_factor"],
+                  status_forcelist=RETRY_STATUSES,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=_settings["pool_connections"],
+                          pool_maxsize=_settings["pool_maxsize"],
+                          max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """Returns the HTTP session shared by all the requests of dafter.
+
+    The session keeps the connections alive in one pool per host, so that the
+    files of a dataset hosted on the same server reuse the same connections
+    instead of doing a new TCP/TLS handshake for each request.
+
+    Returns:
+        session (requests.Session): The shared session.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+
+def configure_session(pool_connections=None, pool_maxsize=None, retries=None,
+                      backoff_factor=None, resumes=None):
+    """Changes the settings of the shared session. The session is rebuilt the
+    next time it is used, only if a setting changed.
+
+    Args:
+        pool_connections (int, optional): The number of hosts whose
+            connections are kept alive.
+        pool_maxsize (int, optional): The number of connections kept alive for
+            each host.
+        retries (int, optional): The number of times a failed connection or a
+            request answered with a 429 or 5xx status is retried.
+        backoff_factor (float, optional): The retries wait
+            backoff_factor * 2 ** (retry number - 1) seconds.
+        resumes (int, optional): The number of times a transfer interrupted
+            by the network is resumed without receiving any new byte, see
+            `resume_on_error`.
+    """
+    global _session
+
+    settings = {
+        "pool_connections": pool_connections,
+        "pool_maxsize": pool_maxsize,
+        "retries": retries,
+        "backoff_factor": backoff_factor,
+        "resumes": resumes,
+    }
+    for key, value in settings.items():
+        if value is None:
+            continue
+        if not isinstance(value, (int, float)) or isinstance(value, bool) \
+                or value < 0:
+            raise ValueError(
+                "{} must be a positive number, not {}".format(key, value))
+        if key in ("pool_connections", "pool_maxsize") and value < 1:
+            raise ValueError("{} must be at least 1".format(key))
+
+    with _lock:
+        changed = False
+        for key, value in settings.items():
+            if value is not None and _settings[key] != value:
+                _settings[key] = value
+                # The session does not depend on the resumes
+                changed = changed or key != "resumes"
+        if changed and _session is not None:
+            _session.close()
+            _session = None
+
+
+def reserve_connections(n):
+    """Makes sure `n` connections to the same host can be kept alive at the
+    same time.
+
+    Args:
+        n (int): The number of simultaneous connections.
+    """
+    if n > _settings["pool_maxsize"]:
+        configure_session(pool_maxsize=n)
+
+
+def get_backoff(attempt):
+    """Returns the seconds to wait before the attempt number `attempt` to
+    resume a transfer: backoff_factor * 2 ** (attempt - 1), at most
+    MAX_BACKOFF, multiplied by a random factor between 0.5 and 1.5 so that the
+    transfers interrupted at the same time do not all come back at once.
+    Returns None once all the attempts have been made.
+    """
+    if attempt > _settings["resumes"]:
+        return None
+    delay = min(_settings["backoff_factor"] * 2 ** (attempt - 1), MAX_BACKOFF)
+    return delay * random.uniform(0.5, 1.5)
+
+
+def resume_on_error(transfer, get_offset, cancel=None):
+    """Calls `transfer` until it succeeds, waiting `get_backoff` seconds after
+    each error in `RESUMABLE_ERRORS`. The number of attempts is reset each
+    time the transfer makes some progress, so a long download over a flaky
+    network is not given up as long as it moves forward.
+
+    Args:
+        transfer (function): Resumes the transfer from the bytes already
+            received.
+        get_offset (function): Returns the number of bytes received so far.
+        cancel (threading.Event, optional): No attempt is made once it is set.
+
+    Returns:
+        result: The return value of `transfer`.
+    """
+    attempt = 0
+    offset = get_offset()
+    while True:
+        try:
+            return transfer()
+        except RESUMABLE_ERRORS as e:
+            if cancel is not None and cancel.is_set():
+                raise
+            if e.args and isinstance(e.args[0],
+                                     urllib3.exceptions.MaxRetryError):
+                # The request could not be sent, and has already been retried
+                # by the session
+                raise
+            new_offset = get_offset()
+            if new_offset > offset:
+                attempt = 0
+            offset = new_offset
+            attempt += 1
+            delay = get_backoff(attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+
+def close_session():
+    """Closes all the connections of the shared session"""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_validators(headers):
+    """Returns the ETag and Last-Modified headers of an answer, that tell the
+    server which version of the file has been downloaded.
+
+    Args:
+        headers (dict): The headers of the answer.
+
+    Returns:
+        validators (dict): The "etag" and "last_modified" headers, None if
+            the server did not send them.
+    """
+    return {"etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified")}
+
+
+def set_cache_url(cache_url):
+    """Downloads the files through a `dafter serve-cache` server, or directly
+    if `cache_url` is None. The default is the DAFTER_CACHE_URL environment
+    variable.
+
+    Args:
+        cache_url (str): The url of the cache, eg. "http://cache:8080".
+    """
+    global _cache_url
+    if cache_url is not None and (not isinstance(cache_url, str) or
+                                  not cache_url.startswith(("http://",
+                                                            "https://"))):
+        raise ValueError("Not a valid cache url : {}".format(cache_url))
+    _cache_url = cache_url
+
+
+def via_cache(url):
+    """Returns the url to download `url` from: the url of the file on the
+    cache server if there is one, `url` itself otherwise."""
+    if _cache_url is None:
+        return url
+    return "{}/{}".format(_cache_url.rstrip("/"), url)
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import time
+import sqlite3
+import threading
+
+from .constants import DATASETS_FOLDER, STATE_DB_NAME
+
+
+INCOMPLETE = "incomplete"
+COMPLETE = "complete"
+CORRUPT = "corrupt"
+EXTRACTED = "extracted"  # complete, and the archive has been extracted
+
+_states = {}  # Opened databases, by path
+_lock = threading.Lock()
+
+
+class StateDB:
+    """Records the status, size, checksum and HTTP validators of every
+    downloaded file in a SQLite database, so that knowing the status of a
+    dataset is a single indexed read instead of listing its folder"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            dataset TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            status TEXT NOT NULL,
+            size INTEGER,
+            checksum TEXT,
+            updated REAL NOT NULL,
+            PRIMARY KEY (dataset, filename)
+        )
+    """
+
+    # The statements bringing the database from the version i (its
+    # "user_version") to the version i + 1
+    MIGRATIONS = [
+        "ALTER TABLE files ADD COLUMN etag TEXT",
+        "ALTER TABLE files ADD COLUMN last_modified TEXT",
+    ]
+
+    # The validators are kept when a record is replaced without them
+    UPSERT = """
+        INSERT INTO files (dataset, filename, status, size, checksum, updated,
+                           etag, last_modified)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (dataset, filename) DO UPDATE SET
+            status = excluded.status,
+            size = excluded.size,
+            checksum = excluded.checksum,
+            updated = excluded.updated,
+            etag = COALESCE(excluded.etag, etag),
+            last_modified = COALESCE(excluded.last_modified, last_modified)
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The path of the SQLite database, created if needed.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        # The downloads update the database from several threads, the lock
+        # serializes them
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute(self.SCHEMA)
+        self.migrate()
+
+    def migrate(self):
+        """Brings a database created by an older version of dafter to the
+        current schema"""
+        with self.lock, self.conn:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            for statement in self.MIGRATIONS[version:]:
+                self.conn.execute(statement)
+            # PRAGMA does not accept parameters
+            self.conn.execute(
+                "PRAGMA user_version = {:d}".format(len(self.MIGRATIONS)))
+
+    def set_file(self, dataset, filename, status, size=None, checksum=None,
+                 etag=None, last_modified=None):
+        """Records the status of a file of a dataset.
+
+        Args:
+            dataset (str): The normalized name of the dataset.
+            filename (str): The name of the file in the dataset folder.
+            status (str): INCOMPLETE, COMPLETE, CORRUPT or EXTRACTED.
+            size (int, optional): The size of the file, in bytes.
+            checksum (str, optional): The checksum of the file.
+            etag (str, optional): The ETag header sent with the file.
+            last_modified (str, optional): The Last-Modified header sent with
+                the file. The recorded validators are kept if None.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(self.UPSERT, (dataset, filename, status, size,
+                                            checksum, time.time(), etag,
+                                            last_modified))
+
+    def set_files(self, dataset, files):
+        """Replaces all the records of a dataset in one transaction. The
+        validators of the files still recorded are kept.
+
+        Args:
+            dataset (str): The normalized name of the dataset.
+            files (list of tuple): (filename, status, size, checksum) tuples.
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                self.UPSERT, [(dataset,) + tuple(f) + (now, None, None)
+                              for f in files])
+            self.conn.execute(
+                "DELETE FROM files WHERE dataset = ? AND updated != ?",
+                (dataset, now))
+
+    def get_files(self, dataset):
+        """Returns the records of the files of a dataset.
+
+        Args:
+            dataset (str): The normalized name of the dataset.
+
+        Returns:
+            files (dict): Maps each filename to a dict with the "status",
+                "size", "checksum", "updated", "etag" and "last_modified"
+                fields.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT filename, status, size, checksum, updated, etag, "
+                "last_modified FROM files WHERE dataset = ?",
+                (dataset,)).fetchall()
+        return {row["filename"]: dict(row) for row in rows}
+
+    def get_status(self, dataset):
+        """Returns COMPLETE if all the files of the dataset are complete (or
+        extracted), INCOMPLETE if one of them is not, and None if the dataset
+        is unknown"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*), SUM(status NOT IN (?, ?)) FROM files "
+                "WHERE dataset = ?", (COMPLETE, EXTRACTED, dataset)).fetchone()
+        if not row[0]:
+            return None
+        return INCOMPLETE if row[1] else COMPLETE
+
+    def delete_dataset(self, dataset):
+        """Forgets all the files of a dataset"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM files WHERE dataset = ?", (dataset,))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def get_state(save_path=DATASETS_FOLDER):
+    """Returns the state database of the datasets saved in `save_path`, or
+    None if the folder does not exist.
+
+    Args:
+        save_path (str, optional): The folder of the datasets.
+
+    Returns:
+        state (StateDB): The state database, opened once per process.
+    """
+    path = os.path.join(save_path, STATE_DB_NAME)
+    with _lock:
+        state = _states.get(path)
+        if state is None:
+            if not os.path.isdir(save_path):
+                return None
+            try:
+                state = StateDB(path)
+            except sqlite3.Error:
+                return None
+            _states[path] = state
+        return state
+
+
+def close_states():
+    """Closes all the opened state databases"""
+    with _lock:
+        for state in _states.values():
+            state.close()
+        _states.clear()
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+OBJECTS_FOLDER_NAME = ".objects"
+
+# The algorithm whose digest names the objects
+STORE_ALGORITHM = "sha256"
+
+# ioctl(dst, FICLONE, src) shares the blocks of src with dst on the file
+# systems that support it (btrfs, xfs), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+
+def get_objects_folder(save_path):
+    return os.path.join(save_path, OBJECTS_FOLDER_NAME)
+
+
+def get_object_path(save_path, digest):
+    """Returns the path of the object whose sha256 is `digest`, eg.
+    "<save_path>/.objects/ab/cdef..."."""
+    digest = digest.lower()
+    return os.path.join(get_objects_folder(save_path), digest[:2], digest[2:])
+
+
+def clone_file(src, dst):
+    """Copies `src` to `dst`, sharing their blocks when the file system can
+    (reflink), with a plain copy otherwise."""
+    if fcntl is not None:
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            shutil.copystat(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def link_file(src, dst):
+    """Makes `dst` a hardlink to `src`, or a clone of it if hardlinks are not
+    supported (eg. across file systems). An existing `dst` is replaced
+    atomically."""
+    tmp = "{}.link".format(dst)
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        clone_file(src, tmp)
+    os.replace(tmp, dst)
+
+
+def store_file(save_path, path, digest):
+    """Puts a downloaded file in the store of `save_path` and makes it a
+    hardlink to its object. If the object already exists, the file is
+    replaced by a link to it, so that identical files of several datasets only
+    take the disk space once.
+
+    The objects are read-only: a dataset file cannot be modified in place
+    without modifying the same file in the other datasets.
+
+    Args:
+        save_path (str): The folder of the datasets.
+        path (str): The downloaded file.
+        digest (str): The sha256 of the file.
+
+    Returns:
+        object_path (str): The path of the object.
+    """
+    object_path = get_object_path(save_path, digest)
+    if os.path.isfile(object_path):
+        if not os.path.samefile(path, object_path):
+            link_file(object_path, path)
+        return object_path
+
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    try:
+        os.link(path, object_path)
+    except FileExistsError:
+        # Stored by another process in the meantime
+        link_file(object_path, path)
+        return object_path
+    except OSError:
+        # No hardlinks: the dataset file stays a file of its own
+        return None
+    os.chmod(object_path, 0o444)
+    return object_path
+
+
+def restore_file(save_path, digest, path):
+    """Links the object whose sha256 is `digest` to `path`.
+
+    Returns:
+        restored (bool): False if the store has no such object.
+    """
+    object_path = get_object_path(save_path, digest)
+    if not os.path.isfile(object_path):
+        return False
+    link_file(object_path, path)
+    return True
+
+
+def collect_garbage(save_path):
+    """Removes the objects that no dataset file links to anymore, ie. whose
+    only link is the object itself.
+
+    Args:
+        save_path (str): The folder of the datasets.
+
+    Returns:
+        removed (int): The number of bytes freed.
+    """
+    removed = 0
+    objects_folder = get_objects_folder(save_path)
+    if not os.path.isdir(objects_folder):
+        return removed
+    for prefix in os.listdir(objects_folder):
+        folder = os.path.join(objects_folder, prefix)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            stat = os.stat(path)
+            if stat.st_nlink == 1:
+                os.remove(path)
+                removed += stat.st_size
+        if not os.listdir(folder):
+            os.rmdir(folder)
+    return removed
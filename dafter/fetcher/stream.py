@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# coding=utf-8
+
+import time
+
+from .ratelimit import throttle
+
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # in bytes
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024  # in bytes
+PROGRESS_INTERVAL = 0.2  # in seconds
+
+
+class ThrottledProgress:
+    """Forwards the progress of a download to a progress bar at most once
+    every `interval` seconds"""
+
+    def __init__(self, pbar, interval=PROGRESS_INTERVAL):
+        """
+        Args:
+            pbar (tqdm.tqdm): The progress bar.
+            interval (float, optional): The minimal time between two updates
+                of the progress bar, in seconds.
+        """
+        self.pbar = pbar
+        self.interval = interval
+        self.pending = 0
+        self.last_update = time.monotonic()
+
+    def update(self, n):
+        self.pending += n
+        now = time.monotonic()
+        if now - self.last_update >= self.interval:
+            self.pbar.update(self.pending)
+            self.pending = 0
+            self.last_update = now
+
+    def flush(self):
+        if self.pending:
+            self.pbar.update(self.pending)
+            self.pending = 0
+
+    def reset(self):
+        """Starts again from 0 byte"""
+        self.pending = 0
+        self.pbar.reset()
+
+    def close(self):
+        self.flush()
+        self.pbar.close()
+
+
+def can_readinto(r):
+    """Tells if the body of the response can be read straight into a buffer,
+    i.e. if it is not compressed by the server.
+
+    Args:
+        r (requests.Response): A streamed response.
+
+    Returns:
+        bool (bool): True if the body can be read with `readinto`.
+    """
+    encoding = r.headers.get("Content-Encoding", "identity").strip().lower()
+    fp = getattr(r.raw, "_fp", None)
+    return encoding in ("", "identity") and hasattr(fp, "readinto")
+
+
+def iter_response(r, chunk_size=DEFAULT_CHUNK_SIZE, use_readinto=False):
+    """Yields the body of a streamed response chunk by chunk.
+
+    Args:
+        r (requests.Response): A streamed response.
+        chunk_size (int, optional): The size of the chunks, in bytes.
+        use_readinto (bool, optional): Reads the body into a single
+            preallocated buffer instead of allocating a new bytes object for
+            each chunk. The yielded memoryviews are only valid until the next
+            chunk is read. Ignored if the body is compressed.
+
+    Yields:
+        chunk (bytes or memoryview): The next chunk of the body.
+    """
+    if not (use_readinto and can_readinto(r)):
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+        return
+
+    # http.client.HTTPResponse fills the buffer without any copy
+    readinto = r.raw._fp.readinto
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    while True:
+        n = readinto(view)
+        if not n:
+            break
+        yield view[:n]
+
+    # The body has been read entirely: the connection can be reused
+    r.raw.release_conn()
+
+
+def copy_response(r, f, chunk_size=DEFAULT_CHUNK_SIZE, use_readinto=False,
+                  progress=None, cancel=None, limit=None, hasher=None,
+                  url=None):
+    """Writes the body of a streamed response into a file, no faster than the
+    rate limits set with `ratelimit.set_rate_limit`.
+
+    Args:
+        r (requests.Response): A streamed response.
+        f (file object): The file opened in binary mode. Opening it with a
+            large `buffering` avoids a system call for each chunk.
+        chunk_size (int, optional): The size of the chunks, in bytes.
+        use_readinto (bool, optional): See `iter_response`.
+        progress (ThrottledProgress, optional): Updated with the number of
+            bytes written.
+        cancel (threading.Event, optional): When set by another thread, the
+            copy stops and KeyboardInterrupt is raised.
+        limit (int, optional): The maximal number of bytes to write.
+        hasher (FileHasher, optional): Hashes the bytes as they are written.
+        url (str, optional): The url the rate limits apply to, `r.url` if
+            None. The url of the source when `r` comes from the cache or a
+            redirection.
+
+    Returns:
+        written (int): The number of bytes written.
+    """
+    written = 0
+    for chunk in iter_response(r, chunk_size, use_readinto):
+        if cancel is not None and cancel.is_set():
+            raise KeyboardInterrupt
+        if limit is not None and written + len(chunk) > limit:
+            chunk = chunk[:limit - written]
+        f.write(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+        written += len(chunk)
+        if progress is not None:
+            progress.update(len(chunk))
+        throttle(url or r.url, len(chunk))
+        if limit is not None and written >= limit:
+            break
+    return written
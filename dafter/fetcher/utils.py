@@ -4,9 +4,11 @@
 import os
 import re
 import json
-import requests
 
-from .constants import DATASETS_FOLDER, DATASETS_CONFIG_FOLDER
+from .constants import DATASETS_FOLDER
+from .catalog import get_catalog
+from .checksum import CHECKSUM_ALGORITHMS, is_valid_checksum
+from .state import COMPLETE, get_state
 
 
 def is_valid_url(s):
@@ -57,14 +59,57 @@ def is_valid_config(config):
         if not url_validity:
             return False
 
+        mirrors = url_.get("mirrors", [])
+        if not isinstance(mirrors, list):
+            return False
+        if not all(is_valid_url(mirror) for mirror in mirrors):
+            return False
+
+        for algorithm, _ in CHECKSUM_ALGORITHMS:
+            if algorithm in url_ and not is_valid_checksum(algorithm,
+                                                           url_[algorithm]):
+                return False
+
+    hooks = config.get("hooks", [])
+    if not isinstance(hooks, list):
+        return False
+    for hook in hooks:
+        if isinstance(hook, dict):
+            hook = hook.get("name")
+        if not isinstance(hook, str) or not hook:
+            return False
+
     return True
 
 
+def get_dataset_status(datasetname):
+    """Gets the status of a dataset recorded in the state database.
+
+    Args:
+        datasetname (str): The normalized name of the dataset.
+
+    Returns:
+        status (str): "complete" or "incomplete", or None if the downloads of
+            the dataset have not been recorded or if its folder has been
+            removed.
+    """
+    if not datasetname:
+        return None
+    state = get_state(DATASETS_FOLDER)
+    if state is None:
+        return None
+    status = state.get_status(datasetname)
+    if status is None or \
+            not os.path.isdir(os.path.join(DATASETS_FOLDER, datasetname)):
+        return None
+    return status
+
+
 def is_dataset_being_downloaded(datasetname):
     """Tells if the dataset is currently being downloaded.
 
-    TODO: also check if the number of downloaded files is the same at what is
-    expected in the config.
+    The files of the dataset are the ones named after its urls: the files
+    extracted from the archives do not count.
 
     Args:
         datasetname (str): The name of the dataset.
@@ -82,6 +127,11 @@ def is_dataset_being_downloaded(datasetname):
     # TODO: normalize name of normalize_filename?
     datasetname = normalize_filename(datasetname)
 
+    # Status recorded by the downloads
+    status = get_dataset_status(datasetname)
+    if status is not None:
+        return status != COMPLETE
+
     folders = os.listdir(DATASETS_FOLDER)
     for folder in folders:
         if folder == datasetname:
@@ -89,13 +139,13 @@ def is_dataset_being_downloaded(datasetname):
 
             # First, test if an incomplete file is present
             for filename in files:
-                if "incomplete" in filename:
+                if filename.endswith(".incomplete"):
                     return True
 
             # Second, test if all the files have been downloaded
             config = get_config_dataset(datasetname)
-            if len(config["urls"]) != len(files):
-                return True
+            if config is None:
+                break
             for u_ in config["urls"]:
                 file_path = os.path.join(os.path.join(DATASETS_FOLDER, folder, normalize_filename(u_["url"])))
                 if not os.path.isfile(file_path):
@@ -183,7 +233,9 @@ def get_config_dataset(datasetname):
     config = None
     if is_valid_url(datasetname):
         url = datasetname
-        r = requests.get(url=url)
+        # Deferred: requests is only imported when a config is downloaded
+        from .session import get_session
+        r = get_session().get(url=url)
         if r.status_code == 200:
             config = r.json()
             if not is_valid_config(config):
@@ -202,18 +254,37 @@ def get_config_dataset(datasetname):
             except:
                 config = None
     else:
-        for config_file in os.listdir(DATASETS_CONFIG_FOLDER):
-            cf = config_file.replace(".json", "")
-            if cf != datasetname:
-                continue
-
-            config_file = os.path.join(DATASETS_CONFIG_FOLDER, config_file)
-            with open(config_file) as f:
-                config = json.load(f)
+        config = get_catalog()["configs"].get(datasetname)
 
     return config
 
 
+def parse_size(s):
+    """Parses a human readable number of bytes, like "512k", "4M" or "1.5G".
+    The units are powers of 1024.
+
+    Args:
+        s (str or int): The size.
+
+    Returns:
+        size (int): The number of bytes.
+    """
+    if isinstance(s, int) and not isinstance(s, bool):
+        return s
+    if not isinstance(s, str):
+        raise ValueError("size must be a str, not {}".format(type(s)))
+
+    units = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*$', s,
+                     re.IGNORECASE)
+    if match is None:
+        raise ValueError("Not a valid size : {}".format(s))
+
+    number, unit = match.groups()
+    return int(float(number) * units[unit.lower()])
+
+
 def is_dataset_in_db(datasetname):
     """Tells if the dataset is located on the disk.
 
@@ -230,6 +301,10 @@ def is_dataset_in_db(datasetname):
 
     datasetname = normalize_name(datasetname)
 
+    # Status recorded by the downloads
+    if get_dataset_status(datasetname) is not None:
+        return True
+
     folders = os.listdir(DATASETS_FOLDER)
     if datasetname in folders:
         dataset_folder = os.path.join(DATASETS_FOLDER, datasetname)
@@ -241,10 +316,13 @@ def is_dataset_in_db(datasetname):
 
 def check_internet_connection():
     """Checks if there is a working internet connection."""
+    import requests
+    from .session import get_session
+
     url = 'http://www.google.com/'
     timeout = 5
     try:
-        _ = requests.get(url, timeout=timeout)
+        _ = get_session().get(url, timeout=timeout)
         return True
     except requests.ConnectionError as e:
         return False
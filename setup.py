@@ -46,6 +46,10 @@ setup(
         'requests',
         'tqdm'
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'convert': ['pyarrow', 'numpy'],
+    },
     packages=find_packages(),
     include_package_data=True,
     cmdclass={
@@ -0,0 +1,132 @@
+import os
+import re
+import pytest
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serves the files of a folder and honours "Range: bytes=N-M" headers"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        self.server.clients.add(self.client_address)
+        self.server.requests.append((self.command, self.path))
+        if self.path in self.server.redirects:
+            self.send_response(302)
+            self.send_header("Location", self.server.redirects[self.path])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404, "File not found")
+            return None
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+
+        # Validators of the version of the file
+        mtime = os.path.getmtime(path)
+        etag = '"{}-{}"'.format(size, os.stat(path).st_mtime_ns)
+        if self.headers.get("If-None-Match") == etag or (
+                "If-None-Match" not in self.headers and
+                "If-Modified-Since" in self.headers and
+                parsedate_to_datetime(self.headers["If-Modified-Since"])
+                .timestamp() >= int(mtime)):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return None
+
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match and self.server.accept_ranges:
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), size - 1)
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(size))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header("Content-Range",
+                             "bytes {}-{}/{}".format(start, end, size))
+        else:
+            self.send_response(200)
+
+        if self.server.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        f = open(path, "rb")
+        f.seek(start)
+        self.remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        # Drops the connection after this number of bytes, once
+        drop = self.server.drop_after.pop(self.path, None)
+        while self.remaining > 0:
+            n = min(65536, self.remaining)
+            if drop is not None:
+                if drop <= 0:
+                    self.close_connection = True
+                    return
+                n = min(n, drop)
+                drop -= n
+            chunk = source.read(n)
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            self.remaining -= len(chunk)
+
+
+class LocalServer:
+    """A HTTP server running in a thread and serving the files of `folder`"""
+
+    def __init__(self, folder, accept_ranges=True):
+        self.folder = folder
+        handler = lambda *args, **kwargs: RangeRequestHandler(
+            *args, directory=folder, **kwargs)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.accept_ranges = accept_ranges
+        self.httpd.clients = set()
+        self.httpd.requests = []
+        self.httpd.drop_after = {}  # path: number of bytes sent
+        self.httpd.redirects = {}  # path: location
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def url(self, filename):
+        return "http://localhost:{}/{}".format(self.httpd.server_port, filename)
+
+    def add_file(self, filename, size):
+        content = os.urandom(size)
+        with open(os.path.join(self.folder, filename), "wb") as f:
+            f.write(content)
+        return content
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def local_server(tmp_path):
+    folder = tmp_path / "served"
+    folder.mkdir()
+    server = LocalServer(str(folder))
+    yield server
+    server.close()
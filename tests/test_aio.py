@@ -0,0 +1,103 @@
+import os
+import time
+import pytest
+import asyncio
+
+from dafter.fetcher import Dataset
+from dafter.fetcher import session
+from dafter.fetcher.aio import download_datasets
+from dafter.fetcher.ratelimit import set_rate_limit
+
+aiohttp = pytest.importorskip("aiohttp")
+
+
+def test_download_async(local_server, tmp_path):
+    contents = {}
+    for i in range(10):
+        filename = "file{}.bin".format(i)
+        contents[filename] = local_server.add_file(filename, 50000 + i)
+
+    urls = [{"url": local_server.url(fn)} for fn in contents]
+    d = Dataset("async", urls, str(tmp_path))
+
+    # Partially downloaded file, resumed from its current size
+    with open(os.path.join(d.save_folder, "file3.bin.incomplete"), "wb") as f:
+        f.write(contents["file3.bin"][:700])
+
+    async def main():
+        return await d.download_async(concurrency=4, chunk_size=8192)
+
+    assert asyncio.run(main()) is d
+    assert sorted(os.listdir(d.save_folder)) == sorted(contents)
+    for filename, content in contents.items():
+        with open(os.path.join(d.save_folder, filename), "rb") as f:
+            assert f.read() == content
+
+
+def test_download_datasets(local_server, tmp_path):
+    c1 = local_server.add_file("a.bin", 1000)
+    c2 = local_server.add_file("b.bin", 2000)
+
+    d1 = Dataset("first", [{"url": local_server.url("a.bin")}], str(tmp_path))
+    d2 = Dataset("second", [{"url": local_server.url("b.bin")}], str(tmp_path))
+    assert download_datasets([d1, d2]) == [d1, d2]
+
+    with open(os.path.join(d1.save_folder, "a.bin"), "rb") as f:
+        assert f.read() == c1
+    with open(os.path.join(d2.save_folder, "b.bin"), "rb") as f:
+        assert f.read() == c2
+
+    with pytest.raises(ValueError):
+        download_datasets([d1], concurrency=0)
+
+
+
+def test_download_async_dropped(local_server, tmp_path, monkeypatch):
+    monkeypatch.setitem(session._settings, "backoff_factor", 0)
+
+    content = local_server.add_file("data.bin", 300000)
+    local_server.httpd.drop_after["/data.bin"] = 100000
+    d = Dataset("dropped", [{"url": local_server.url("data.bin")}],
+                str(tmp_path))
+    download_datasets([d])
+
+    with open(os.path.join(d.save_folder, "data.bin"), "rb") as f:
+        assert f.read() == content
+    assert local_server.httpd.requests == [("GET", "/data.bin")] * 2
+
+
+def test_download_async_416(local_server, tmp_path):
+    content = local_server.add_file("data.bin", 1000)
+    d = Dataset("complete", [{"url": local_server.url("data.bin")}],
+                str(tmp_path))
+    # Complete but not renamed yet
+    with open(os.path.join(d.save_folder, "data.bin.incomplete"), "wb") as f:
+        f.write(content)
+
+    download_datasets([d])
+    with open(os.path.join(d.save_folder, "data.bin"), "rb") as f:
+        assert f.read() == content
+
+
+def test_download_async_cancels_others(local_server, tmp_path):
+    local_server.add_file("slow.bin", 1000000)
+    urls = [{"url": local_server.url("missing.bin")},
+            {"url": local_server.url("slow.bin")},
+            {"url": local_server.url("slow.bin"),
+             "mirrors": [local_server.url("slow.bin?mirror")]}]
+    d = Dataset("failing", urls, str(tmp_path))
+
+    set_rate_limit(per_host={"localhost": 100000})
+    try:
+        start = time.monotonic()
+        with pytest.raises(aiohttp.ClientResponseError):
+            download_datasets([d])
+        # Neither the download in the loop nor the one in a thread went on
+        assert time.monotonic() - start < 5
+    finally:
+        set_rate_limit()
+    assert "slow.bin" not in os.listdir(d.save_folder)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,208 @@
+import os
+import time
+import threading
+import pytest
+import requests
+from urllib.parse import urlparse
+
+from dafter.fetcher import Dataset
+from dafter.fetcher import session
+from dafter.fetcher.cache import Cache
+from dafter.fetcher.cache import CacheServer
+from dafter.fetcher.cache import get_catalog_hosts
+from dafter.fetcher.cache import parse_range
+from dafter.fetcher.session import get_session
+from dafter.fetcher.ratelimit import set_rate_limit
+
+
+@pytest.fixture
+def cache_server(tmp_path):
+    cache = Cache(str(tmp_path / "cache"), max_size=50000, chunk_size=1024)
+    server = CacheServer(("127.0.0.1", 0), cache, allowed_hosts=["localhost"])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = "http://127.0.0.1:{}".format(server.server_port)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_range():
+    assert parse_range("bytes=10-", 100) == (10, 99)
+    assert parse_range("bytes=10-19", 100) == (10, 19)
+    assert parse_range("bytes=90-200", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=-0", 100) == (None, None)
+    assert parse_range("bytes=100-", 100) == (None, None)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+
+
+def test_coalesced_fetch(local_server, cache_server):
+    content = local_server.add_file("data.bin", 40000)
+    url = "{}/{}".format(cache_server.url, local_server.url("data.bin"))
+
+    results = [None] * 8
+
+    def fetch(i):
+        results[i] = get_session().get(url).content
+
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [content] * 8
+    assert local_server.httpd.requests == [("GET", "/data.bin")]
+
+    r = get_session().get(url, headers={"Range": "bytes=1000-"})
+    assert r.status_code == 206
+    assert r.content == content[1000:]
+    assert r.headers["Content-Range"] == "bytes 1000-39999/40000"
+    assert len(local_server.httpd.requests) == 1
+
+
+def test_upstream_error(local_server, cache_server):
+    r = get_session().get("{}/{}".format(cache_server.url,
+                                         local_server.url("missing.bin")))
+    assert r.status_code == 404
+    r = get_session().get("{}/not-a-url".format(cache_server.url))
+    assert r.status_code == 400
+
+
+def test_allowed_hosts(local_server, cache_server):
+    local_server.add_file("data.bin", 1000)
+    url = local_server.url("data.bin").replace("localhost", "127.0.0.1")
+    for method in ["GET", "HEAD"]:
+        r = get_session().request(method, "{}/{}".format(cache_server.url,
+                                                        url))
+        assert r.status_code == 403
+    assert local_server.httpd.requests == []
+
+    # The port may be given too
+    cache_server.cache.allowed_hosts = {urlparse(url).netloc}
+    r = get_session().get("{}/{}".format(cache_server.url, url))
+    assert r.status_code == 200
+
+
+def test_redirect_to_other_host(local_server, cache_server):
+    content = local_server.add_file("data.bin", 1000)
+    url = local_server.url("data.bin")
+    local_server.httpd.redirects["/moved.bin"] = url.replace("localhost",
+                                                             "127.0.0.1")
+    for method in ["GET", "HEAD"]:
+        # Without the retries of the session on 502
+        r = requests.request(method, "{}/{}".format(
+            cache_server.url, local_server.url("moved.bin")))
+        assert r.status_code == 502
+    assert local_server.httpd.requests == [("GET", "/moved.bin"),
+                                           ("HEAD", "/moved.bin")]
+
+    # Redirections to an allowed host are followed
+    local_server.httpd.redirects["/moved.bin"] = url
+    r = get_session().get("{}/{}".format(cache_server.url,
+                                         local_server.url("moved.bin")))
+    assert r.status_code == 200
+    assert r.content == content
+
+
+def test_get_catalog_hosts():
+    hosts = get_catalog_hosts()
+    assert "archive.ics.uci.edu" in hosts
+    assert all(host and "/" not in host for host in hosts)
+
+
+def test_head(local_server, cache_server):
+    local_server.add_file("data.bin", 30000)
+    url = "{}/{}".format(cache_server.url, local_server.url("data.bin"))
+
+    # Forwarded upstream, nothing is fetched
+    r = get_session().head(url)
+    assert r.status_code == 200
+    assert r.headers["Content-Length"] == "30000"
+    assert r.headers["Accept-Ranges"] == "bytes"
+    assert local_server.httpd.requests == [("HEAD", "/data.bin")]
+    assert len(cache_server.cache.files) == 0
+
+    # Answered from the cache once fetched
+    get_session().get(url)
+    r = get_session().head(url)
+    assert r.headers["Content-Length"] == "30000"
+    assert local_server.httpd.requests == [("HEAD", "/data.bin"),
+                                           ("GET", "/data.bin")]
+
+    r = get_session().head("{}/{}".format(cache_server.url,
+                                          local_server.url("missing.bin")))
+    assert r.status_code == 404
+
+
+def test_lru_eviction(local_server, cache_server):
+    cache = cache_server.cache
+    urls = []
+    for name in ["a.bin", "b.bin", "c.bin"]:
+        local_server.add_file(name, 20000)
+        urls.append(local_server.url(name))
+
+    for url in urls[:2]:
+        get_session().get("{}/{}".format(cache_server.url, url))
+    # "a.bin" becomes the most recently used
+    get_session().get("{}/{}".format(cache_server.url, urls[0]))
+    get_session().get("{}/{}".format(cache_server.url, urls[2]))
+
+    assert [cached.url for cached in cache.files.values()] == \
+        [urls[0], urls[2]]
+    assert cache.get_size() == 40000
+
+    # The cache survives a restart, in the same order
+    cache = Cache(cache.folder, cache.max_size)
+    assert [cached.url for cached in cache.files.values()] == \
+        [urls[0], urls[2]]
+
+
+def test_download_through_cache(local_server, cache_server, tmp_path,
+                                monkeypatch):
+    content = local_server.add_file("data.bin", 30000)
+    monkeypatch.setattr(session, "_cache_url", cache_server.url)
+
+    d = Dataset("cached", [{"url": local_server.url("data.bin")}],
+                str(tmp_path / "datasets"))
+    d.download(segments=3)
+    with open(os.path.join(d.save_folder, "data.bin"), "rb") as f:
+        assert f.read() == content
+    # The size is asked upstream, the file is fetched once
+    assert [r[0] for r in local_server.httpd.requests] == ["HEAD", "GET"]
+
+
+def test_rate_limit_through_cache(local_server, cache_server, tmp_path,
+                                  monkeypatch):
+    local_server.add_file("data.bin", 150 * 1024)
+    monkeypatch.setattr(session, "_cache_url", cache_server.url)
+    # The limit of the source applies, not the one of the cache
+    set_rate_limit(per_host={"localhost": 100 * 1024})
+    try:
+        d = Dataset("limited", [{"url": local_server.url("data.bin")}],
+                    str(tmp_path / "datasets"))
+        start = time.monotonic()
+        d.download(chunk_size=16 * 1024)
+        assert time.monotonic() - start > 0.4
+    finally:
+        set_rate_limit()
+
+
+def test_update_bypasses_cache(local_server, cache_server, tmp_path,
+                               monkeypatch):
+    content = local_server.add_file("rows.csv", 30000)
+    monkeypatch.setattr(session, "_cache_url", cache_server.url)
+
+    d = Dataset("cached", [{"url": local_server.url("rows.csv")}],
+                str(tmp_path / "datasets")).download()
+
+    # The cache still has the old version: upstream is asked
+    path = os.path.join(local_server.folder, "rows.csv")
+    with open(path, "ab") as f:
+        f.write(b"new rows")
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert d.update(append=True) == ["rows.csv"]
+    with open(os.path.join(d.save_folder, "rows.csv"), "rb") as f:
+        assert f.read() == content + b"new rows"
+    assert d.update() == []
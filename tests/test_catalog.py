@@ -0,0 +1,85 @@
+import os
+import json
+import time
+import pytest
+
+from dafter.fetcher import catalog
+from dafter.fetcher import get_catalog
+from dafter.fetcher import build_catalog
+from dafter.fetcher import DATASETS_CONFIG_FOLDER
+
+
+def write_config(folder, name, tags):
+    config = {"name": name, "urls": [{"url": "https://example.com/f"}],
+              "type": "csv", "tags": tags}
+    with open(os.path.join(folder, name + ".json"), "w") as f:
+        json.dump(config, f)
+    return config
+
+
+def test_build_catalog(tmp_path):
+    folder = str(tmp_path)
+    c1 = write_config(folder, "first", ["image", "dl"])
+    c2 = write_config(folder, "second", ["image"])
+    with open(os.path.join(folder, "broken.json"), "w") as f:
+        f.write("blah")
+    with open(os.path.join(folder, "README"), "w") as f:
+        f.write("not a config")
+
+    c = build_catalog(folder)
+    assert c["configs"] == {"first": c1, "second": c2}
+    assert c["tags"] == {"image": ["first", "second"], "dl": ["first"]}
+    assert [s[0] for s in c["signature"]] == ["broken.json", "first.json",
+                                              "second.json"]
+
+
+def test_get_catalog(tmp_path, monkeypatch):
+    folder = tmp_path / "configs"
+    folder.mkdir()
+    folder = str(folder)
+    index_file = os.path.join(str(tmp_path), "index.json")
+    write_config(folder, "first", ["image"])
+
+    c = get_catalog(folder, index_file)
+    assert list(c["configs"]) == ["first"]
+    assert os.path.isfile(index_file)
+
+    # Kept in memory: the config files are not parsed again
+    calls = []
+    monkeypatch.setattr(catalog, "build_catalog",
+                        lambda *args: calls.append(args))
+    assert get_catalog(folder, index_file) is c
+
+    # Read from the index by a new process
+    catalog.clear_catalog_cache()
+    assert get_catalog(folder, index_file)["configs"] == c["configs"]
+    assert calls == []
+    monkeypatch.undo()
+
+    # A new config invalidates the index
+    write_config(folder, "second", ["text"])
+    c = get_catalog(folder, index_file)
+    assert sorted(c["configs"]) == ["first", "second"]
+    assert c["tags"]["text"] == ["second"]
+
+    # So does a modified config, once the process restarts
+    time.sleep(0.01)
+    write_config(folder, "second", ["audio"])
+    catalog.clear_catalog_cache()
+    assert get_catalog(folder, index_file)["tags"] == {"image": ["first"],
+                                                       "audio": ["second"]}
+
+    # Unwritable index
+    c = get_catalog(folder, os.path.join(str(tmp_path), "missing", "index.json"))
+    assert sorted(c["configs"]) == ["first", "second"]
+
+
+def test_bundled_catalog():
+    c = get_catalog()
+    assert len(c["configs"]) == len(os.listdir(DATASETS_CONFIG_FOLDER))
+    assert c["configs"]["colleges"]["name"] == "colleges"
+    assert "mnist" in c["tags"]["image"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
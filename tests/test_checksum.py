@@ -0,0 +1,104 @@
+import os
+import hashlib
+import pytest
+
+from dafter.fetcher import Dataset
+from dafter.fetcher import segmented
+from dafter.fetcher.checksum import FileHasher
+from dafter.fetcher.checksum import format_checksum
+from dafter.fetcher.checksum import get_expected_checksums
+from dafter.fetcher.state import CORRUPT, get_state
+
+
+def test_file_hasher(tmp_path):
+    content = os.urandom(10000)
+    path = os.path.join(str(tmp_path), "file.bin")
+    with open(path, "wb") as f:
+        f.write(content)
+    checksums = {"sha256": hashlib.sha256(content).hexdigest(),
+                 "md5": hashlib.md5(content).hexdigest()}
+
+    # Part of the file streamed, the rest read from the disk
+    hasher = FileHasher(checksums)
+    hasher.update(content[:3000])
+    hasher.catch_up(path, len(content), chunk_size=1024)
+    assert hasher.offset == len(content)
+    assert hasher.get_mismatches() == []
+    assert hasher.get_checksum() == "sha256:" + checksums["sha256"]
+
+    # Already hashed further than the file: starts again
+    hasher.update(b"garbage")
+    hasher.catch_up(path, len(content))
+    assert hasher.get_mismatches() == []
+
+    hasher = FileHasher(checksums)
+    hasher.catch_up(path, 5000)
+    assert sorted(hasher.get_mismatches()) == ["md5", "sha256"]
+
+    with pytest.raises(ValueError):
+        FileHasher(checksums).catch_up(path, len(content) + 1)
+
+
+def test_expected_checksums():
+    url_ = {"url": "https://www.example.com/", "md5": "D41D8CD98F00B204E9800998ECF8427E"}
+    assert get_expected_checksums(url_) == {"md5": "d41d8cd98f00b204e9800998ecf8427e"}
+    assert format_checksum(get_expected_checksums(url_)) == "md5:d41d8cd98f00b204e9800998ecf8427e"
+    assert get_expected_checksums({"url": "https://www.example.com/"}) == {}
+    assert format_checksum({}) is None
+
+
+def test_download_checksum(local_server, tmp_path):
+    content = local_server.add_file("data.bin", 30000)
+    url = local_server.url("data.bin")
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    d = Dataset("checked", [{"url": url, "bytes": len(content), "sha256": sha256}],
+                str(tmp_path))
+
+    # Interrupted download: the prefix is hashed once before resuming
+    f_name = os.path.join(d.save_folder, "data.bin")
+    with open(f_name + ".incomplete", "wb") as f:
+        f.write(content[:12345])
+
+    d.download()
+    with open(f_name, "rb") as f:
+        assert f.read() == content
+    files = get_state(str(tmp_path)).get_files(d.name)
+    assert files["data.bin"]["checksum"] == "sha256:" + sha256
+
+
+def test_download_corrupt(local_server, tmp_path):
+    content = local_server.add_file("data.bin", 30000)
+    url = local_server.url("data.bin")
+
+    d = Dataset("corrupt", [{"url": url, "md5": "0" * 32}], str(tmp_path))
+    with pytest.raises(ValueError):
+        d.download()
+
+    f_name = os.path.join(d.save_folder, "data.bin")
+    assert not os.path.exists(f_name)
+    with open(f_name + ".corrupt", "rb") as f:
+        assert f.read() == content
+    files = get_state(str(tmp_path)).get_files(d.name)
+    assert files["data.bin"]["status"] == CORRUPT
+
+    # A complete file whose checksum was never verified is checked once
+    os.rename(f_name + ".corrupt", f_name)
+    md5 = hashlib.md5(content).hexdigest()
+    d = Dataset("corrupt", [{"url": url, "md5": md5}], str(tmp_path))
+    assert d._pending_files() == []
+    files = get_state(str(tmp_path)).get_files(d.name)
+    assert files["data.bin"]["checksum"] == "md5:" + md5
+
+
+def test_download_segmented_checksum(local_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(segmented, "MIN_SEGMENT_SIZE", 1000)
+
+    content = local_server.add_file("big.bin", 100003)
+    url = local_server.url("big.bin")
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    d = Dataset("segments", [{"url": url, "sha256": sha256}], str(tmp_path))
+    d.download(segments=4)
+    files = get_state(str(tmp_path)).get_files(d.name)
+    assert files["big.bin"]["checksum"] == "sha256:" + sha256
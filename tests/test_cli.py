@@ -0,0 +1,80 @@
+import sys
+import json
+import pytest
+import subprocess
+
+
+HEAVY_MODULES = ["requests", "tqdm", "aiohttp", "urllib3"]
+
+RUNNER = """
+import sys, json
+from dafter.cli import main
+sys.argv = ["dafter"] + sys.argv[1:]
+main()
+print(json.dumps([m for m in {} if m in sys.modules]))
+""".format(HEAVY_MODULES)
+
+
+@pytest.mark.parametrize("command", [["version"], ["list"], ["search", "mnist"],
+                                     ["info", "mnist"]])
+def test_commands_do_not_import_network_modules(command):
+    out = subprocess.run([sys.executable, "-c", RUNNER] + command,
+                         stdout=subprocess.PIPE, check=True).stdout
+    imported = json.loads(out.decode().strip().split("\n")[-1])
+    assert imported == []
+
+
+def test_lazy_package():
+    out = subprocess.run(
+        [sys.executable, "-c",
+         "import sys; import dafter.fetcher as f; "
+         "print('requests' in sys.modules); f.Dataset; "
+         "print('requests' in sys.modules)"],
+        stdout=subprocess.PIPE, check=True).stdout
+    assert out.decode().split() == ["False", "True"]
+
+    import dafter.fetcher
+    assert "get_dataset" in dir(dafter.fetcher)
+    with pytest.raises(AttributeError):
+        dafter.fetcher.not_a_name
+
+
+def test_load_does_not_import_pyarrow():
+    out = subprocess.run(
+        [sys.executable, "-c",
+         "import sys; import dafter; dafter.load; "
+         "import dafter.fetcher.loader; print('pyarrow' in sys.modules)"],
+        stdout=subprocess.PIPE, check=True).stdout
+    assert out.decode().split() == ["False"]
+
+
+@pytest.mark.parametrize("options, called", [
+    ([], "get_dataset"),
+    (["--per-host", "2"], "get_datasets"),
+    (["--order", "host"], "get_datasets"),
+])
+def test_get_single_dataset_options(monkeypatch, options, called):
+    from dafter.cli import main
+    from dafter.fetcher import fetcher
+
+    calls = []
+    monkeypatch.setattr(fetcher, "get_dataset",
+                        lambda *args, **kwargs: calls.append(
+                            ("get_dataset", args, kwargs)))
+    monkeypatch.setattr(fetcher, "get_datasets",
+                        lambda *args, **kwargs: calls.append(
+                            ("get_datasets", args, kwargs)))
+    monkeypatch.setattr(sys, "argv", ["dafter", "get", "mnist"] + options)
+    main()
+    assert [c[0] for c in calls] == [called]
+    if called == "get_datasets":
+        # The options are not dropped for a single dataset
+        assert calls[0][1] == (["mnist"], None)
+        assert calls[0][2]["per_host"] == (2 if "--per-host" in options
+                                           else fetcher.DEFAULT_PER_HOST)
+        assert calls[0][2]["order"] == ("host" if "--order" in options
+                                        else "size")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -1,4 +1,7 @@
+import os
+import sys
 import pytest
+import subprocess
 
 from os.path import isdir
 
@@ -12,5 +15,14 @@ def test_directories():
     assert isdir(DATASETS_CONFIG_FOLDER) == True
 
 
+def test_configs_folder_env(tmp_path):
+    env = dict(os.environ, DAFTER_CONFIGS_FOLDER=str(tmp_path))
+    out = subprocess.run(
+        [sys.executable, "-c", "from dafter.fetcher import "
+         "DATASETS_CONFIG_FOLDER; print(DATASETS_CONFIG_FOLDER)"],
+        stdout=subprocess.PIPE, env=env, check=True).stdout
+    assert out.decode().strip() == str(tmp_path)
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
@@ -0,0 +1,129 @@
+import os
+import gzip
+import json
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+np = pytest.importorskip("numpy")
+
+import pyarrow.ipc
+import pyarrow.parquet
+
+from dafter.fetcher.convert import get_stem
+from dafter.fetcher.convert import convert_file
+from dafter.fetcher.convert import find_tabular_files
+
+
+ROWS = [(i, i / 4 if i % 7 else None, "name {}".format(i) if i % 5 else "")
+        for i in range(2000)]
+
+
+def write_csv(path, delimiter=","):
+    lines = ["id{0}score{0}name".format(delimiter)]
+    for i, score, name in ROWS:
+        lines.append(delimiter.join(
+            [str(i), "" if score is None else str(score), name]))
+    content = ("\n".join(lines) + "\n").encode()
+    if path.endswith(".gz"):
+        content = gzip.compress(content)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def test_get_stem():
+    assert get_stem("data.csv") == "data"
+    assert get_stem("title.basics.tsv.gz") == "title.basics"
+    assert get_stem("download") == "download"
+
+
+@pytest.mark.parametrize("to", ["parquet", "arrow"])
+def test_convert_arrow(tmp_path, to):
+    path = os.path.join(str(tmp_path), "data.tsv.gz")
+    write_csv(path, "\t")
+
+    schema = convert_file(path, to, "\t", block_size=4096)
+    assert schema["rows"] == len(ROWS)
+    assert [c["name"] for c in schema["columns"]] == ["id", "score", "name"]
+    assert schema["columns"][1]["nulls"] == len([r for r in ROWS if r[1] is None])
+    with open(os.path.join(str(tmp_path), "data.schema.json")) as f:
+        assert json.load(f) == schema
+
+    output = os.path.join(str(tmp_path), schema["path"])
+    if to == "parquet":
+        table = pyarrow.parquet.read_table(output)
+    else:
+        table = pyarrow.ipc.open_file(pa.memory_map(output)).read_all()
+    assert table.column("id").to_pylist() == [r[0] for r in ROWS]
+    assert table.column("score").to_pylist() == [r[1] for r in ROWS]
+
+
+def test_convert_npy(tmp_path):
+    path = os.path.join(str(tmp_path), "data.csv")
+    write_csv(path)
+
+    schema = convert_file(path, "npy", block_size=4096)
+    folder = os.path.join(str(tmp_path), schema["path"])
+    assert folder.endswith("data-npy")
+
+    files = [c["files"] for c in schema["columns"]]
+    ids = np.load(os.path.join(folder, files[0]["data"]), mmap_mode="r")
+    assert ids.tolist() == [r[0] for r in ROWS]
+    scores = np.load(os.path.join(folder, files[1]["data"]), mmap_mode="r")
+    assert np.isnan(scores[0]) and scores[1] == 0.25
+
+    offsets = np.load(os.path.join(folder, files[2]["offsets"]), mmap_mode="r")
+    values = np.load(os.path.join(folder, files[2]["values"]), mmap_mode="r")
+    names = [bytes(values[offsets[i]:offsets[i + 1]]).decode()
+             for i in range(len(offsets) - 1)]
+    assert names == [r[2] for r in ROWS]
+
+
+def test_convert_errors(tmp_path):
+    path = os.path.join(str(tmp_path), "data.csv")
+    write_csv(path)
+    with pytest.raises(ValueError):
+        convert_file(path, "xlsx")
+    with pytest.raises(ValueError):
+        convert_file(path, "npy", block_size=0)
+
+
+@pytest.mark.parametrize("to", ["parquet", "npy"])
+def test_convert_late_conflict(tmp_path, to):
+    path = os.path.join(str(tmp_path), "data.csv")
+    lines = ["id,code"] + ["{0},{0}".format(i) for i in range(2000)]
+    with open(path, "w") as f:
+        f.write("\n".join(lines + ["2000,A12"]) + "\n")
+
+    # The type of "code" is inferred from a first block of integers
+    schema = convert_file(path, to, block_size=4096)
+    assert [c["type"] for c in schema["columns"]] == ["int64", "string"]
+    assert schema["rows"] == 2001
+    if to == "parquet":
+        table = pyarrow.parquet.read_table(
+            os.path.join(str(tmp_path), schema["path"]))
+        assert table.column("code").to_pylist()[-2:] == ["1999", "A12"]
+
+
+def test_convert_removes_partial_output(tmp_path):
+    path = os.path.join(str(tmp_path), "data.csv")
+    lines = ["a,b"] + ["{0},{0}".format(i) for i in range(2000)]
+    with open(path, "w") as f:
+        f.write("\n".join(lines + ["1,2,3"]) + "\n")
+
+    with pytest.raises(pa.ArrowInvalid):
+        convert_file(path, "npy", block_size=4096)
+    assert sorted(os.listdir(str(tmp_path))) == ["data.csv"]
+
+
+def test_find_tabular_files(tmp_path):
+    folder = str(tmp_path)
+    os.makedirs(os.path.join(folder, "extracted"))
+    for name in ["download", "extracted/a.csv", "b.tsv.gz", "c.zip", "d.txt",
+                 "e.csv.incomplete"]:
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(b"PK\x03\x04" if name.endswith(".zip") else b"x,y\n1,2\n")
+
+    files = find_tabular_files(folder, "csv", ["download", "c.zip"])
+    assert files == [(os.path.join(folder, "b.tsv.gz"), "\t"),
+                     (os.path.join(folder, "download"), ","),
+                     (os.path.join(folder, "extracted", "a.csv"), ",")]
@@ -1,10 +1,18 @@
+import io
 import os
 import pytest
 import shutil
+import tarfile
 import tempfile
+import time
+import requests
 
 from dafter.fetcher import Dataset
 from dafter.fetcher import DATASETS_FOLDER
+from dafter.fetcher import session
+from dafter.fetcher.state import get_state
+
+from conftest import LocalServer
 
 
 def test_init_dataset():
@@ -196,5 +204,217 @@ def test_download():
     clean_dataset(COLLEGES_FOLDER_NAME)
 
 
+def test_download_parallel(local_server, tmp_path):
+
+    contents = {}
+    for i in range(5):
+        filename = "file{}.bin".format(i)
+        contents[filename] = local_server.add_file(filename, 200000 + i)
+    urls = [{"url": local_server.url(fn), "bytes": len(c)}
+            for fn, c in contents.items()]
+
+    # Partially downloaded file, resumed from its current size
+    save_folder = os.path.join(str(tmp_path), "parallel")
+    os.makedirs(save_folder)
+    with open(os.path.join(save_folder, "file0.bin.incomplete"), "wb") as f:
+        f.write(contents["file0.bin"][:1000])
+
+    d = Dataset("parallel", urls, str(tmp_path))
+    with pytest.raises(ValueError):
+        d.download(jobs=0)
+    with pytest.raises(ValueError):
+        d.download(jobs="2")
+
+    r = d.download(jobs=3)
+    assert r is d
+    assert sorted(os.listdir(d.save_folder)) == sorted(contents)
+    for filename, content in contents.items():
+        with open(os.path.join(d.save_folder, filename), "rb") as f:
+            assert f.read() == content
+
+
+def test_update(local_server, tmp_path):
+    content = local_server.add_file("growing.csv", 5000)
+    local_server.add_file("fixed.csv", 3000)
+    urls = [{"url": local_server.url("growing.csv"), "bytes": 5000},
+            {"url": local_server.url("fixed.csv")}]
+
+    d = Dataset("growing", urls, str(tmp_path)).download()
+    files = get_state(str(tmp_path)).get_files(d.name)
+    assert files["growing.csv"]["etag"] is not None
+    assert files["growing.csv"]["last_modified"] is not None
+
+    # Nothing changed: conditional requests only
+    del local_server.httpd.requests[:]
+    assert d.update() == []
+    assert local_server.httpd.requests == [
+        ("GET", "/growing.csv"), ("GET", "/fixed.csv")]
+
+    path = os.path.join(local_server.folder, "growing.csv")
+    with open(path, "ab") as f:
+        f.write(b"new rows")
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert d.update() == ["growing.csv"]
+    with open(os.path.join(d.save_folder, "growing.csv"), "rb") as f:
+        assert f.read() == content + b"new rows"
+    assert d.update() == []
+    # Larger than the "bytes" of the config, but not downloaded again
+    del local_server.httpd.requests[:]
+    d.download()
+    assert local_server.httpd.requests == []
+
+    # Downloaded without validators: compares the sizes
+    state = get_state(str(tmp_path))
+    with state.conn:
+        state.conn.execute("UPDATE files SET etag = NULL, "
+                           "last_modified = NULL")
+    state.set_file(d.name, "fixed.csv", "complete", 1)
+    assert d.update() == ["fixed.csv"]
+
+
+def test_update_extracted(local_server, tmp_path):
+    def add_archive(text):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+            info = tarfile.TarInfo("data.txt")
+            info.size = len(text)
+            tar.addfile(info, io.BytesIO(text))
+        path = os.path.join(local_server.folder, "data.tar.gz")
+        with open(path, "wb") as f:
+            f.write(buf.getvalue())
+        return path
+
+    add_archive(b"first version")
+    d = Dataset("archive", [{"url": local_server.url("data.tar.gz")}],
+                str(tmp_path)).download()
+    d.extract(remove_archive=True)
+
+    path = add_archive(b"second version")
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert d.update() == ["data.tar.gz"]
+
+    # Extracted again, and removed again
+    with open(os.path.join(d.save_folder, "data.txt"), "rb") as f:
+        assert f.read() == b"second version"
+    assert not os.path.exists(os.path.join(d.save_folder, "data.tar.gz"))
+    files = get_state(str(tmp_path)).get_files(d.name)
+    assert files["data.tar.gz"]["status"] == "extracted"
+    assert d.update() == []
+
+
+def test_update_append(local_server, tmp_path):
+    content = local_server.add_file("rows.csv", 100000)
+    path = os.path.join(local_server.folder, "rows.csv")
+    d = Dataset("rows", [{"url": local_server.url("rows.csv"),
+                          "bytes": len(content)}], str(tmp_path)).download()
+    f_name = os.path.join(d.save_folder, "rows.csv")
+
+    with open(path, "ab") as f:
+        f.write(b"new rows")
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    del local_server.httpd.requests[:]
+    assert d.update(append=True) == ["rows.csv"]
+    assert [r[0] for r in local_server.httpd.requests] == ["HEAD", "GET"]
+    with open(f_name, "rb") as f:
+        assert f.read() == content + b"new rows"
+    files = get_state(str(tmp_path)).get_files(d.name)
+    assert files["rows.csv"]["size"] == len(content) + 8
+    assert files["rows.csv"]["checksum"] is None
+    assert d.update(append=True) == []
+    del local_server.httpd.requests[:]
+    d.download()
+    assert local_server.httpd.requests == []
+
+    # An interrupted append to the only copy is resumed by the next download
+    with open(path, "ab") as f:
+        f.write(b"more rows")
+    os.utime(path, (time.time() + 12, time.time() + 12))
+    local_server.httpd.drop_after["/rows.csv"] = 64 * 1024 + 4
+    with pytest.raises(requests.exceptions.RequestException):
+        d.update(append=True)
+    files = get_state(str(tmp_path)).get_files(d.name)
+    assert files["rows.csv"]["status"] == "incomplete"
+    assert get_state(str(tmp_path)).get_status(d.name) == "incomplete"
+    d.download()
+    with open(f_name, "rb") as f:
+        assert f.read() == content + b"new rows" + b"more rows"
+
+    # An interrupted append to a shared file leaves it as it was
+    with open(path, "ab") as f:
+        f.write(b"again")
+    os.utime(path, (time.time() + 15, time.time() + 15))
+    os.link(f_name, os.path.join(str(tmp_path), "shared"))
+    local_server.httpd.drop_after["/rows.csv"] = 64 * 1024 + 4
+    with pytest.raises(requests.exceptions.RequestException):
+        d.update(append=True)
+    with open(f_name, "rb") as f:
+        assert f.read() == content + b"new rows" + b"more rows"
+    assert not os.path.exists(f_name + ".incomplete")
+
+    # Not only appended to: downloaded again
+    content = os.urandom(200000)
+    with open(path, "wb") as f:
+        f.write(content)
+    os.utime(path, (time.time() + 20, time.time() + 20))
+    assert d.update(append=True) == ["rows.csv"]
+    with open(f_name, "rb") as f:
+        assert f.read() == content
+
+
+def test_download_connection_dropped(local_server, tmp_path, monkeypatch):
+    monkeypatch.setitem(session._settings, "backoff_factor", 0)
+
+    content = local_server.add_file("data.bin", 300000)
+    local_server.httpd.drop_after["/data.bin"] = 100000
+    d = Dataset("dropped", [{"url": local_server.url("data.bin"),
+                             "bytes": len(content)}], str(tmp_path))
+    d.download()
+
+    with open(os.path.join(d.save_folder, "data.bin"), "rb") as f:
+        assert f.read() == content
+    assert local_server.httpd.requests == [("GET", "/data.bin")] * 2
+
+    # The drops are given up after `resumes` attempts without progress
+    monkeypatch.setitem(session._settings, "resumes", 1)
+    local_server.add_file("data2.bin", 300000)
+    local_server.httpd.drop_after = DropAlways(0)
+    d = Dataset("dropped2", [{"url": local_server.url("data2.bin"),
+                              "bytes": 300000}], str(tmp_path))
+    with pytest.raises(session.RESUMABLE_ERRORS):
+        d.download()
+
+
+class DropAlways(dict):
+    """Drops every connection after `n` bytes"""
+
+    def __init__(self, n):
+        super().__init__()
+        self.n = n
+
+    def pop(self, key, default=None):
+        return self.n
+
+
+def test_download_range_ignored(tmp_path):
+    # The server sends the whole file instead of the range asked for: the
+    # bytes already downloaded are replaced, not appended to
+    folder = tmp_path / "served"
+    folder.mkdir()
+    server = LocalServer(str(folder), accept_ranges=False)
+    try:
+        content = server.add_file("data.bin", 50000)
+        d = Dataset("noranges", [{"url": server.url("data.bin"),
+                                  "bytes": len(content)}], str(tmp_path))
+        with open(os.path.join(d.save_folder, "data.bin.incomplete"),
+                  "wb") as f:
+            f.write(content[:20000])
+        d.download()
+
+        with open(os.path.join(d.save_folder, "data.bin"), "rb") as f:
+            assert f.read() == content
+    finally:
+        server.close()
+
+
 if __name__ == "__main__":
-    pytest.main([__file__])
\ No newline at end of file
+    pytest.main([__file__])
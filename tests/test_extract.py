@@ -0,0 +1,185 @@
+import io
+import os
+import gzip
+import pytest
+import tarfile
+import zipfile
+
+from dafter.fetcher import Dataset
+from dafter.fetcher import extract
+from dafter.fetcher.extract import sniff_format
+from dafter.fetcher.extract import detect_format
+from dafter.fetcher.extract import extract_archive
+from dafter.fetcher.extract import StreamExtractor
+from dafter.fetcher.extract import extract_zip
+from dafter.fetcher.extract import split_members
+from dafter.fetcher.state import EXTRACTED, get_state
+
+
+MEMBERS = {
+    "data/train.csv": os.urandom(200000),
+    "data/test.csv": b"a,b\n1,2\n",
+    "README": b"hello",
+}
+
+
+def make_tar(mode="w:gz"):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode=mode) as tar:
+        for name, content in MEMBERS.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buf.getvalue()
+
+
+def make_zip():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, content in MEMBERS.items():
+            z.writestr(name, content)
+    return buf.getvalue()
+
+
+def check_members(folder):
+    for name, content in MEMBERS.items():
+        with open(os.path.join(folder, name), "rb") as f:
+            assert f.read() == content
+
+
+def test_sniff_format():
+    assert sniff_format(make_tar("w:gz")) == "tar.gz"
+    assert sniff_format(make_tar("w")) == "tar"
+    assert sniff_format(make_zip()) == "zip"
+    assert sniff_format(gzip.compress(b"a,b\n1,2\n")) == "gz"
+    assert sniff_format(b"a,b\n1,2\n") is None
+    assert sniff_format(b"") is None
+
+
+@pytest.mark.parametrize("archive", ["tar", "tar.gz", "zip"])
+def test_extract_archive(tmp_path, archive):
+    content = make_zip() if archive == "zip" else \
+        make_tar("w:gz" if archive == "tar.gz" else "w")
+    path = os.path.join(str(tmp_path), "archive")
+    with open(path, "wb") as f:
+        f.write(content)
+
+    folder = os.path.join(str(tmp_path), "out")
+    os.makedirs(folder)
+    assert detect_format(path) == archive
+    assert extract_archive(path, folder) == archive
+    check_members(folder)
+
+
+def test_split_members():
+    infos = []
+    for name, size in [("a", 10), ("b", 70), ("c", 40), ("d", 30), ("e", 20)]:
+        info = zipfile.ZipInfo(name)
+        info.compress_size = size
+        infos.append(info)
+
+    assert split_members(infos, 2) == [["b", "e"], ["c", "d", "a"]]
+    assert split_members(infos, 1) == [["b", "c", "d", "e", "a"]]
+    assert split_members(infos[:2], 4) == [["b"], ["a"]]
+
+
+def test_extract_zip_parallel(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract, "MIN_PARALLEL_SIZE", 0)
+
+    path = os.path.join(str(tmp_path), "data.zip")
+    with open(path, "wb") as f:
+        f.write(make_zip())
+
+    folder = os.path.join(str(tmp_path), "out")
+    os.makedirs(folder)
+    assert extract_zip(path, folder, jobs=2) == sum(len(c) for c in MEMBERS.values())
+    check_members(folder)
+
+    with pytest.raises(ValueError):
+        extract_zip(path, folder, jobs=0)
+
+    # A corrupted member fails its CRC check
+    content = bytearray(make_zip())
+    offset = content.index(MEMBERS["data/train.csv"][1000:1100])
+    content[offset] ^= 0xff
+    with open(path, "wb") as f:
+        f.write(content)
+    with pytest.raises(zipfile.BadZipFile):
+        extract_zip(path, folder, jobs=2)
+
+
+def test_extract_archive_unsafe(tmp_path):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        info = tarfile.TarInfo("../evil.txt")
+        info.size = 4
+        tar.addfile(info, io.BytesIO(b"evil"))
+    path = os.path.join(str(tmp_path), "evil.tar")
+    with open(path, "wb") as f:
+        f.write(buf.getvalue())
+
+    folder = os.path.join(str(tmp_path), "out")
+    os.makedirs(folder)
+    with pytest.raises(Exception):
+        extract_archive(path, folder)
+    assert not os.path.exists(os.path.join(str(tmp_path), "evil.txt"))
+
+
+@pytest.mark.parametrize("keep_archive", [True, False])
+def test_stream_extractor(tmp_path, keep_archive):
+    content = make_tar("w:gz")
+    archive = os.path.join(str(tmp_path), "data.tar.gz.incomplete")
+
+    extractor = StreamExtractor(str(tmp_path), "data.tar.gz", archive,
+                                keep_archive)
+    for i in range(0, len(content), 1000):
+        extractor.write(memoryview(content)[i:i + 1000])
+    extractor.close()
+
+    assert extractor.format == "tar.gz"
+    assert extractor.extracted
+    assert extractor.size == len(content)
+    check_members(str(tmp_path))
+    assert os.path.exists(archive) == keep_archive
+
+    # A gz file is decompressed next to it
+    data = os.urandom(100000)
+    extractor = StreamExtractor(str(tmp_path), "table.tsv.gz",
+                                archive + "2", False)
+    extractor.write(gzip.compress(data))
+    extractor.close()
+    with open(os.path.join(str(tmp_path), "table.tsv"), "rb") as f:
+        assert f.read() == data
+
+    # A zip file can only be stored
+    content = make_zip()
+    extractor = StreamExtractor(str(tmp_path), "data.zip", archive + "3",
+                                False)
+    extractor.write(content)
+    extractor.close()
+    assert not extractor.extracted
+    with open(archive + "3", "rb") as f:
+        assert f.read() == content
+
+
+def test_download_stream_extract(local_server, tmp_path):
+    for name, content in [("data.tar.gz", make_tar("w:gz")),
+                          ("data.zip", make_zip())]:
+        with open(os.path.join(local_server.folder, name), "wb") as f:
+            f.write(content)
+    urls = [{"url": local_server.url("data.tar.gz")},
+            {"url": local_server.url("data.zip")}]
+
+    save_path = str(tmp_path)
+    d = Dataset("archives", urls, save_path)
+    d.download(stream_extract=True, remove_archive=True)
+
+    check_members(d.save_folder)
+    assert sorted(os.listdir(d.save_folder)) == ["README", "data"]
+    files = get_state(save_path).get_files(d.name)
+    assert files["data.tar.gz"]["status"] == EXTRACTED
+    assert files["data.zip"]["status"] == EXTRACTED
+
+    # The removed archives are not downloaded again
+    assert d._pending_files() == []
+    assert get_state(save_path).get_status(d.name) == "complete"
@@ -0,0 +1,151 @@
+import io
+import os
+import gzip
+import json
+import pickle
+import pytest
+import tarfile
+
+np = pytest.importorskip("numpy")
+
+from dafter.fetcher import hooks
+from dafter.fetcher import Dataset
+from dafter.fetcher.fetcher import post_process
+from dafter.fetcher.hooks import run_hooks
+from dafter.fetcher.hooks import register_hook
+from dafter.fetcher.hooks import get_hook_entries
+from dafter.fetcher.loader import load
+
+
+MNIST_HOOK = {
+    "name": "pickle-arrays",
+    "file": "mnist.pkl.gz",
+    "arrays": [["train_x", "train_y"], ["test_x", "test_y"]],
+}
+
+
+def write_mnist(folder):
+    train_x = np.random.rand(20, 784).astype(np.float32)
+    train_y = np.arange(20, dtype=np.int64) % 10
+    test_x = np.random.rand(5, 784).astype(np.float32)
+    test_y = np.arange(5, dtype=np.int64)
+    with gzip.open(os.path.join(folder, "mnist.pkl.gz"), "wb") as f:
+        pickle.dump(((train_x, train_y), (test_x, test_y)), f, protocol=2)
+    return train_x, train_y
+
+
+def test_get_hook_entries():
+    assert get_hook_entries(None) == []
+    assert get_hook_entries(["a", {"name": "b", "x": 1}]) == \
+        [{"name": "a"}, {"name": "b", "x": 1}]
+    with pytest.raises(ValueError):
+        get_hook_entries([{"x": 1}])
+
+
+def test_pickle_arrays(tmp_path):
+    folder = os.path.join(str(tmp_path), "mnist")
+    os.makedirs(folder)
+    train_x, train_y = write_mnist(folder)
+
+    assert run_hooks(folder, [MNIST_HOOK]) == ["pickle-arrays"]
+    with open(os.path.join(folder, "manifest.json")) as f:
+        manifest = json.load(f)
+    assert manifest["hooks"] == [MNIST_HOOK]
+    assert manifest["arrays"]["train_x"] == {
+        "file": "train_x.npy", "dtype": "float32", "shape": [20, 784]}
+
+    # Runs only once
+    assert run_hooks(folder, [MNIST_HOOK]) == []
+
+    dataset = load("mnist", save_path=str(tmp_path))
+    assert dataset.keys() == ["test_x", "test_y", "train_x", "train_y"]
+    assert (dataset["train_x"] == train_x).all()
+    assert (dataset["train_y"] == train_y).all()
+
+
+def test_pickle_arrays_without_numpy(tmp_path, monkeypatch, capsys):
+    folder = os.path.join(str(tmp_path), "mnist")
+    os.makedirs(folder)
+    write_mnist(folder)
+    monkeypatch.setattr(hooks, "numpy", None)
+
+    dataset = Dataset("mnist", [{"url": "http://localhost/mnist.pkl.gz"}],
+                      str(tmp_path))
+    assert post_process(dataset, {"hooks": [MNIST_HOOK]})
+    assert "pip install dafter[convert]" in capsys.readouterr().out
+    # Not recorded as run
+    assert not os.path.exists(os.path.join(folder, "manifest.json"))
+
+
+def test_pickle_arrays_refuses_code(tmp_path):
+    folder = str(tmp_path)
+    with open(os.path.join(folder, "evil.pkl"), "wb") as f:
+        pickle.dump(os.system, f)
+
+    hook = {"name": "pickle-arrays", "file": "evil.pkl", "arrays": "x"}
+    with pytest.raises(pickle.UnpicklingError):
+        run_hooks(folder, [hook])
+
+
+def write_cifar(folder):
+    batches = {}
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for name in ["data_batch_1", "data_batch_2", "test_batch"]:
+            batch = {"data": np.random.randint(0, 256, (4, 3072), np.uint8),
+                     "labels": [1, 2, 3, 4]}
+            batches[name] = batch
+            content = pickle.dumps(batch, protocol=2)
+            info = tarfile.TarInfo("cifar-10-batches-py/" + name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    with open(os.path.join(folder, "cifar-10-python.tar.gz"), "wb") as f:
+        f.write(buf.getvalue())
+    return batches
+
+
+CIFAR_HOOK = {
+    "name": "cifar-batches",
+    "file": "cifar-10-python.tar.gz",
+    "batches": {"train": ["data_batch_1", "data_batch_2"],
+                "test": ["test_batch"]},
+}
+
+
+@pytest.mark.parametrize("extracted", [False, True])
+def test_cifar_batches(tmp_path, extracted):
+    folder = os.path.join(str(tmp_path), "cifar")
+    os.makedirs(folder)
+    batches = write_cifar(folder)
+    if extracted:
+        archive = os.path.join(folder, "cifar-10-python.tar.gz")
+        with tarfile.open(archive) as tar:
+            tar.extractall(folder)
+        os.remove(archive)
+
+    assert run_hooks(folder, [CIFAR_HOOK]) == ["cifar-batches"]
+    dataset = load("cifar", save_path=str(tmp_path))
+    assert dataset.keys() == ["test_x", "test_y", "train_x", "train_y"]
+    assert dataset["train_x"].shape == (8, 3, 32, 32)
+    assert (dataset["train_x"][4].ravel() ==
+            batches["data_batch_2"]["data"][0]).all()
+    assert dataset["train_y"].tolist() == [1, 2, 3, 4] * 2
+    assert dataset["test_x"].dtype == np.uint8
+
+
+def test_register_hook(tmp_path, monkeypatch):
+    monkeypatch.setattr(hooks, "HOOKS", dict(hooks.HOOKS))
+    calls = []
+
+    @register_hook("ones")
+    def ones(folder, size=3):
+        calls.append(size)
+        return hooks.save_arrays(folder, {"ones": np.ones(size)})
+
+    folder = str(tmp_path)
+    assert run_hooks(folder, [{"name": "ones", "size": 4}]) == ["ones"]
+    assert calls == [4]
+    assert np.load(os.path.join(folder, "ones.npy")).shape == (4,)
+
+    with pytest.raises(ValueError):
+        run_hooks(folder, ["unknown"])
@@ -0,0 +1,64 @@
+import os
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import dafter
+from dafter.fetcher.loader import load
+from dafter.fetcher.loader import TextColumn
+
+
+def test_load_npy(tmp_path):
+    folder = os.path.join(str(tmp_path), "digits")
+    os.makedirs(os.path.join(folder, "train"))
+    x = np.arange(60, dtype=np.uint8).reshape(3, 4, 5)
+    np.save(os.path.join(folder, "train", "x.npy"), x)
+    np.save(os.path.join(folder, "y.npy"), np.array([1, 2, 3]))
+
+    dataset = load("digits", save_path=str(tmp_path))
+    assert dataset.keys() == ["train/x", "y"]
+    assert "y" in dataset and len(dataset) == 2
+    assert dataset.loaded == {}
+
+    train_x = dataset["train/x"]
+    assert isinstance(train_x, np.memmap)
+    assert (train_x == x).all()
+    assert dataset["train/x"] is train_x
+    with pytest.raises(KeyError):
+        dataset["test/x"]
+
+
+def test_load_converted(tmp_path):
+    pytest.importorskip("pyarrow")
+    from dafter.fetcher.convert import convert_file
+
+    folder = os.path.join(str(tmp_path), "table")
+    os.makedirs(folder)
+    path = os.path.join(folder, "data.csv")
+    with open(path, "w") as f:
+        f.write("id,name\n1,one\n2,\n3,three\n")
+
+    convert_file(path, "npy")
+    columns = load("table", save_path=str(tmp_path))["data"]
+    assert columns["id"].tolist() == [1, 2, 3]
+    assert isinstance(columns["name"], TextColumn)
+    assert list(columns["name"]) == ["one", "", "three"]
+    assert columns["name"][-1] == "three"
+
+    convert_file(path, "arrow")
+    table = load("table", save_path=str(tmp_path))["data"]
+    assert table.column("id").to_pylist() == [1, 2, 3]
+
+
+def test_load_errors(tmp_path):
+    with pytest.raises(ValueError):
+        load("not downloaded", save_path=str(tmp_path))
+    os.makedirs(os.path.join(str(tmp_path), "empty"))
+    with pytest.raises(ValueError):
+        load("empty", save_path=str(tmp_path))
+    with pytest.raises(ValueError):
+        load(None)
+
+
+def test_load_is_exported():
+    assert dafter.load is load
@@ -0,0 +1,108 @@
+import os
+import json
+import hashlib
+
+from dafter.fetcher import Dataset
+from dafter.fetcher.metrics import emit
+from dafter.fetcher.metrics import add_sink
+from dafter.fetcher.metrics import open_sink
+from dafter.fetcher.metrics import remove_sink
+from dafter.fetcher.metrics import JSONLinesSink
+from dafter.fetcher.metrics import PrometheusSink
+
+
+def test_callback_sink(local_server, tmp_path):
+    sha256 = hashlib.sha256(local_server.add_file("a.bin", 30000)).hexdigest()
+    local_server.add_file("b.bin", 20000)
+    dataset = Dataset("metrics", [{"url": local_server.url("a.bin"),
+                                   "sha256": sha256},
+                                  {"url": local_server.url("b.bin")}],
+                      str(tmp_path / "datasets"))
+
+    events = []
+    sink = add_sink(events.append)
+    try:
+        dataset.download(jobs=2)
+    finally:
+        remove_sink(sink)
+
+    files = sorted((e for e in events if e["event"] == "file"),
+                   key=lambda e: e["file"])
+    assert [e["file"] for e in files] == ["a.bin", "b.bin"]
+    assert [e["bytes"] for e in files] == [30000, 20000]
+    for e in files:
+        assert e["status"] == "complete"
+        assert e["dataset"] == "metrics"
+        assert e["host"] == "localhost:{}".format(
+            local_server.httpd.server_port)
+        assert e["resume_offset"] == 0
+        assert e["ttfb_s"] > 0
+        assert e["retries"] == 0
+    # Only the file with a checksum is verified
+    assert files[0]["verify_s"] >= 0
+    assert files[1]["verify_s"] is None
+
+    datasets = [e for e in events if e["event"] == "dataset"]
+    assert len(datasets) == 1
+    assert datasets[0]["files"] == 2
+    assert datasets[0]["failed"] == 0
+    assert datasets[0]["bytes"] == 50000
+
+    # No sink: nothing is recorded
+    dataset.download()
+    assert len(events) == 3
+
+
+def test_resume_offset(local_server, tmp_path):
+    content = local_server.add_file("data.bin", 30000)
+    dataset = Dataset("metrics", [{"url": local_server.url("data.bin")}],
+                      str(tmp_path / "datasets"))
+    path = os.path.join(dataset.save_folder, "data.bin.incomplete")
+    with open(path, "wb") as f:
+        f.write(content[:10000])
+
+    events = []
+    sink = add_sink(events.append)
+    try:
+        dataset.download()
+    finally:
+        remove_sink(sink)
+
+    assert events[0]["resume_offset"] == 10000
+    assert events[0]["bytes"] == 20000
+
+
+def test_json_lines_sink(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    sink = open_sink(path)
+    assert isinstance(sink, JSONLinesSink)
+    add_sink(sink)
+    try:
+        emit("dataset", dataset="a", bytes=10)
+        emit("dataset", dataset="b", bytes=20)
+    finally:
+        remove_sink(sink)
+
+    with open(path) as f:
+        events = [json.loads(line) for line in f]
+    assert [e["dataset"] for e in events] == ["a", "b"]
+    assert all(e["event"] == "dataset" and "time" in e for e in events)
+
+
+def test_prometheus_sink(tmp_path):
+    path = str(tmp_path / "dafter.prom")
+    sink = open_sink(path)
+    assert isinstance(sink, PrometheusSink)
+    event = {"event": "file", "dataset": "a", "host": "example.com",
+             "status": "complete", "bytes": 100, "seconds": 0.5,
+             "retries": 1, "verify_s": 0.1, "ttfb_s": 0.2}
+    sink.emit(event)
+    sink.emit(dict(event, bytes=50, ttfb_s=0.3))
+
+    with open(path) as f:
+        text = f.read()
+    assert "# TYPE dafter_bytes_total counter" in text
+    assert 'dafter_bytes_total{dataset="a",host="example.com"} 150' in text
+    assert 'dafter_files_total{dataset="a",status="complete"} 2' in text
+    assert 'dafter_retries_total{host="example.com"} 2' in text
+    assert 'dafter_ttfb_seconds{host="example.com"} 0.3' in text
@@ -0,0 +1,140 @@
+import os
+import pytest
+
+from dafter.fetcher import Dataset
+from dafter.fetcher import dataset
+from dafter.fetcher import mirrors
+from dafter.fetcher import session
+from dafter.fetcher import segmented
+from dafter.fetcher.mirrors import get_sources
+from dafter.fetcher.mirrors import clear_probes
+from dafter.fetcher.mirrors import rank_sources
+from dafter.fetcher.mirrors import with_failover
+
+from conftest import LocalServer
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    folder = tmp_path / "mirror"
+    folder.mkdir()
+    server = LocalServer(str(folder))
+    yield server
+    server.close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setitem(session._settings, "backoff_factor", 0)
+    clear_probes()
+    yield
+    clear_probes()
+
+
+def add_file(servers, filename, size):
+    content = os.urandom(size)
+    for server in servers:
+        with open(os.path.join(server.folder, filename), "wb") as f:
+            f.write(content)
+    return content
+
+
+def test_get_sources():
+    assert get_sources({"url": "http://a/f"}) == ["http://a/f"]
+    assert get_sources({"url": "http://a/f",
+                        "mirrors": ["http://b/f", "http://a/f"]}) == \
+        ["http://a/f", "http://b/f"]
+
+
+def test_rank_sources(local_server, tmp_path):
+    folder = tmp_path / "noranges"
+    folder.mkdir()
+    noranges = LocalServer(str(folder), accept_ranges=False)
+    try:
+        add_file([local_server, noranges], "data.bin", 200000)
+        down = "http://127.0.0.1:1/data.bin"
+        sources = [down, noranges.url("data.bin"),
+                   local_server.url("data.bin")]
+        assert rank_sources(sources) == [local_server.url("data.bin"),
+                                         noranges.url("data.bin"), down]
+
+        # Probed once per url, the sources down again each time
+        add_file([local_server], "other.bin", 1000)
+        assert rank_sources(sources + [local_server.url("other.bin")]) == [
+            local_server.url("data.bin"), local_server.url("other.bin"),
+            noranges.url("data.bin"), down]
+        assert local_server.httpd.requests == [("GET", "/data.bin"),
+                                               ("GET", "/other.bin")]
+        assert down not in mirrors._probes
+    finally:
+        noranges.close()
+
+
+def test_probe_bypasses_cache(local_server, monkeypatch):
+    local_server.add_file("data.bin", 1000)
+    # A cache down would fail the probe
+    monkeypatch.setattr(session, "_cache_url", "http://127.0.0.1:1")
+    assert mirrors.probe(local_server.url("data.bin"))["ranges"]
+
+
+def test_with_failover():
+    used = []
+
+    def transfer(source):
+        used.append(source)
+        raise ValueError("no range")
+
+    call = with_failover(transfer, ["a", "b"], first=1)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            call()
+    assert used == ["b", "a", "b"]
+
+    # A single source raises its own errors
+    with pytest.raises(ValueError):
+        with_failover(transfer, ["a"])()
+
+
+def test_failover(local_server, mirror, tmp_path, monkeypatch):
+    # Sources in the order of the config
+    monkeypatch.setattr(dataset, "rank_sources", lambda sources: sources)
+
+    content = add_file([local_server, mirror], "data.bin", 300000)
+    # The first source drops the connection after 100000 bytes
+    local_server.httpd.drop_after["/data.bin"] = 100000
+    d = Dataset("mirrors", [{"url": local_server.url("data.bin"),
+                             "mirrors": [mirror.url("data.bin")],
+                             "bytes": len(content)}], str(tmp_path))
+    d.download()
+
+    with open(os.path.join(d.save_folder, "data.bin"), "rb") as f:
+        assert f.read() == content
+    # Resumed from the mirror after the drop
+    assert local_server.httpd.requests == [("GET", "/data.bin")]
+    assert mirror.httpd.requests == [("GET", "/data.bin")]
+
+
+def test_missing_on_primary(local_server, mirror, tmp_path):
+    content = add_file([mirror], "data.bin", 50000)
+    d = Dataset("mirrors", [{"url": local_server.url("data.bin"),
+                             "mirrors": [mirror.url("data.bin")]}],
+                str(tmp_path))
+    d.download()
+    with open(os.path.join(d.save_folder, "data.bin"), "rb") as f:
+        assert f.read() == content
+
+
+def test_striped_segments(local_server, mirror, tmp_path, monkeypatch):
+    monkeypatch.setattr(segmented, "MIN_SEGMENT_SIZE", 1000)
+
+    content = add_file([local_server, mirror], "data.bin", 400000)
+    d = Dataset("striped", [{"url": local_server.url("data.bin"),
+                             "mirrors": [mirror.url("data.bin")],
+                             "bytes": len(content)}], str(tmp_path))
+    d.download(segments=4)
+
+    with open(os.path.join(d.save_folder, "data.bin"), "rb") as f:
+        assert f.read() == content
+    # The probe, then 2 segments from each source
+    for server in [local_server, mirror]:
+        assert server.httpd.requests.count(("GET", "/data.bin")) == 3
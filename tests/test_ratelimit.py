@@ -0,0 +1,81 @@
+import time
+import datetime
+import pytest
+
+from dafter.fetcher import Dataset
+from dafter.fetcher.ratelimit import reserve
+from dafter.fetcher.ratelimit import TokenBucket
+from dafter.fetcher.ratelimit import parse_limits
+from dafter.fetcher.ratelimit import parse_schedule
+from dafter.fetcher.ratelimit import set_rate_limit
+from dafter.fetcher.ratelimit import get_scheduled_rate
+
+
+@pytest.fixture
+def rate_limit():
+    yield set_rate_limit
+    set_rate_limit()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(1000, burst=1.)
+    # The burst is let through at once, the next bytes at the rate
+    assert bucket.reserve(1000) == 0.
+    assert bucket.reserve(500) == pytest.approx(0.5, abs=0.05)
+    assert bucket.reserve(500) == pytest.approx(1., abs=0.05)
+
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_parse_limits():
+    assert parse_limits(["50M", "image-net.org=10k"]) == \
+        (50 * 1024 ** 2, {"image-net.org": 10 * 1024})
+    assert parse_limits(["Example.com=unlimited"]) == \
+        (None, {"example.com": None})
+    with pytest.raises(ValueError):
+        parse_limits(["=10M"])
+    with pytest.raises(ValueError):
+        parse_limits(["fast"])
+
+
+def test_schedule():
+    schedule = parse_schedule(["09:00-18:00=5M", "22-6=unlimited"])
+    assert schedule == [(540, 1080, 5 * 1024 ** 2), (1320, 360, None)]
+
+    def at(hour, minute=0):
+        return datetime.datetime(2020, 1, 1, hour, minute)
+
+    assert get_scheduled_rate(schedule, 1000, at(9)) == 5 * 1024 ** 2
+    assert get_scheduled_rate(schedule, 1000, at(17, 59)) == 5 * 1024 ** 2
+    assert get_scheduled_rate(schedule, 1000, at(18)) == 1000
+    assert get_scheduled_rate(schedule, 1000, at(23)) is None
+    assert get_scheduled_rate(schedule, 1000, at(3)) is None
+
+    for entry in ["09:00-18:00", "25:00-18:00=5M", "09:00-18:00=fast"]:
+        with pytest.raises(ValueError):
+            parse_schedule([entry])
+
+
+def test_per_host(rate_limit):
+    rate_limit(per_host={"example.com": 1000})
+    assert reserve("http://other.com/a", 10 ** 6) == 0.
+    assert reserve("http://example.com:8080/a", 1000) == 0.
+    assert reserve("http://example.com/a", 1000) > 0.5
+
+    with pytest.raises(ValueError):
+        rate_limit(rate=-1)
+
+
+def test_download_limited(local_server, tmp_path, rate_limit):
+    content = local_server.add_file("data.bin", 150 * 1024)
+    dataset = Dataset("limited", [{"url": local_server.url("data.bin")}],
+                      str(tmp_path))
+
+    rate_limit(rate=100 * 1024)
+    start = time.monotonic()
+    dataset.download(chunk_size=16 * 1024)
+    # 100k of burst, then 50k at 100k/s
+    assert time.monotonic() - start > 0.4
+    with open(str(tmp_path / "limited" / "data.bin"), "rb") as f:
+        assert f.read() == content
@@ -0,0 +1,115 @@
+import time
+import pytest
+import threading
+
+from dafter.fetcher.scheduler import Scheduler
+from dafter.fetcher.scheduler import order_tasks
+from dafter.fetcher.scheduler import format_stats
+
+
+def make_task(url, total_bytes=None):
+    return {"url": url, "total_bytes": total_bytes}
+
+
+class FakeDataset:
+    """Pretends to download its files, and records how many files of each host
+    are downloaded at the same time"""
+
+    def __init__(self, name, tasks, monitor, fail=()):
+        self.name = name
+        self.tasks = tasks
+        self.monitor = monitor
+        self.fail = fail
+
+    def _pending_files(self):
+        return list(self.tasks)
+
+    def _fetch(self, task, **kwargs):
+        host = task["url"].split("/")[2]
+        with self.monitor["lock"]:
+            self.monitor["running"][host] = self.monitor["running"].get(host, 0) + 1
+            self.monitor["total"] += 1
+            self.monitor["max_host"] = max(self.monitor["max_host"],
+                                           self.monitor["running"][host])
+            self.monitor["max_total"] = max(self.monitor["max_total"],
+                                            self.monitor["total"])
+        time.sleep(0.02)
+        with self.monitor["lock"]:
+            self.monitor["running"][host] -= 1
+            self.monitor["total"] -= 1
+        if task["url"] in self.fail:
+            raise IOError("failed")
+        return task["total_bytes"] or 0
+
+    def _emit_dataset(self, tasks, seconds):
+        pass
+
+
+def new_monitor():
+    return {"lock": threading.Lock(), "running": {}, "total": 0,
+            "max_host": 0, "max_total": 0}
+
+
+def test_order_tasks():
+    a1 = ("d", make_task("http://a.com/1", 10))
+    a2 = ("d", make_task("http://a.com/2", 30))
+    a3 = ("d", make_task("http://a.com/3"))
+    b1 = ("d", make_task("http://b.com/1", 20))
+    tasks = [a1, a2, a3, b1]
+
+    assert order_tasks(tasks, "size") == [a2, b1, a1, a3]
+    assert order_tasks(tasks, "host") == [a1, b1, a2, a3]
+    assert order_tasks(tasks, "config") == tasks
+
+
+def test_scheduler_limits():
+    monitor = new_monitor()
+    tasks_a = [make_task("http://a.com/{}".format(i), 100) for i in range(8)]
+    tasks_b = [make_task("http://b.com/{}".format(i), 10) for i in range(8)]
+    scheduler = Scheduler(jobs=6, per_host=2)
+    scheduler.add(FakeDataset("a", tasks_a, monitor))
+    scheduler.add(FakeDataset("b", tasks_b, monitor))
+
+    stats = scheduler.run()
+    assert stats["files"] == 16
+    assert stats["bytes"] == 8 * 110
+    assert stats["errors"] == []
+    assert monitor["max_host"] == 2
+    assert monitor["max_total"] <= 4
+    assert "16 files" in format_stats(stats)
+
+    monitor = new_monitor()
+    scheduler = Scheduler(jobs=3, per_host=None)
+    scheduler.add(FakeDataset("a", tasks_a, monitor))
+    scheduler.run()
+    assert monitor["max_host"] == 3
+
+
+def test_scheduler_errors():
+    monitor = new_monitor()
+    tasks = [make_task("http://a.com/{}".format(i)) for i in range(4)]
+    failing = FakeDataset("a", tasks, monitor, fail=("http://a.com/2",))
+
+    scheduler = Scheduler(jobs=2)
+    scheduler.add(failing)
+    stats = scheduler.run(fail_fast=False)
+    assert stats["files"] == 3
+    assert len(stats["errors"]) == 1
+    assert stats["errors"][0][0] is failing
+    assert stats["errors"][0][1]["url"] == "http://a.com/2"
+
+    scheduler = Scheduler(jobs=2)
+    scheduler.add(failing)
+    with pytest.raises(IOError):
+        scheduler.run()
+
+    with pytest.raises(ValueError):
+        Scheduler(jobs=0)
+    with pytest.raises(ValueError):
+        Scheduler(per_host=0)
+    with pytest.raises(ValueError):
+        Scheduler(order="random")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
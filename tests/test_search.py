@@ -0,0 +1,87 @@
+import time
+import pytest
+
+from dafter.fetcher.search import iter_bits
+from dafter.fetcher.search import SearchIndex
+from dafter.fetcher.search import get_trigrams
+from dafter.fetcher.search import get_search_index
+
+
+def make_catalog(configs):
+    return {"configs": {c["name"]: c for c in configs}}
+
+
+CONFIGS = [
+    {"name": "mnist", "tags": ["image", "dl"],
+     "description": "The MNIST database of handwritten digits"},
+    {"name": "fashion-mnist", "tags": ["image"],
+     "description": "Images of clothes"},
+    {"name": "imdb-reviews", "tags": ["text", "dl"],
+     "description": "Movie reviews for sentiment analysis"},
+    {"name": "colleges", "tags": ["csv"], "description": None},
+]
+
+
+def test_helpers():
+    assert get_trigrams("mnist") == {"mni", "nis", "ist"}
+    assert get_trigrams("mn") == set()
+    assert list(iter_bits(0b101001)) == [0, 3, 5]
+    assert list(iter_bits(0)) == []
+
+
+def test_match():
+    index = SearchIndex(make_catalog(CONFIGS))
+
+    def names(configs):
+        return [c["name"] for c in configs]
+
+    assert names(index.match()) == ["colleges", "fashion-mnist",
+                                    "imdb-reviews", "mnist"]
+    assert names(index.match("mnist")) == ["fashion-mnist", "mnist"]
+    assert names(index.match("mn")) == ["fashion-mnist", "mnist"]
+    assert names(index.match("nist", ["dl"])) == ["mnist"]
+    assert names(index.match(None, ["image", "dl"])) == ["mnist"]
+    assert names(index.match(None, ["image", "unknown"])) == []
+    assert names(index.match("MNIST")) == []
+    assert names(index.match("tsinm")) == []
+
+
+def test_fuzzy():
+    index = SearchIndex(make_catalog(CONFIGS))
+
+    results = index.fuzzy("mnist")
+    assert [c["name"] for _, c in results][:2] == ["mnist", "fashion-mnist"]
+    assert results[0][0] == 1.
+
+    # Typos and words of the description
+    assert index.fuzzy("handwriten digit")[0][1]["name"] == "mnist"
+    assert index.fuzzy("movie review")[0][1]["name"] == "imdb-reviews"
+
+    assert index.fuzzy("mnist", tags=["text"]) == []
+    assert index.fuzzy("zzzzzz") == []
+    assert index.fuzzy("") == []
+    assert len(index.fuzzy("mnist", limit=1)) == 1
+
+
+def test_large_catalog():
+    configs = [{"name": "dataset-{}".format(i), "tags": ["tag{}".format(i % 50)],
+                "description": "Synthetic dataset number {}".format(i)}
+               for i in range(20000)]
+    index = SearchIndex(make_catalog(configs))
+
+    start = time.time()
+    for _ in range(100):
+        r = index.match("dataset-1234", ["tag34"])
+    elapsed = (time.time() - start) / 100
+    assert [c["name"] for c in r] == ["dataset-1234"]
+    assert elapsed < 0.05
+
+
+def test_get_search_index():
+    index = get_search_index()
+    assert get_search_index() is index
+    assert [c["name"] for c in index.match("colleges")] == ["colleges"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
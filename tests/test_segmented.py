@@ -0,0 +1,114 @@
+import os
+import json
+import pytest
+
+from dafter.fetcher import Dataset
+from dafter.fetcher import session
+from dafter.fetcher import segmented
+from dafter.fetcher.segmented import split_segments
+from dafter.fetcher.segmented import get_sidecar_path
+from dafter.fetcher.segmented import download_segmented
+
+from conftest import LocalServer
+
+
+def test_split_segments(monkeypatch):
+    monkeypatch.setattr(segmented, "MIN_SEGMENT_SIZE", 10)
+
+    assert split_segments(100, 4) == [[0, 24, 0], [25, 49, 0], [50, 74, 0],
+                                      [75, 99, 0]]
+    assert split_segments(103, 2) == [[0, 50, 0], [51, 102, 0]]
+    # Never smaller than MIN_SEGMENT_SIZE
+    assert split_segments(25, 8) == [[0, 11, 0], [12, 24, 0]]
+    assert split_segments(5, 8) == [[0, 4, 0]]
+
+
+def test_download_segmented(local_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(segmented, "MIN_SEGMENT_SIZE", 1000)
+
+    content = local_server.add_file("big.bin", 100003)
+    url = local_server.url("big.bin")
+    dst = os.path.join(str(tmp_path), "big.bin.incomplete")
+
+    assert download_segmented(url, dst, len(content), segments=4) == True
+    assert not os.path.exists(get_sidecar_path(dst))
+    with open(dst, "rb") as f:
+        assert f.read() == content
+
+    # Announced size different from the real one
+    with pytest.raises(ValueError):
+        download_segmented(url, dst + "2", 12, segments=4)
+
+
+def test_resume_segmented(local_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(segmented, "MIN_SEGMENT_SIZE", 1000)
+
+    content = local_server.add_file("big.bin", 40000)
+    url = local_server.url("big.bin")
+
+    # Interrupted download: first segment done, second one half done, third
+    # one not started. The missing parts are filled with zeros.
+    save_folder = os.path.join(str(tmp_path), "segments")
+    os.makedirs(save_folder)
+    dst = os.path.join(save_folder, "big.bin.incomplete")
+    with open(dst, "wb") as f:
+        f.truncate(len(content))
+        f.write(content[:10000])
+        f.seek(20000)
+        f.write(content[20000:25000])
+    state = {
+        "url": url,
+        "total_bytes": len(content),
+        "segments": [[0, 9999, 10000], [10000, 19999, 0], [20000, 39999, 5000]]
+    }
+    with open(get_sidecar_path(dst), "w") as f:
+        json.dump(state, f)
+
+    # The incomplete file already has its final size, but must not be taken
+    # for a complete one
+    d = Dataset("segments", [{"url": url, "bytes": len(content)}],
+                str(tmp_path))
+    d.download()
+
+    assert os.listdir(save_folder) == ["big.bin"]
+    with open(os.path.join(save_folder, "big.bin"), "rb") as f:
+        assert f.read() == content
+
+
+def test_segmented_without_ranges(tmp_path):
+    folder = tmp_path / "served"
+    folder.mkdir()
+    server = LocalServer(str(folder), accept_ranges=False)
+    try:
+        content = server.add_file("file.bin", 5000)
+        url = server.url("file.bin")
+        dst = os.path.join(str(tmp_path), "file.bin.incomplete")
+        assert download_segmented(url, dst, segments=4) == False
+        assert not os.path.exists(dst)
+
+        # Falls back to a single connection
+        d = Dataset("noranges", [{"url": url}], str(tmp_path))
+        d.download(segments=4)
+        with open(os.path.join(d.save_folder, "file.bin"), "rb") as f:
+            assert f.read() == content
+    finally:
+        server.close()
+
+
+
+def test_segment_dropped(local_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(segmented, "MIN_SEGMENT_SIZE", 1000)
+    monkeypatch.setitem(session._settings, "backoff_factor", 0)
+
+    content = local_server.add_file("big.bin", 100000)
+    local_server.httpd.drop_after["/big.bin"] = 10000
+    dst = os.path.join(str(tmp_path), "big.bin.incomplete")
+
+    # The segment whose connection dropped is resumed on its own
+    assert download_segmented(local_server.url("big.bin"), dst, segments=2)
+    with open(dst, "rb") as f:
+        assert f.read() == content
+    assert local_server.httpd.requests.count(("GET", "/big.bin")) == 3
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,97 @@
+import pytest
+
+from dafter.fetcher import session
+from dafter.fetcher.session import get_session
+from dafter.fetcher.session import get_backoff
+from dafter.fetcher.session import close_session
+from dafter.fetcher.session import resume_on_error
+from dafter.fetcher.session import configure_session
+from dafter.fetcher.session import reserve_connections
+
+
+def test_get_session():
+    close_session()
+    s = get_session()
+    assert get_session() is s
+
+    adapter = s.get_adapter("https://example.com/")
+    assert adapter._pool_maxsize == session.DEFAULT_POOL_MAXSIZE
+    assert adapter.max_retries.total == session.DEFAULT_RETRIES
+    assert s.get_adapter("http://example.com/") is adapter
+
+
+def test_configure_session():
+    close_session()
+    s = get_session()
+
+    # Same settings: the session is kept
+    configure_session(pool_maxsize=session.DEFAULT_POOL_MAXSIZE)
+    assert get_session() is s
+
+    configure_session(pool_maxsize=32, retries=5, backoff_factor=1)
+    s2 = get_session()
+    assert s2 is not s
+    adapter = s2.get_adapter("https://example.com/")
+    assert adapter._pool_maxsize == 32
+    assert adapter.max_retries.total == 5
+    assert adapter.max_retries.backoff_factor == 1
+
+    # Never shrinks the pool
+    reserve_connections(4)
+    assert get_session() is s2
+    reserve_connections(64)
+    assert get_session().get_adapter("https://example.com/")._pool_maxsize == 64
+
+    with pytest.raises(ValueError):
+        configure_session(pool_maxsize=0)
+    with pytest.raises(ValueError):
+        configure_session(retries=-1)
+    with pytest.raises(ValueError):
+        configure_session(pool_connections="10")
+
+    configure_session(pool_maxsize=session.DEFAULT_POOL_MAXSIZE,
+                      retries=session.DEFAULT_RETRIES,
+                      backoff_factor=session.DEFAULT_BACKOFF_FACTOR)
+
+
+def test_get_backoff(monkeypatch):
+    monkeypatch.setitem(session._settings, "backoff_factor", 1)
+    monkeypatch.setitem(session._settings, "resumes", 3)
+
+    assert 0.5 <= get_backoff(1) <= 1.5
+    assert 2 <= get_backoff(3) <= 6
+    assert get_backoff(4) is None
+
+    monkeypatch.setitem(session._settings, "resumes", 100)
+    assert get_backoff(100) <= session.MAX_BACKOFF * 1.5
+
+    # Only reset by a progress of the transfer
+    calls = []
+
+    def transfer():
+        calls.append(1)
+        raise ConnectionError("dropped")
+
+    monkeypatch.setitem(session._settings, "backoff_factor", 0)
+    monkeypatch.setitem(session._settings, "resumes", 2)
+    with pytest.raises(ConnectionError):
+        resume_on_error(transfer, lambda: 0)
+    assert len(calls) == 3
+
+
+def test_keep_alive(local_server):
+    local_server.add_file("file.bin", 1000)
+    url = local_server.url("file.bin")
+
+    close_session()
+    for _ in range(5):
+        get_session().head(url)
+        r = get_session().get(url)
+        assert len(r.content) == 1000
+
+    # All the requests went through the same connection
+    assert len(local_server.httpd.clients) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
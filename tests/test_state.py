@@ -0,0 +1,114 @@
+import os
+import pytest
+import sqlite3
+
+from dafter.fetcher import utils
+from dafter.fetcher import Dataset
+from dafter.fetcher.state import StateDB
+from dafter.fetcher.state import get_state
+from dafter.fetcher.state import COMPLETE
+from dafter.fetcher.state import INCOMPLETE
+
+
+def test_state_db(tmp_path):
+    state = StateDB(os.path.join(str(tmp_path), "state.db"))
+
+    assert state.get_status("mnist") is None
+    assert state.get_files("mnist") == {}
+
+    state.set_files("mnist", [("a.gz", COMPLETE, 10, None),
+                              ("b.gz", INCOMPLETE, None, None)])
+    assert state.get_status("mnist") == INCOMPLETE
+    files = state.get_files("mnist")
+    assert sorted(files) == ["a.gz", "b.gz"]
+    assert files["a.gz"]["size"] == 10
+
+    state.set_file("mnist", "b.gz", COMPLETE, 20, "abcd")
+    assert state.get_status("mnist") == COMPLETE
+    assert state.get_files("mnist")["b.gz"]["checksum"] == "abcd"
+
+    # Replaces all the previous records
+    state.set_files("mnist", [("c.gz", INCOMPLETE, 5, None)])
+    assert list(state.get_files("mnist")) == ["c.gz"]
+
+    state.delete_dataset("mnist")
+    assert state.get_status("mnist") is None
+
+    # Persisted on the disk
+    state.set_file("cifar", "c.tar", COMPLETE, 1)
+    state.close()
+    state = StateDB(os.path.join(str(tmp_path), "state.db"))
+    assert state.get_status("cifar") == COMPLETE
+    state.close()
+
+
+def test_migration(tmp_path):
+    path = os.path.join(str(tmp_path), "state.db")
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute(StateDB.SCHEMA)
+        conn.execute("INSERT INTO files VALUES ('mnist', 'a.gz', 'complete', "
+                     "10, NULL, 0)")
+    conn.close()
+
+    state = StateDB(path)
+    assert state.conn.execute("PRAGMA user_version").fetchone()[0] == \
+        len(StateDB.MIGRATIONS)
+    assert state.get_files("mnist")["a.gz"]["etag"] is None
+
+    # The validators are kept when the record is replaced without them
+    state.set_file("mnist", "a.gz", COMPLETE, 10, etag='"abc"')
+    state.set_files("mnist", [("a.gz", COMPLETE, 10, None)])
+    state.set_file("mnist", "a.gz", COMPLETE, 10)
+    assert state.get_files("mnist")["a.gz"]["etag"] == '"abc"'
+    state.close()
+
+    # Migrated once
+    state = StateDB(path)
+    assert state.get_files("mnist")["a.gz"]["etag"] == '"abc"'
+    state.close()
+
+
+def test_get_state(tmp_path):
+    assert get_state(os.path.join(str(tmp_path), "missing")) is None
+
+    state = get_state(str(tmp_path))
+    assert get_state(str(tmp_path)) is state
+    assert os.path.isfile(state.path)
+
+
+def test_download_records_state(local_server, tmp_path, monkeypatch):
+    local_server.add_file("a.bin", 1000)
+    local_server.add_file("b.bin", 2000)
+    urls = [{"url": local_server.url("a.bin")},
+            {"url": local_server.url("b.bin"), "bytes": 2000}]
+
+    d = Dataset("recorded", urls, str(tmp_path))
+    d.download(jobs=2)
+
+    state = get_state(str(tmp_path))
+    assert state.get_status("recorded") == COMPLETE
+    files = state.get_files("recorded")
+    assert files["a.bin"]["size"] == 1000
+    assert files["b.bin"]["size"] == 2000
+
+    # The status queries read the state database instead of the folders
+    monkeypatch.setattr(utils, "DATASETS_FOLDER", str(tmp_path))
+    monkeypatch.setattr(utils.os, "listdir", None)
+    assert utils.is_dataset_in_db("recorded") == True
+    assert utils.is_dataset_being_downloaded("recorded") == False
+
+    state.set_file("recorded", "b.bin", INCOMPLETE, 10)
+    assert utils.is_dataset_being_downloaded("recorded") == True
+    monkeypatch.undo()
+
+    # Folder removed by hand: back to the folders
+    monkeypatch.setattr(utils, "DATASETS_FOLDER", str(tmp_path))
+    for f in os.listdir(d.save_folder):
+        os.remove(os.path.join(d.save_folder, f))
+    os.rmdir(d.save_folder)
+    assert utils.is_dataset_in_db("recorded") == False
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
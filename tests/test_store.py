@@ -0,0 +1,69 @@
+import os
+import hashlib
+
+from dafter.fetcher import Dataset
+from dafter.fetcher.state import get_state
+from dafter.fetcher.store import store_file
+from dafter.fetcher.store import get_object_path
+from dafter.fetcher.store import collect_garbage
+
+
+def test_store_file(tmp_path):
+    save_path = str(tmp_path)
+    digest = hashlib.sha256(b"content").hexdigest()
+    paths = []
+    for name in ["a", "b"]:
+        os.makedirs(os.path.join(save_path, name))
+        path = os.path.join(save_path, name, "file.txt")
+        with open(path, "wb") as f:
+            f.write(b"content")
+        paths.append(path)
+
+    object_path = store_file(save_path, paths[0], digest)
+    assert object_path == get_object_path(save_path, digest)
+    assert object_path.endswith(os.path.join(digest[:2], digest[2:]))
+    # The second copy is replaced by a link to the object
+    assert store_file(save_path, paths[1], digest) == object_path
+    assert os.path.samefile(paths[0], paths[1])
+    assert os.stat(object_path).st_nlink == 3
+
+    os.remove(paths[0])
+    assert collect_garbage(save_path) == 0
+    os.remove(paths[1])
+    assert collect_garbage(save_path) == len(b"content")
+    assert not os.path.exists(object_path)
+
+
+def test_download_shared_file(local_server, tmp_path):
+    content = local_server.add_file("shared.bin", 20000)
+    url = local_server.url("shared.bin")
+    sha256 = hashlib.sha256(content).hexdigest()
+    save_path = str(tmp_path)
+
+    # The config of the first dataset gives an md5: the sha256 is computed
+    # along with it during the download
+    md5 = hashlib.md5(content).hexdigest()
+    first = Dataset("first", [{"url": url, "md5": md5}], save_path).download()
+    files = get_state(save_path).get_files(first.name)
+    assert files["shared.bin"]["checksum"] == "md5:" + md5
+    f_name = os.path.join(first.save_folder, "shared.bin")
+    assert os.path.samefile(f_name, get_object_path(save_path, sha256))
+    # Read-only: modifying it would modify it in every dataset
+    assert os.stat(f_name).st_mode & 0o777 == 0o444
+
+    # Not downloaded again
+    os.remove(os.path.join(local_server.folder, "shared.bin"))
+    second = Dataset("second", [{"url": url, "sha256": sha256}], save_path)
+    assert second._pending_files() == []
+    assert os.path.samefile(os.path.join(first.save_folder, "shared.bin"),
+                            os.path.join(second.save_folder, "shared.bin"))
+
+    # Without checksum, neither hashed nor stored, and writable
+    local_server.add_file("plain.bin", 1000)
+    third = Dataset("third", [{"url": local_server.url("plain.bin")}],
+                    save_path).download()
+    files = get_state(save_path).get_files(third.name)
+    assert files["plain.bin"]["checksum"] is None
+    f_name = os.path.join(third.save_folder, "plain.bin")
+    assert os.stat(f_name).st_nlink == 1
+    assert os.stat(f_name).st_mode & 0o200
@@ -0,0 +1,81 @@
+import io
+import pytest
+
+from dafter.fetcher.session import get_session
+from dafter.fetcher.session import close_session
+from dafter.fetcher.stream import copy_response
+from dafter.fetcher.stream import iter_response
+from dafter.fetcher.stream import ThrottledProgress
+
+
+class FakeBar:
+    def __init__(self):
+        self.updates = []
+        self.closed = False
+
+    def update(self, n):
+        self.updates.append(n)
+
+    def close(self):
+        self.closed = True
+
+
+def test_throttled_progress():
+    bar = FakeBar()
+    progress = ThrottledProgress(bar, interval=3600)
+    for _ in range(1000):
+        progress.update(10)
+    assert bar.updates == []
+    progress.close()
+    assert bar.updates == [10000]
+    assert bar.closed
+
+    bar = FakeBar()
+    progress = ThrottledProgress(bar, interval=0)
+    progress.update(10)
+    progress.update(5)
+    assert bar.updates == [10, 5]
+
+
+@pytest.mark.parametrize("use_readinto", [False, True])
+def test_copy_response(local_server, use_readinto):
+    content = local_server.add_file("file.bin", 3 * 1024 * 1024 + 17)
+    url = local_server.url("file.bin")
+    close_session()
+
+    for _ in range(2):
+        r = get_session().get(url, stream=True)
+        f = io.BytesIO()
+        bar = FakeBar()
+        written = copy_response(r, f, chunk_size=1024 * 1024,
+                                use_readinto=use_readinto,
+                                progress=ThrottledProgress(bar, interval=0))
+        assert written == len(content)
+        assert f.getvalue() == content
+        assert sum(bar.updates) == len(content)
+
+    # The connection is reused after the body has been read
+    assert len(local_server.httpd.clients) == 1
+
+    r = get_session().get(url, stream=True)
+    f = io.BytesIO()
+    written = copy_response(r, f, chunk_size=1000, use_readinto=use_readinto,
+                            limit=2500)
+    assert written == 2500
+    assert f.getvalue() == content[:2500]
+    r.close()
+
+
+def test_iter_response_reuses_buffer(local_server):
+    local_server.add_file("file.bin", 100000)
+    r = get_session().get(local_server.url("file.bin"), stream=True)
+
+    buffers = set()
+    for chunk in iter_response(r, chunk_size=4096, use_readinto=True):
+        assert isinstance(chunk, memoryview)
+        buffers.add(id(chunk.obj))
+    assert len(buffers) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
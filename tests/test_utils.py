@@ -8,6 +8,7 @@ from dafter.fetcher import is_valid_url
 from dafter.fetcher import is_valid_path
 from dafter.fetcher import delete_dataset
 from dafter.fetcher import normalize_name
+from dafter.fetcher import parse_size
 from dafter.fetcher import is_valid_config
 from dafter.fetcher import is_dataset_in_db
 from dafter.fetcher import normalize_filename
@@ -148,6 +149,55 @@ def test_is_valid_config():
     }
     assert is_valid_config(c8) == False
 
+    c9 = {
+        "name": "blahblah",
+        "urls": [
+            {
+                "url": "https://www.example.com/",
+                "sha256": "E3B0C44298FC1C149AFBF4C8996FB92427AE41E4649B934CA495991B7852B855",
+                "md5": "d41d8cd98f00b204e9800998ecf8427e"
+            }
+        ],
+        "type": "csv"
+    }
+    assert is_valid_config(c9) == True
+
+    c10 = {
+        "name": "blahblah",
+        "urls": [
+            {
+                "url": "https://www.example.com/",
+                "sha256": "d41d8cd98f00b204e9800998ecf8427e"
+            }
+        ],
+        "type": "csv"
+    }
+    assert is_valid_config(c10) == False
+
+    c11 = {
+        "name": "blahblah",
+        "urls": [
+            {
+                "url": "https://www.example.com/",
+                "md5": "not an hexadecimal digest!!!!!!!"
+            }
+        ],
+        "type": "csv"
+    }
+    assert is_valid_config(c11) == False
+
+    c12 = dict(c1, hooks=["pickle-arrays", {"name": "pickle-arrays", "file": "a.pkl"}])
+    assert is_valid_config(c12) == True
+    assert is_valid_config(dict(c1, hooks="pickle-arrays")) == False
+    assert is_valid_config(dict(c1, hooks=[{"file": "a.pkl"}])) == False
+
+    def with_mirrors(mirrors):
+        return dict(c1, urls=[{"url": "https://www.example.com/f",
+                               "mirrors": mirrors}])
+    assert is_valid_config(with_mirrors(["https://mirror.example.com/f"])) == True
+    assert is_valid_config(with_mirrors("https://mirror.example.com/f")) == False
+    assert is_valid_config(with_mirrors(["not an url"])) == False
+
     assert is_valid_config([]) == False
     assert is_valid_config(dict()) == False
     assert is_valid_config(1) == False
@@ -361,6 +411,28 @@ def test_is_dataset_in_db():
     assert is_dataset_in_db("è&ŷŝ%ùµ*9_`\"") == False
 
 
+def test_parse_size():
+
+    assert parse_size(1024) == 1024
+    assert parse_size("1024") == 1024
+    assert parse_size("512k") == 512 * 1024
+    assert parse_size("4M") == 4 * 1024 ** 2
+    assert parse_size("4MiB") == 4 * 1024 ** 2
+    assert parse_size("4mb") == 4 * 1024 ** 2
+    assert parse_size(" 1.5G ") == int(1.5 * 1024 ** 3)
+
+    with pytest.raises(ValueError):
+        parse_size("")
+    with pytest.raises(ValueError):
+        parse_size("4X")
+    with pytest.raises(ValueError):
+        parse_size("-4M")
+    with pytest.raises(ValueError):
+        parse_size(None)
+    with pytest.raises(ValueError):
+        parse_size(1.5)
+
+
 def test_check_internet_connection():
     # TODO
     pass